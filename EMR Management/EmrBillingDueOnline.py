@@ -8,8 +8,6 @@ import logging
 import unittest
 import json
 import xmlrunner
-import glob
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -18,6 +16,17 @@ from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import TimeoutException, ElementClickInterceptedException
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.wait_conditions import ReadyWait
+from utilities.select2 import Select2Picker
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.code_counter import CodeCounter
+from utilities.screenshot_service import ScreenshotService
+from utilities.network_capture import NetworkCapture
+from utilities.popup_interceptor import PopupInterceptor
+from utilities.http_client import HmisHttpClient
+from utilities.bill_capture import BillCapture
 import xml.etree.ElementTree as ET
 
 # Folder configuration
@@ -25,7 +34,11 @@ screenshot_dir = os.path.join("screenshots", "emr_billing_due_online")
 report_dir = os.path.join("reports", "emr_billing_due_online")
 patient_json_dir = os.path.join(report_dir, "patient_ids")
 bill_nos_dir = os.path.join(report_dir, "bill_nos")
-payment_code_file = os.path.join(report_dir, "payment_code_counter.txt")
+# Old per-workflow payment code counters; the shared counter continues after the highest of them
+payment_code_seed_files = [
+    os.path.join("reports", "emr_billing_due_online", "payment_code_counter.txt"),
+    os.path.join("reports", "emr_online_billing", "payment_code_counter.txt")
+]
 os.makedirs(screenshot_dir, exist_ok=True)
 os.makedirs(report_dir, exist_ok=True)
 os.makedirs(patient_json_dir, exist_ok=True)
@@ -150,22 +163,22 @@ class EMRBillingDueOnline(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        chrome_options.add_argument("--disable-logging")
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
+        cls.network = NetworkCapture(cls.driver)
+        cls.popups = PopupInterceptor(cls.driver)
+        cls.popups.install()
         cls.wait = WebDriverWait(cls.driver, 20)
         cls.short_wait = WebDriverWait(cls.driver, 10)  # Increased for modal handling
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.select2 = Select2Picker(cls.driver, cls.ready)
         cls.base_url = cls.config["base_url"]
+        cls.http = HmisHttpClient(cls.driver, cls.base_url)
+        cls.bill_capture = BillCapture(cls.driver, cls.popups, cls.network, cls.http)
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
 
@@ -173,8 +186,8 @@ class EMRBillingDueOnline(unittest.TestCase):
         """
         Test-level setup: Navigate to base URL, login, and initialize bill_no, bill_id, patient_id, and amounts.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
+        self.popups.reset()
         self.bill_no = None
         self.bill_id = None
         self.patient_id = None
@@ -182,73 +195,23 @@ class EMRBillingDueOnline(unittest.TestCase):
         self.full_amount = None
         self.paid_amount = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
-
     def __get_latest_emr_patient_id(self):
         """
-        Get the latest EMR patient ID from the patient_ids folders.
-        Returns the most recent patient ID based on file modification time.
+        Get the latest EMR patient ID from the artifact registry.
+        Returns the patient ID most recently recorded by any of the workflows below.
         """
         try:
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'reports'))
-            patient_id_dirs = [
-                os.path.join(base_dir, 'emr_billing_due', 'patient_ids'),
-                os.path.join(base_dir, 'emr_billing_due_online', 'patient_ids'),
-                os.path.join(base_dir, 'emr_billing_credit', 'patient_ids'),
-                os.path.join(base_dir, 'emr_combined', 'patient_ids'),
-                os.path.join(base_dir, 'emr_registration', 'patient_ids'),
-                os.path.join(base_dir, 'emr_registration_existing', 'patient_ids'),
-                os.path.join(base_dir, 'opd_billing', 'patient_ids'),
-                os.path.join(base_dir, 'opd_combined', 'patient_ids'),
-                os.path.join(base_dir, 'opd_registration', 'patient_ids')
-            ]
-            
-            # Log absolute paths for debugging
-            for dir_path in patient_id_dirs:
-                logging.info(f"Checking patient ID directory: {os.path.abspath(dir_path)}")
-            
-            # Check read permissions and directory existence
-            json_files = []
-            for dir_path in patient_id_dirs:
-                if not os.path.exists(dir_path):
-                    logging.warning(f"Directory does not exist: {dir_path}")
-                    continue
-                if not os.access(dir_path, os.R_OK):
-                    logging.error(f"No read permission for directory: {dir_path}")
-                    continue
-                files = glob.glob(os.path.join(dir_path, "*.json"))
-                json_files.extend(files)
-                logging.info(f"Found {len(files)} JSON files in {dir_path}")
-            
-            if not json_files:
-                logging.error("No patient ID files found in any patient_ids folder")
-                raise ValueError("No patient ID files found in any patient_ids folder (emr_billing_due, emr_billing_due_online, emr_billing_credit, emr_combined, emr_registration, emr_registration_existing, opd_billing, opd_combined, opd_registration)")
-            
-            # Find the most recent file
-            latest_file = max(json_files, key=os.path.getmtime)
-            logging.info(f"Latest patient ID file: {latest_file}")
-            
-            # Extract patient ID from filename (e.g., "2154.json" -> "2154")
-            filename = os.path.basename(latest_file)
-            patient_id = os.path.splitext(filename)[0]
-            
-            logging.info(f"Latest patient ID found: {patient_id}")
-            return patient_id
-            
+            return ArtifactRegistry.shared().latest_patient_id([
+                "emr_billing_due",
+                "emr_billing_due_online",
+                "emr_billing_credit",
+                "emr_combined",
+                "emr_registration",
+                "emr_registration_existing",
+                "opd_billing",
+                "opd_combined",
+                "opd_registration"
+            ])
         except Exception as e:
             logging.error(f"Error getting latest patient ID: {str(e)}")
             self.__take_screenshot("PATIENT_ID_RETRIEVAL_ERROR")
@@ -256,34 +219,12 @@ class EMRBillingDueOnline(unittest.TestCase):
 
     def __get_next_payment_code(self):
         """
-        Get the next payment code by incrementing the counter stored in a file.
-        Starts from 000000001 and increments with each call.
+        Get the next payment code from the shared payment code counter.
+        Codes are unique across parallel workers, formatted as 9 digits (e.g. 000000001).
         """
-        try:
-            # Read the current counter value from file or initialize to 0
-            if os.path.exists(payment_code_file):
-                with open(payment_code_file, 'r') as f:
-                    counter = int(f.read().strip())
-            else:
-                counter = 0
-            
-            # Increment the counter
-            counter += 1
-            
-            # Save the new counter value
-            with open(payment_code_file, 'w') as f:
-                f.write(str(counter))
-            
-            # Format as 9-digit string with leading zeros
-            payment_code = f"{counter:09d}"
-            logging.info(f"Generated payment code: {payment_code}")
-            return payment_code
-        except Exception as e:
-            logging.error(f"Error generating payment code: {str(e)}")
-            # Fallback to timestamp-based code
-            timestamp_code = f"{int(time.time() % 1000000000):09d}"
-            logging.info(f"Using fallback payment code: {timestamp_code}")
-            return timestamp_code
+        payment_code = f"{CodeCounter.shared('payment_code', seed_files=payment_code_seed_files).next():09d}"
+        logging.info(f"Generated payment code: {payment_code}")
+        return payment_code
 
     def test_emr_billing_due_online(self):
         """
@@ -298,7 +239,7 @@ class EMRBillingDueOnline(unittest.TestCase):
         """
         try:
             # Navigate directly to EMR Billing
-            self.driver.get("http://lunivacare.ddns.net:8080/himsnew/bill/createBill?bt=Emergency")
+            self.driver.get(f"{self.base_url}bill/createBill?bt=Emergency")
             self.wait.until(EC.presence_of_element_located((By.ID, "patientId")))
             logging.info("Navigated to EMR Billing page")
             self.__take_screenshot("EMR_BILLING_PAGE")
@@ -372,6 +313,14 @@ class EMRBillingDueOnline(unittest.TestCase):
         tests = ["Complete Blood Cell Count", "ABO & Rh Factor"]
         
         for test_name in tests:
+            # Fast path through the select2 data source; the typed search below is the fallback
+            if self.select2.pick((By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"), test_name, ui_fallback=False):
+                self.__take_screenshot(f"{test_name.replace(' ', '_')}_SELECTED")
+                # The pick fires the same select events as the typed search, so the modal follows too
+                if test_name == "ABO & Rh Factor":
+                    self.__handle_performed_by_select_modal()
+                continue
+
             max_attempts = 3
             attempt = 1
             while attempt <= max_attempts:
@@ -446,95 +395,102 @@ class EMRBillingDueOnline(unittest.TestCase):
 
                 # Handle performedByModal for non-pathology tests
                 if test_name == "ABO & Rh Factor" and attempt <= max_attempts:
-                    max_modal_attempts = 3
-                    modal_attempt = 1
-                    while modal_attempt <= max_modal_attempts:
-                        try:
-                            modal = self.short_wait.until(EC.visibility_of_element_located(
-                                (By.ID, "performedByModal")))
-                            logging.info(f"Performed By modal detected (modal attempt {modal_attempt})")
-                            self.__take_screenshot(f"PERFORMED_BY_MODAL_{modal_attempt}")
+                    self.__handle_performed_by_select_modal()
+
+    def __handle_performed_by_select_modal(self):
+        """
+        Confirm the default performer (SELF) in the performedByModal shown after a
+        non-pathology test is selected.
+        """
+        max_modal_attempts = 3
+        modal_attempt = 1
+        while modal_attempt <= max_modal_attempts:
+            try:
+                modal = self.short_wait.until(EC.visibility_of_element_located(
+                    (By.ID, "performedByModal")))
+                logging.info(f"Performed By modal detected (modal attempt {modal_attempt})")
+                self.__take_screenshot(f"PERFORMED_BY_MODAL_{modal_attempt}")
 
-                            # Log modal HTML for debugging
-                            modal_html = modal.get_attribute('outerHTML')
-                            logging.debug(f"Modal HTML: {modal_html[:500]}...")  # Truncate for brevity
+                # Log modal HTML for debugging
+                modal_html = modal.get_attribute('outerHTML')
+                logging.debug(f"Modal HTML: {modal_html[:500]}...")  # Truncate for brevity
 
-                            # Verify default selection is SELF
-                            select_element = self.short_wait.until(EC.presence_of_element_located(
-                                (By.XPATH, "//span[@class='select2-chosen' and contains(text(), 'SELF')]")))
-                            logging.info("Default selection 'SELF' confirmed")
+                # Verify default selection is SELF
+                select_element = self.short_wait.until(EC.presence_of_element_located(
+                    (By.XPATH, "//span[@class='select2-chosen' and contains(text(), 'SELF')]")))
+                logging.info("Default selection 'SELF' confirmed")
 
-                            # Try multiple selectors for the Select button
-                            select_button_xpaths = [
-                                "//button[@type='submit' and contains(@class, 'antoclose')]",
-                                "//button[@type='submit' and contains(text(), 'Select')]",
-                                "//button[contains(@class, 'btn-primary') and contains(text(), 'Select')]"
-                            ]
-                            select_btn = None
-                            for xpath in select_button_xpaths:
-                                try:
-                                    select_btn = self.short_wait.until(EC.element_to_be_clickable((By.XPATH, xpath)))
-                                    logging.info(f"Found Select button using XPath: {xpath}")
-                                    break
-                                except TimeoutException:
-                                    logging.debug(f"Select button XPath failed: {xpath}")
-                                    continue
+                # Try multiple selectors for the Select button
+                select_button_xpaths = [
+                    "//button[@type='submit' and contains(@class, 'antoclose')]",
+                    "//button[@type='submit' and contains(text(), 'Select')]",
+                    "//button[contains(@class, 'btn-primary') and contains(text(), 'Select')]"
+                ]
+                select_btn = None
+                for xpath in select_button_xpaths:
+                    try:
+                        select_btn = self.short_wait.until(EC.element_to_be_clickable((By.XPATH, xpath)))
+                        logging.info(f"Found Select button using XPath: {xpath}")
+                        break
+                    except TimeoutException:
+                        logging.debug(f"Select button XPath failed: {xpath}")
+                        continue
 
-                            if select_btn:
-                                try:
-                                    select_btn.click()
-                                    logging.info(f"Clicked Select button in performedByModal (modal attempt {modal_attempt})")
-                                    self.__take_screenshot(f"PERFORMED_BY_MODAL_SUBMITTED_{modal_attempt}")
-                                except ElementClickInterceptedException:
-                                    logging.warning("Select button click intercepted, trying JavaScript click")
-                                    self.driver.execute_script("arguments[0].click();", select_btn)
-                                    logging.info(f"JavaScript clicked Select button (modal attempt {modal_attempt})")
-                                    self.__take_screenshot(f"PERFORMED_BY_MODAL_JS_CLICK_{modal_attempt}")
-                            else:
-                                logging.warning(f"Select button not found after trying all XPaths (modal attempt {modal_attempt})")
-                                self.__take_screenshot(f"SELECT_BUTTON_NOT_FOUND_{modal_attempt}")
+                if select_btn:
+                    try:
+                        select_btn.click()
+                        logging.info(f"Clicked Select button in performedByModal (modal attempt {modal_attempt})")
+                        self.__take_screenshot(f"PERFORMED_BY_MODAL_SUBMITTED_{modal_attempt}")
+                    except ElementClickInterceptedException:
+                        logging.warning("Select button click intercepted, trying JavaScript click")
+                        self.driver.execute_script("arguments[0].click();", select_btn)
+                        logging.info(f"JavaScript clicked Select button (modal attempt {modal_attempt})")
+                        self.__take_screenshot(f"PERFORMED_BY_MODAL_JS_CLICK_{modal_attempt}")
+                else:
+                    logging.warning(f"Select button not found after trying all XPaths (modal attempt {modal_attempt})")
+                    self.__take_screenshot(f"SELECT_BUTTON_NOT_FOUND_{modal_attempt}")
 
-                            # Wait for modal to close
-                            self.short_wait.until(EC.invisibility_of_element_located((By.ID, "performedByModal")))
-                            logging.info("Performed By modal closed")
-                            break
+                # Wait for modal to close
+                self.short_wait.until(EC.invisibility_of_element_located((By.ID, "performedByModal")))
+                logging.info("Performed By modal closed")
+                break
 
 
-                        except TimeoutException as e:
-                            logging.warning(f"Performed By modal handling failed on modal attempt {modal_attempt}: {str(e)}")
-                            self.__take_screenshot(f"NO_PERFORMED_BY_MODAL_{modal_attempt}")
+            except TimeoutException as e:
+                logging.warning(f"Performed By modal handling failed on modal attempt {modal_attempt}: {str(e)}")
+                self.__take_screenshot(f"NO_PERFORMED_BY_MODAL_{modal_attempt}")
 
-                            # Try to find and click a Cancel/Close button as fallback
-                            close_button_xpaths = [
-                                "//button[contains(@class, 'close')]",
-                                "//button[contains(text(), 'Close') or contains(text(), 'Cancel')]"
-                            ]
-                            close_btn = None
-                            for xpath in close_button_xpaths:
-                                try:
-                                    close_btn = self.short_wait.until(EC.element_to_be_clickable((By.XPATH, xpath)))
-                                    logging.info(f"Found Close button using XPath: {xpath}")
-                                    break
-                                except TimeoutException:
-                                    logging.debug(f"Close button XPath failed: {xpath}")
-                                    continue
+                # Try to find and click a Cancel/Close button as fallback
+                close_button_xpaths = [
+                    "//button[contains(@class, 'close')]",
+                    "//button[contains(text(), 'Close') or contains(text(), 'Cancel')]"
+                ]
+                close_btn = None
+                for xpath in close_button_xpaths:
+                    try:
+                        close_btn = self.short_wait.until(EC.element_to_be_clickable((By.XPATH, xpath)))
+                        logging.info(f"Found Close button using XPath: {xpath}")
+                        break
+                    except TimeoutException:
+                        logging.debug(f"Close button XPath failed: {xpath}")
+                        continue
 
-                            if close_btn:
-                                try:
-                                    close_btn.click()
-                                    logging.info(f"Clicked Close button in performedByModal (modal attempt {modal_attempt})")
-                                    self.__take_screenshot(f"PERFORMED_BY_MODAL_CLOSED_{modal_attempt}")
-                                    self.short_wait.until(EC.invisibility_of_element_located((By.ID, "performedByModal")))
-                                    logging.info("Performed By modal closed via Close button")
-                                    break
-                                except Exception as e:
-                                    logging.warning(f"Failed to click Close button: {str(e)}")
-                                    self.__take_screenshot(f"PERFORMED_BY_MODAL_CLOSE_ERROR_{modal_attempt}")
+                if close_btn:
+                    try:
+                        close_btn.click()
+                        logging.info(f"Clicked Close button in performedByModal (modal attempt {modal_attempt})")
+                        self.__take_screenshot(f"PERFORMED_BY_MODAL_CLOSED_{modal_attempt}")
+                        self.short_wait.until(EC.invisibility_of_element_located((By.ID, "performedByModal")))
+                        logging.info("Performed By modal closed via Close button")
+                        break
+                    except Exception as e:
+                        logging.warning(f"Failed to click Close button: {str(e)}")
+                        self.__take_screenshot(f"PERFORMED_BY_MODAL_CLOSE_ERROR_{modal_attempt}")
 
-                            modal_attempt += 1
-                            if modal_attempt > max_modal_attempts:
-                                logging.error(f"Failed to handle performedByModal after {max_modal_attempts} attempts")
-                                raise TimeoutException(f"Failed to handle performedByModal after {max_modal_attempts} attempts")
+                modal_attempt += 1
+                if modal_attempt > max_modal_attempts:
+                    logging.error(f"Failed to handle performedByModal after {max_modal_attempts} attempts")
+                    raise TimeoutException(f"Failed to handle performedByModal after {max_modal_attempts} attempts")
 
     def __handle_performed_by_modal(self):
         """
@@ -649,6 +605,7 @@ class EMRBillingDueOnline(unittest.TestCase):
                 payment_code_field.clear()
                 payment_code_field.send_keys(payment_code)
                 logging.info(f"Entered payment code: {payment_code}")
+                ArtifactRegistry.shared().record("payment_code", payment_code, os.path.basename(report_dir), patient_id=self.patient_id)
                 self.__take_screenshot("PAYMENT_CODE_ENTERED")
             else:
                 logging.warning("Could not extract grand total amount")
@@ -749,6 +706,8 @@ class EMRBillingDueOnline(unittest.TestCase):
                 submit_btn
             )
             time.sleep(0.5)
+            # Only responses to this save count; earlier lookups can carry other patients' ids
+            self.network.mark()
             try:
                 submit_btn.click()
                 logging.info("Clicked Submit button to complete the billing process")
@@ -799,7 +758,16 @@ class EMRBillingDueOnline(unittest.TestCase):
         """
         Capture Bill No from new window and Bill ID from main page by hovering over Print Bill button.
         """
-        wait_for_windows = WebDriverWait(self.driver, 20)
+        # Bill No and Bill ID from the intercepted popup, the createBill response or the invoice page
+        # over HTTP, whichever is switched on; otherwise from the invoice window below
+        bill = self.bill_capture.capture(original_window, self.patient_id)
+        if bill:
+            self.bill_no = bill["bill_no"]
+            self.bill_id = bill["bill_id"]
+            return
+
+        # No window will open while popups are intercepted, or if BillCapture already waited for it
+        wait_for_windows = WebDriverWait(self.driver, self.bill_capture.fallback_window_timeout(20))
         try:
             # Wait for new window or tab to open
             wait_for_windows.until(lambda d: len(d.window_handles) > 1)
@@ -1005,21 +973,16 @@ class EMRBillingDueOnline(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
 
     def tearDown(self):
         """
-        Test-level teardown: Save bill info with amounts to JSON file if captured.
+        Test-level teardown: Save bill info with amounts to the artifact journal if captured.
         """
+        self.screenshots.end_test(self)
         if self.bill_no:
-            bill_json_file = os.path.join(bill_nos_dir, f"{self.bill_no}.json")
             bill_data = {
                 "bill_no": self.bill_no,
                 "bill_id": self.bill_id if hasattr(self, 'bill_id') and self.bill_id else "unknown",
@@ -1030,11 +993,11 @@ class EMRBillingDueOnline(unittest.TestCase):
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
             try:
-                with open(bill_json_file, "w") as f:
-                    json.dump(bill_data, f, indent=4)
-                logging.info(f"Bill information with amounts saved to {bill_json_file}")
+                ArtifactRegistry.shared().record("bill_no", bill_data["bill_no"], os.path.basename(report_dir), **bill_data)
+                ArtifactJournal.shared().append("bill_no", os.path.basename(report_dir), **bill_data)
+                logging.info("Bill information with amounts saved to the artifact journal")
             except Exception as e:
-                logging.error(f"Error saving bill information to {bill_json_file}: {str(e)}")
+                logging.error(f"Error saving bill information to the artifact journal: {str(e)}")
                 self.__take_screenshot("BILL_JSON_SAVE_ERROR")
 
     @classmethod
@@ -1042,6 +1005,9 @@ class EMRBillingDueOnline(unittest.TestCase):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
+        cls.popups.uninstall()
+        cls.http.close()
         logging.info("Cleaning up browser windows...")
         try:
             time.sleep(2)
@@ -1073,6 +1039,7 @@ class EMRBillingDueOnline(unittest.TestCase):
             except Exception:
                 pass
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -9,7 +9,6 @@ import unittest
 import json
 import xmlrunner
 import glob
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -17,12 +16,27 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import TimeoutException, ElementClickInterceptedException
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.command_stats import CommandStats
+from utilities.wait_conditions import ReadyWait
+from utilities.table_snapshot import TableSnapshot
+from utilities.bill_list_pager import BillListPager
+from utilities.collection_checkpoint import CollectionCheckpoint
+from utilities.bill_watermark import BillWatermark
+from utilities.bill_shards import BillShard
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
 import xml.etree.ElementTree as ET
 
 # Folder configuration
 screenshot_dir = os.path.join("screenshots", "emr_collect_credit")
 report_dir = os.path.join("reports", "emr_collect_credit")
+command_stats_dir = os.path.join(report_dir, "command_stats")
+# WebDriver round-trips one test may send before it fails (HMIS_COMMAND_BUDGET overrides)
+command_budget = 20000
 collected_bills_dir = os.path.join(report_dir, "collected_bills")
+batch_checkpoint_file = os.path.join(report_dir, "batch_checkpoint.json")
 os.makedirs(screenshot_dir, exist_ok=True)
 os.makedirs(report_dir, exist_ok=True)
 os.makedirs(collected_bills_dir, exist_ok=True)
@@ -33,144 +47,186 @@ class EMRCollectCreditBills(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        chrome_options.add_argument("--disable-logging")
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
         cls.wait = WebDriverWait(cls.driver, 20)
         cls.short_wait = WebDriverWait(cls.driver, 10)  # Increased for modal handling
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.table_snapshot = TableSnapshot(cls.driver)
         cls.base_url = cls.config["base_url"]
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
 
     def setUp(self):
         """
-        Test-level setup: Navigate to base URL, login.
+        Test-level setup: Navigate to base URL, login, start counting WebDriver commands and load the bill watermark.
         """
-        self.driver.get(self.base_url)
-        self.__login()
-
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
+        self.session_pool.ensure_logged_in(self.driver)
+        self.command_stats = CommandStats(self.driver, self.id()).attach()
+        # In a sharded run this process collects one date range and claims each bill first
+        self.shard = BillShard.current()
+        self.watermark = BillWatermark("Emergency", "credit", self.base_url, frozen=self.shard is not None)
 
     def test_collect_emr_credit_bills(self):
         """
         Test method: Navigate to EMR bill list, find credit bills, and collect them.
         """
         logging.info("Starting EMR Credit Bill Collection...")
-        self.__collect_emr_credit_bills()
+        if CollectionCheckpoint.batch_enabled():
+            self.__collect_emr_credit_bills_batch()
+        else:
+            self.__collect_emr_credit_bills()
 
-    def __collect_emr_credit_bills(self):
+    def __open_emr_bill_list(self):
         """
-        Collect EMR credit bills from the bill list.
+        Open the EMR bill list and filter it to the configured date range.
         """
+        # Navigate to the specific EMR bill list URL
+        self.driver.get(f"{self.base_url}bill/bill_list?list=Emergency")
+        self.ready.ajax_idle()  # Wait for page and bill table data to load
+        logging.info("Navigated to EMR Bill List")
+        self.__take_screenshot("EMR_BILL_LIST")
+        
+        # Click on English date toggle
+        try:
+            english_toggle = self.wait.until(EC.element_to_be_clickable((By.ID, "show_nepaliCheck")))
+            if not english_toggle.is_selected():
+                # Use JavaScript click to avoid interception issues
+                self.driver.execute_script("arguments[0].click();", english_toggle)
+                logging.info("Clicked on English date toggle")
+                self.__take_screenshot("ENGLISH_TOGGLE_CLICKED")
+            else:
+                logging.info("English date toggle already selected")
+        except Exception as e:
+            logging.error(f"Error clicking English date toggle: {str(e)}")
+            self.__take_screenshot("ENGLISH_TOGGLE_ERROR")
+        
+        # Wait for English date fields to appear
+        self.ready.ajax_idle(required=False)
+        
+        # === DATE FILTERING SECTION ===
+        # COMMENT OUT THIS SECTION IF YOU WANT TO USE THE DEFAULT LOADING DATE OF THE SOFTWARE
+        # UNCOMMENT THIS SECTION IF YOU WANT TO PASS DATES MANUALLY
+        # ------------------------------------------------------------------
+        # For manual date entry, uncomment the following lines:
+        # Dates continue from the credit watermark; the defaults apply on the first run and with --full-rescan
+        from_date, to_date = self.watermark.date_range("2025-09-15", "2025-09-18")  # Default dates - modify as needed
         try:
-            # Navigate to the specific EMR bill list URL
-            self.driver.get("http://lunivacare.ddns.net:8080/himsnew/bill/bill_list?list=Emergency")
-            time.sleep(3)  # Wait for page to load
-            logging.info("Navigated to EMR Bill List")
-            self.__take_screenshot("EMR_BILL_LIST")
+            # Try the different selectors for the date field in a single wait
+            from_date_field, _ = self.ready.first_of(
+                (By.ID, "englishFrom"), (By.CSS_SELECTOR, "input#englishFrom"), (By.NAME, "fromDate"), visible=False)
             
-            # Click on English date toggle
-            try:
-                english_toggle = self.wait.until(EC.element_to_be_clickable((By.ID, "show_nepaliCheck")))
-                if not english_toggle.is_selected():
-                    # Use JavaScript click to avoid interception issues
-                    self.driver.execute_script("arguments[0].click();", english_toggle)
-                    logging.info("Clicked on English date toggle")
-                    self.__take_screenshot("ENGLISH_TOGGLE_CLICKED")
-                else:
-                    logging.info("English date toggle already selected")
-            except Exception as e:
-                logging.error(f"Error clicking English date toggle: {str(e)}")
-                self.__take_screenshot("ENGLISH_TOGGLE_ERROR")
+            from_date_field.clear()
+            from_date_field.send_keys(from_date)
+            logging.info(f"Entered From Date: {from_date}")
+            self.__take_screenshot("FROM_DATE_ENTERED")
             
-            # Wait for English date fields to appear
-            time.sleep(2)
+            # Try the different selectors for To date field in a single lookup
+            to_date_field, _ = self.ready.first_of(
+                (By.ID, "englishTo"), (By.CSS_SELECTOR, "input#englishTo"), (By.NAME, "toDate"), timeout=0, visible=False)
             
-            # === DATE FILTERING SECTION ===
-            # COMMENT OUT THIS SECTION IF YOU WANT TO USE THE DEFAULT LOADING DATE OF THE SOFTWARE
-            # UNCOMMENT THIS SECTION IF YOU WANT TO PASS DATES MANUALLY
-            # ------------------------------------------------------------------
-            # For manual date entry, uncomment the following lines:
+            to_date_field.clear()
+            to_date_field.send_keys(to_date)
+            logging.info(f"Entered To Date: {to_date}")
+            self.__take_screenshot("TO_DATE_ENTERED")
+            
+            # Click on Get Bills button
+            get_button = self.driver.find_element(By.ID, "btnGetMiscPayment")
+            # Use JavaScript click to avoid interception issues
+            self.driver.execute_script("arguments[0].click();", get_button)
+            logging.info("Clicked on Get Bills button")
+            self.__take_screenshot("GET_BILLS_BUTTON_CLICKED")
+            
+            # Wait for page to reload with filtered data
+            self.ready.ajax_idle(required=False)
+        except Exception as e:
+            logging.error(f"Error in date filtering: {str(e)}")
+            self.__take_screenshot("DATE_FILTERING_ERROR")
+        # ------------------------------------------------------------------
+        # === END DATE FILTERING SECTION ===
+
+    def __collect_emr_credit_bills_batch(self):
+        """
+        Batch mode: snapshot every credit bill in the list first, then open each bill's view
+        page directly and collect it, checkpointing progress so an interrupted batch resumes.
+        """
+        checkpoint = CollectionCheckpoint(self.shard.checkpoint_file if self.shard else batch_checkpoint_file)
+        if checkpoint.resumable():
+            logging.info(f"Resuming batch with {len(checkpoint.pending())} credit bills left")
+        else:
+            self.__open_emr_bill_list()
+            checkpoint.start(self.__snapshot_credit_bills())
+        
+        for bill in checkpoint.pending():
+            bill_no, bill_id = bill["bill_no"], bill["bill_id"]
+            view_url = bill["view_href"] or (f"{self.base_url}bill/view?billId={bill_id}" if bill_id != "unknown" else None)
+            if not view_url:
+                logging.warning(f"No View link or bill ID for credit bill {bill_no}, skipping")
+                checkpoint.mark_failed(bill, "No View link or bill ID")
+                continue
+            if self.shard and not self.shard.claim(checkpoint.bill_key(bill)):
+                logging.info(f"Credit bill {bill_no} was claimed by another shard, skipping")
+                checkpoint.mark_done(bill, skipped="claimed by another shard")
+                continue
             try:
-                # Try different selectors for date fields
-                try:
-                    from_date_field = self.wait.until(EC.presence_of_element_located((By.ID, "englishFrom")))
-                except:
-                    try:
-                        from_date_field = self.wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "input#englishFrom")))
-                    except:
-                        # If ID doesn't work, try by name
-                        from_date_field = self.wait.until(EC.presence_of_element_located((By.NAME, "fromDate")))
-                
-                from_date_field.clear()
-                from_date_field.send_keys("2025-09-15")  # From date - modify as needed
-                logging.info("Entered From Date: 2025-09-15")
-                self.__take_screenshot("FROM_DATE_ENTERED")
-                
-                # Try different selectors for To date field
-                try:
-                    to_date_field = self.driver.find_element(By.ID, "englishTo")
-                except:
-                    try:
-                        to_date_field = self.driver.find_element(By.CSS_SELECTOR, "input#englishTo")
-                    except:
-                        # If ID doesn't work, try by name
-                        to_date_field = self.driver.find_element(By.NAME, "toDate")
-                
-                to_date_field.clear()
-                to_date_field.send_keys("2025-09-18")  # To date - modify as needed
-                logging.info("Entered To Date: 2025-09-18")
-                self.__take_screenshot("TO_DATE_ENTERED")
-                
-                # Click on Get Bills button
-                get_button = self.driver.find_element(By.ID, "btnGetMiscPayment")
-                # Use JavaScript click to avoid interception issues
-                self.driver.execute_script("arguments[0].click();", get_button)
-                logging.info("Clicked on Get Bills button")
-                self.__take_screenshot("GET_BILLS_BUTTON_CLICKED")
-                
-                # Wait for page to reload with filtered data
-                time.sleep(5)
+                self.driver.get(view_url)
+                logging.info(f"Opened credit bill {bill_no} (ID: {bill_id})")
+                collected = self.__handle_bill_collection_in_same_window(None, bill["amount"], bill_no, bill_id, bill["patient_id"])
             except Exception as e:
-                logging.error(f"Error in date filtering: {str(e)}")
-                self.__take_screenshot("DATE_FILTERING_ERROR")
-            # ------------------------------------------------------------------
-            # === END DATE FILTERING SECTION ===
+                logging.error(f"Error collecting credit bill {bill_no}: {str(e)}")
+                self.__take_screenshot(f"BATCH_COLLECTION_ERROR_{bill_no}")
+                checkpoint.mark_failed(bill, e)
+                if self.shard:
+                    self.shard.record(bill, False, error=str(e)[:500])
+                continue
+            if self.shard:
+                self.shard.record(bill, collected)
+            if collected:
+                checkpoint.mark_done(bill, amount=bill["amount"])
+            else:
+                checkpoint.mark_failed(bill, "Bill was not submitted")
+        
+        # Bills that failed but have attempts left stay pending for the next run
+        if not checkpoint.pending():
+            checkpoint.finish()
+
+    def __snapshot_credit_bills(self):
+        """
+        Read every page of the (already open) bill list and return the credit bills as dicts.
+        """
+        bills = []
+        scanned = []
+        pager = BillListPager(self.driver, self.ready)
+        for page_number in pager.pages(f"{self.base_url}bill/bill_list?list=Emergency"):
+            bill_table = self.wait.until(EC.presence_of_element_located((By.XPATH, "//table[contains(@class, 'table')]")))
+            new_bills = [bill for bill in self.table_snapshot.bill_rows(bill_table) if self.watermark.is_new(bill.bill_id)]
+            scanned.extend((bill.bill_id, bill.bill_date) for bill in new_bills)
+            page_bills = [bill.to_dict() for bill in new_bills if bill.status == "Credit"]
+            logging.info(f"Found {len(page_bills)} new credit bills on page {page_number}")
+            bills.extend(page_bills)
+        self.__take_screenshot("CREDIT_BILLS_SNAPSHOT")
+        self.watermark.advance(scanned, [(bill["bill_id"], bill["bill_date"]) for bill in bills])
+        return bills
+
+    def __collect_emr_credit_bills(self):
+        """
+        Collect EMR credit bills from the bill list.
+        """
+        try:
+            self.__open_emr_bill_list()
             
-            # Process the bill table
-            page_number = 1
+            # Process the bill table, one DataTables page at a time at the largest page length
             total_credit_bills_collected = 0
+            scanned, still_open = [], []
+            pager = BillListPager(self.driver, self.ready)
             
-            while True:
-                # If we're not on page 1, navigate to the specific page
+            for page_number in pager.pages(f"{self.base_url}bill/bill_list?list=Emergency"):
                 if page_number > 1:
-                    self.driver.get(f"http://lunivacare.ddns.net:8080/himsnew/bill/bill_list?list=Emergency&page={page_number}")
-                    time.sleep(3)  # Wait for page to load
-                    logging.info(f"Navigate to page {page_number}")
+                    logging.info(f"Moved to page {page_number}")
                     self.__take_screenshot(f"EMR_BILL_LIST_PAGE_{page_number}")
                 
                 # Look for bill table
@@ -179,98 +235,58 @@ class EMRCollectCreditBills(unittest.TestCase):
                     logging.info("Bill table found")
                     self.__take_screenshot(f"BILL_TABLE_FOUND_PAGE_{page_number}")
                     
-                    # Find all rows in the table body - more inclusive selector
-                    rows = bill_table.find_elements(By.XPATH, ".//tbody/tr")
-                    logging.info(f"Found {len(rows)} bill rows on page {page_number}")
+                    # Read the whole table (cells, row attributes, View links) in one round-trip
+                    # Bills at or below the watermark were settled in an earlier run
+                    bill_rows = [bill for bill in self.table_snapshot.bill_rows(bill_table) if self.watermark.is_new(bill.bill_id)]
+                    logging.info(f"Found {len(bill_rows)} new bill rows on page {page_number}")
+                    scanned.extend((bill.bill_id, bill.bill_date) for bill in bill_rows)
+                    still_open.extend((bill.bill_id, bill.bill_date) for bill in bill_rows if bill.status == "Credit")
                     
                     # Process each row to find credit bills
                     credit_bills_found_on_page = 0
-                    for i, row in enumerate(rows):
+                    for bill in bill_rows:
+                        i = bill.index
                         try:
-                            # Get the row class to differentiate odd/even if available
-                            row_class = row.get_attribute("class") or "no-class"
-                            logging.info(f"Processing row {i+1} with class '{row_class}' on page {page_number}")
+                            logging.info(f"Processing row {i+1} with class '{bill.row.cls or 'no-class'}' on page {page_number}")
+                            logging.info(f"Row {i+1} status: '{bill.status}'")
                             
-                            # Get cells in the row
-                            cells = row.find_elements(By.XPATH, ".//td")
-                            if len(cells) >= 8:  # Ensure we have enough cells
-                                # Check if this is a credit bill (look for "Credit" in status column - 8th column)
-                                status_cell = cells[7]  # 8th column is status
-                                status_text = status_cell.text.strip()
-                                
-                                logging.info(f"Row {i+1} status: '{status_text}'")
+                            # Check for "Credit" status (exact match)
+                            if bill.status == "Credit":
+                                credit_bills_found_on_page += 1
+                                bill_no, bill_id, credit_amount, patient_id = bill.bill_no, bill.bill_id, bill.amount, bill.patient_id
+                                logging.info(f"Found credit bill {bill_no} (ID: {bill_id}) with credit amount {credit_amount} for patient {patient_id} in row {i+1} on page {page_number}")
+                                self.__take_screenshot(f"CREDIT_BILL_FOUND_{bill_no}_PAGE_{page_number}")
                                 
-                                # Check for "Credit" status (exact match)
-                                if status_text == "Credit":
-                                    credit_bills_found_on_page += 1
-                                    bill_no = cells[0].text.strip()  # 1st column is bill number
-                                    credit_amount = cells[6].text.strip()  # 7th column is credit amount
-                                    patient_id = cells[1].text.strip()  # 2nd column is patient ID
-                                    # Try to get bill ID from the row (9th column or from data attributes)
-                                    bill_id = "unknown"
-                                    if len(cells) > 8:
-                                        bill_id = cells[8].text.strip()  # 9th column is bill ID
+                                # View button in this row
+                                view_btn = bill.view
+                                if view_btn is not None:
+                                    logging.info(f"View button found for credit bill {bill_no}")
                                     
-                                    # If we couldn't get bill ID from cells, try to extract from row attributes
-                                    if bill_id == "unknown" or not bill_id:
-                                        try:
-                                            # Try to get data-bill-id attribute from the row
-                                            bill_id_attr = row.get_attribute("data-bill-id")
-                                            if bill_id_attr:
-                                                bill_id = bill_id_attr
-                                                logging.info(f"Extracted bill ID {bill_id} from row data attribute")
-                                        except Exception as e:
-                                            logging.warning(f"Could not extract bill ID from row attributes: {str(e)}")
+                                    # Store original URL
+                                    original_url = self.driver.current_url
                                     
-                                    logging.info(f"Found credit bill {bill_no} (ID: {bill_id}) with credit amount {credit_amount} for patient {patient_id} in row {i+1} on page {page_number}")
-                                    self.__take_screenshot(f"CREDIT_BILL_FOUND_{bill_no}_PAGE_{page_number}")
-                                    
-                                    # Look for View button in this row
-                                    view_buttons = row.find_elements(By.XPATH, ".//a[contains(@class, 'btn') and contains(text(), 'View')]")
-                                    if view_buttons:
-                                        view_btn = view_buttons[0]
-                                        logging.info(f"View button found for credit bill {bill_no}")
+                                    # Click the View button using JavaScript to avoid interception
+                                    try:
+                                        self.table_snapshot.click(bill_table, bill, view_btn)
+                                        logging.info(f"Clicked View button for credit bill {bill_no}")
+                                        self.__take_screenshot(f"VIEW_BUTTON_CLICKED_{bill_no}_PAGE_{page_number}")
+                                        
+                                        # Wait for page to load
+                                        self.ready.ajax_idle()
                                         
-                                        # Extract bill ID from the View button's href attribute if we don't have it
-                                        if bill_id == "unknown" or not bill_id:
-                                            # Try to get bill ID from the View button's href attribute
-                                            try:
-                                                view_href = view_btn.get_attribute("href")
-                                                # Extract bill ID from URL like "...?billId=12345"
-                                                bill_id_match = re.search(r'billId=(\d+)', view_href)
-                                                if bill_id_match:
-                                                    bill_id = bill_id_match.group(1)
-                                                    logging.info(f"Extracted bill ID {bill_id} from View button href")
-                                            except Exception as e:
-                                                logging.warning(f"Could not extract bill ID from View button: {str(e)}")
+                                        # Handle the bill collection process
+                                        self.__handle_bill_collection_in_same_window(original_url, credit_amount, bill_no, bill_id, patient_id)
+                                        total_credit_bills_collected += 1
                                         
-                                        # Store original URL
-                                        original_url = self.driver.current_url
+                                        # After returning to bill list, break to avoid stale element issues
+                                        break
                                         
-                                        # Click the View button using JavaScript to avoid interception
-                                        try:
-                                            self.driver.execute_script("arguments[0].click();", view_btn)
-                                            logging.info(f"Clicked View button for credit bill {bill_no}")
-                                            self.__take_screenshot(f"VIEW_BUTTON_CLICKED_{bill_no}_PAGE_{page_number}")
-                                            
-                                            # Wait for page to load
-                                            time.sleep(3)
-                                            
-                                            # Handle the bill collection process
-                                            self.__handle_bill_collection_in_same_window(original_url, credit_amount, bill_no, bill_id, patient_id)
-                                            total_credit_bills_collected += 1
-                                            
-                                            # After returning to bill list, break to avoid stale element issues
-                                            break
-                                            
-                                        except Exception as e:
-                                            logging.error(f"Error clicking View button for bill {bill_no}: {str(e)}")
-                                            self.__take_screenshot(f"VIEW_BUTTON_ERROR_{bill_no}_PAGE_{page_number}")
-                                    else:
-                                        logging.warning(f"No View button found for credit bill {bill_no}")
-                                        self.__take_screenshot(f"NO_VIEW_BUTTON_{bill_no}_PAGE_{page_number}")
-                            else:
-                                logging.debug(f"Row {i+1} doesn't have enough cells: {len(cells)}")
+                                    except Exception as e:
+                                        logging.error(f"Error clicking View button for bill {bill_no}: {str(e)}")
+                                        self.__take_screenshot(f"VIEW_BUTTON_ERROR_{bill_no}_PAGE_{page_number}")
+                                else:
+                                    logging.warning(f"No View button found for credit bill {bill_no}")
+                                    self.__take_screenshot(f"NO_VIEW_BUTTON_{bill_no}_PAGE_{page_number}")
                                 
                         except Exception as e:
                             logging.warning(f"Error processing row {i+1} on page {page_number}: {str(e)}")
@@ -283,23 +299,10 @@ class EMRCollectCreditBills(unittest.TestCase):
                 except TimeoutException:
                     logging.error(f"Bill table not found on page {page_number}")
                     self.__take_screenshot(f"BILL_TABLE_NOT_FOUND_PAGE_{page_number}")
-                
-                # Check if there's a next page
-                try:
-                    next_button = self.driver.find_element(By.ID, "tbl-bill-list_next")
-                    # Check if the next button is disabled
-                    if "disabled" in next_button.get_attribute("class"):
-                        logging.info("Reached last page, no more pages to process")
-                        break
-                    else:
-                        logging.info(f"Moving to next page {page_number + 1}")
-                        page_number += 1
-                        time.sleep(2)  # Wait before loading next page
-                except:
-                    logging.info("No pagination found or reached last page")
-                    break
-            
+
+            logging.info("Reached last page, no more pages to process")
             logging.info(f"Total credit bills collected: {total_credit_bills_collected}")
+            self.watermark.advance(scanned, still_open)
                     
         except Exception as e:
             self.__take_screenshot("BILL_LIST_ERROR")
@@ -309,10 +312,12 @@ class EMRCollectCreditBills(unittest.TestCase):
     def __handle_bill_collection_in_same_window(self, original_url, credit_amount, bill_no, bill_id, patient_id):
         """
         Handle the bill collection process when navigation occurs in the same window.
+        Returns True once the bill was submitted; goes back to `original_url` unless it is None.
         """
+        collected = False
         try:
             # Wait for page to load
-            time.sleep(3)
+            self.ready.ajax_idle()
             logging.info("Navigated to bill details page in same window")
             self.__take_screenshot("NAVIGATED_TO_BILL_DETAILS")
             
@@ -410,11 +415,10 @@ class EMRCollectCreditBills(unittest.TestCase):
                 self.driver.execute_script("arguments[0].click();", submit_btn)
                 logging.info("Clicked Submit button")
                 self.__take_screenshot("SUBMIT_BUTTON_CLICKED")
+                collected = True
                 
                 # Wait for success notification
                 try:
-                    # Small delay to allow notification to appear
-                    time.sleep(2)
                     success_notification = self.wait.until(
                         EC.visibility_of_element_located((By.XPATH, 
                             "//div[contains(@class, 'ui-pnotify-container') and contains(@class, 'brighttheme-success')] | //div[contains(@class, 'alert-success')] | //div[contains(@class, 'ui-pnotify') and contains(@class, 'success')] | //div[contains(@class, 'toast-success')] | //div[contains(@class, 'success-message')]"))
@@ -437,23 +441,25 @@ class EMRCollectCreditBills(unittest.TestCase):
                 self.__take_screenshot("SUBMIT_BUTTON_ERROR")
             
             # Navigate back to the original bill list
-            try:
-                self.driver.get(original_url)
-                logging.info("Navigated back to original bill list")
-                self.__take_screenshot("BACK_TO_BILL_LIST")
-                
-                # Wait for page to load
-                time.sleep(3)
-            except Exception as e:
-                logging.error(f"Error navigating back to bill list: {str(e)}")
+            if original_url:
+                try:
+                    self.driver.get(original_url)
+                    logging.info("Navigated back to original bill list")
+                    self.__take_screenshot("BACK_TO_BILL_LIST")
+                    
+                    # Wait for page to load
+                    self.ready.ajax_idle()
+                except Exception as e:
+                    logging.error(f"Error navigating back to bill list: {str(e)}")
                 
         except Exception as e:
             logging.error(f"Error in bill collection handling: {str(e)}")
             self.__take_screenshot("COLLECTION_HANDLING_ERROR")
+        return collected
 
     def __save_collected_bill_info(self, bill_no, bill_id, patient_id, amount_collected):
         """
-        Save collected bill information to a JSON file.
+        Save collected bill information to the artifact journal.
         """
         try:
             # Create a dictionary with the bill information
@@ -464,36 +470,35 @@ class EMRCollectCreditBills(unittest.TestCase):
                 "amount_collected": amount_collected if amount_collected else 0,
                 "collection_timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            
-            # Create JSON filename with bill number
-            json_filename = f"{bill_no if bill_no else 'unknown'}.json"
-            json_filepath = os.path.join(collected_bills_dir, json_filename)
-            
-            # Write data to JSON file
-            with open(json_filepath, "w") as json_file:
-                json.dump(bill_data, json_file, indent=4)
-            
-            logging.info(f"Collected bill information saved to {json_filepath}")
+            ArtifactRegistry.shared().record("collected_bill", bill_data["bill_no"], os.path.basename(report_dir), **bill_data)
+            ArtifactJournal.shared().append("collected_bill", os.path.basename(report_dir), **bill_data)
+            logging.info(f"Collected bill {bill_data['bill_no']} saved to the artifact journal")
         except Exception as e:
             logging.error(f"Error saving collected bill information: {str(e)}")
             self.__take_screenshot("SAVE_BILL_INFO_ERROR")
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
+
+    def tearDown(self):
+        """
+        Test-level teardown: Report WebDriver command counts and enforce the command budget.
+        """
+        self.screenshots.end_test(self)
+        self.command_stats.detach()
+        self.command_stats.log_summary()
+        self.command_stats.save(command_stats_dir)
+        self.command_stats.assert_within(CommandStats.budget_from_env(default=command_budget))
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
         logging.info("Cleaning up browser windows...")
         try:
             time.sleep(2)
@@ -525,6 +530,7 @@ class EMRCollectCreditBills(unittest.TestCase):
             except Exception:
                 pass
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -7,9 +7,7 @@ import time
 import logging
 import unittest
 import json
-import glob
 import xmlrunner
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -17,6 +15,12 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.keys import Keys
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
+from utilities.network_capture import NetworkCapture
+from utilities.popup_interceptor import PopupInterceptor
 
 
 # Folder configuration
@@ -36,16 +40,15 @@ class EMRRegistrationWithExistingPatId(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
+        cls.network = NetworkCapture(cls.driver)
+        cls.popups = PopupInterceptor(cls.driver)
+        cls.popups.install()
         cls.wait = WebDriverWait(cls.driver, 20)
         cls.base_url = cls.config["base_url"]
         cls.valid_username = cls.config["username"]
@@ -55,74 +58,24 @@ class EMRRegistrationWithExistingPatId(unittest.TestCase):
         """
         Test-level setup: Navigate to base URL, login, and initialize patient_id and bill_no.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
+        self.popups.reset()
         self.patient_id = None
         self.bill_no = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        # self.__take_screenshot("LOGIN_SUCCESS")  # Uncomment for debugging screenshots
-
     def __get_latest_patient_id(self):
         """
-        Get the latest patient ID from the patient_ids folders.
-        Returns the most recent patient ID based on file modification time.
+        Get the latest patient ID from the artifact registry.
+        Returns the patient ID most recently recorded by any of the workflows below.
         """
         try:
-            base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'reports'))
-            patient_id_dirs = [
-                os.path.join(base_dir, 'opd_registration', 'patient_ids'),
-                os.path.join(base_dir, 'opd_combined', 'patient_ids'),
-                os.path.join(base_dir, 'emr_registration', 'patient_ids'),
-                os.path.join(base_dir, 'emr_billing', 'patient_ids'),
-                os.path.join(base_dir, 'emr_combined', 'patient_ids')
-            ]
-            
-            # Log absolute paths for debugging
-            for dir_path in patient_id_dirs:
-                logging.info(f"Checking patient ID directory: {os.path.abspath(dir_path)}")
-            
-            # Check read permissions and directory existence
-            json_files = []
-            for dir_path in patient_id_dirs:
-                if not os.path.exists(dir_path):
-                    logging.warning(f"Directory does not exist: {dir_path}")
-                    continue
-                if not os.access(dir_path, os.R_OK):
-                    logging.error(f"No read permission for directory: {dir_path}")
-                    continue
-                files = glob.glob(os.path.join(dir_path, "*.json"))
-                json_files.extend(files)
-                logging.info(f"Found {len(files)} JSON files in {dir_path}")
-            
-            if not json_files:
-                logging.error("No patient ID files found in any patient_ids folder")
-                raise ValueError("No patient ID files found in any patient_ids folder")
-            
-            # Find the most recent file
-            latest_file = max(json_files, key=os.path.getmtime)
-            logging.info(f"Latest patient ID file: {latest_file}")
-            
-            # Extract patient ID from filename (e.g., "2154.json" -> "2154")
-            filename = os.path.basename(latest_file)
-            patient_id = os.path.splitext(filename)[0]
-            
-            logging.info(f"Latest patient ID found: {patient_id}")
-            return patient_id
-            
+            return ArtifactRegistry.shared().latest_patient_id([
+                "opd_registration",
+                "opd_combined",
+                "emr_registration",
+                "emr_billing",
+                "emr_combined"
+            ])
         except Exception as e:
             logging.error(f"Error getting latest patient ID: {str(e)}")
             self.__take_screenshot("PATIENT_ID_RETRIEVAL_ERROR")
@@ -134,7 +87,7 @@ class EMRRegistrationWithExistingPatId(unittest.TestCase):
         and submit to create a new EMR registration.
         """
         # Navigate directly to Emergency registration URL
-        self.driver.get("http://lunivacare.ddns.net:8080/himsnew/ipd/register/Emergency")
+        self.driver.get(f"{self.base_url}ipd/register/Emergency")
         self.wait.until(EC.presence_of_element_located((By.ID, "getPatInfoById")))
         logging.info("Navigated to EMR Registration page")
         # self.__take_screenshot("EMR_REGISTER_PAGE")  # Uncomment for debugging
@@ -158,6 +111,8 @@ class EMRRegistrationWithExistingPatId(unittest.TestCase):
         submit_btn = self.wait.until(EC.element_to_be_clickable((By.ID, "submitNewButton")))
         self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", submit_btn)
         time.sleep(0.5)
+        # Only responses to this save count; earlier lookups can carry other patients' ids
+        self.network.mark()
         submit_btn.click()
         logging.info("Form submitted with existing patient ID")
         # self.__take_screenshot("FORM_SUBMITTED")  # Uncomment for debugging
@@ -202,6 +157,14 @@ class EMRRegistrationWithExistingPatId(unittest.TestCase):
         """
         Capture patient ID and bill number by clicking the Print Bill button and extracting from the print window.
         """
+        # Both straight from the register response when network capture is on
+        captured = self.network.wait_for("patient_id", "bill_no")
+        if captured:
+            self.patient_id = captured["patient_id"]
+            self.bill_no = captured["bill_no"]
+            logging.info(f"Captured Patient ID {self.patient_id} and Bill No {self.bill_no} from the network")
+            return
+
         try:
             # Wait for the page to load and try multiple approaches to find the Print Bill button
             time.sleep(3)  # Give the page some time to fully load
@@ -256,9 +219,16 @@ class EMRRegistrationWithExistingPatId(unittest.TestCase):
             print_bill_btn.click()
             logging.info("Clicked Print Bill button")
             
-            # Wait for new window to open
+            # With popup interception the print page is read in the background instead of opened
+            printed = self.popups.ids("patient_id", "bill_no")
+            if printed:
+                self.patient_id = printed["patient_id"]
+                self.bill_no = printed["bill_no"]
+                return
+
+            # Wait for new window to open; none opens while popups are intercepted, so fail over at once
             main_window = self.driver.current_window_handle
-            WebDriverWait(self.driver, 20).until(lambda d: len(d.window_handles) > 1)
+            WebDriverWait(self.driver, self.popups.window_timeout(20)).until(lambda d: len(d.window_handles) > 1)
             logging.info("Print window opened")
             
             # Switch to the print window
@@ -338,49 +308,43 @@ class EMRRegistrationWithExistingPatId(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes. Commented out by default to avoid overhead.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
 
     def tearDown(self):
         """
-        Test-level teardown: Save patient ID and bill number to separate JSON files if captured.
-        Each patient ID is stored in a file named as ID.json
-        Each bill number is stored in a file named as BILLNO.json
+        Test-level teardown: Save patient ID and bill number to the artifact journal if captured.
         """
-        # Save patient ID to JSON file
+        self.screenshots.end_test(self)
+        # Save patient ID to the artifact journal
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}.json")
             data = {
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(json_file, "w") as f:
-                json.dump(data, f, indent=4)
-            logging.info(f"Patient ID {self.patient_id} saved to {json_file}")
+            ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+            ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+            logging.info(f"Patient ID {self.patient_id} saved to the artifact journal")
         
-        # Save bill number to JSON file
+        # Save bill number to the artifact journal
         if self.bill_no:
-            bill_json_file = os.path.join(bill_nos_dir, f"{self.bill_no}.json")
             bill_data = {
                 "bill_no": self.bill_no,
                 "patient_id": self.patient_id if hasattr(self, 'patient_id') and self.patient_id else "unknown",
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(bill_json_file, "w") as f:
-                json.dump(bill_data, f, indent=4)
-            logging.info(f"Bill No {self.bill_no} saved to {bill_json_file}")
+            ArtifactRegistry.shared().record("bill_no", bill_data["bill_no"], os.path.basename(report_dir), **bill_data)
+            ArtifactJournal.shared().append("bill_no", os.path.basename(report_dir), **bill_data)
+            logging.info(f"Bill No {self.bill_no} saved to the artifact journal")
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
+        cls.popups.uninstall()
         logging.info("Cleaning up browser windows...")
         try:
             while len(cls.driver.window_handles) > 1:
@@ -389,6 +353,7 @@ class EMRRegistrationWithExistingPatId(unittest.TestCase):
             cls.driver.switch_to.window(cls.driver.window_handles[0])
         finally:
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 
 if __name__ == "__main__":
@@ -8,8 +8,6 @@ import logging
 import unittest
 import json
 import xmlrunner
-import glob
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -17,6 +15,16 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.action_chains import ActionChains
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.wait_conditions import ReadyWait
+from utilities.select2 import Select2Picker
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
+from utilities.network_capture import NetworkCapture
+from utilities.popup_interceptor import PopupInterceptor
+from utilities.http_client import HmisHttpClient
+from utilities.bill_capture import BillCapture
 import xml.etree.ElementTree as ET
 
 
@@ -118,20 +126,21 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
+        cls.network = NetworkCapture(cls.driver)
+        cls.popups = PopupInterceptor(cls.driver)
+        cls.popups.install()
         cls.wait = WebDriverWait(cls.driver, 20)
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.select2 = Select2Picker(cls.driver, cls.ready)
         cls.base_url = cls.config["base_url"]
+        cls.http = HmisHttpClient(cls.driver, cls.base_url)
+        cls.bill_capture = BillCapture(cls.driver, cls.popups, cls.network, cls.http)
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
 
@@ -139,50 +148,21 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
         """
         Test-level setup: Navigate to base URL, login, and initialize patient_id, bill_no and bill_id.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
+        self.popups.reset()
         self.patient_id = None
         self.bill_no = None
         self.bill_id = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
-
     def __get_latest_patient_id(self):
         """
-        Get the latest patient ID from the patient_ids folder.
-        Returns the most recent patient ID based on file modification time.
+        Get the latest patient ID from the artifact registry.
+        Returns the patient ID most recently recorded by any of the workflows below.
         """
         try:
-            # Get all JSON files from patient_ids folder
-            json_files = glob.glob(os.path.join(patient_json_dir, "*.json"))
-            
-            if not json_files:
-                raise ValueError("No patient ID files found in patient_ids folder")
-            
-            # Find the most recent file
-            latest_file = max(json_files, key=os.path.getmtime)
-            
-            # Extract patient ID from filename (e.g., "2134.json" -> "2134")
-            filename = os.path.basename(latest_file)
-            patient_id = os.path.splitext(filename)[0]
-            
-            logging.info(f"Latest patient ID found: {patient_id}")
-            return patient_id
-            
+            return ArtifactRegistry.shared().latest_patient_id([
+                "emr_combined"
+            ])
         except Exception as e:
             logging.error(f"Error getting latest patient ID: {str(e)}")
             raise
@@ -209,7 +189,7 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
         """
         self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
         self.wait.until(EC.element_to_be_clickable(
-            (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/ipd/register/Emergency']"))).click()
+            (By.XPATH, f"//a[@href='{self.base_url}ipd/register/Emergency']"))).click()
         logging.info("Navigated to EMR Registration page")
         self.__take_screenshot("EMR_REGISTER_PAGE")
 
@@ -226,11 +206,7 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
         self.driver.find_element(By.ID, "age").send_keys("25")
         logging.info("Entered personal details")
 
-        self.driver.find_element(By.XPATH, "//span[@id='select2-current-address-container']").click()
-        search_field = self.wait.until(EC.presence_of_element_located((By.XPATH, "//input[@class='select2-search__field']")))
-        search_field.send_keys("Kathmandu")
-        self.wait.until(EC.element_to_be_clickable(
-            (By.XPATH, "//li[contains(@class, 'select2-results__option') and contains(text(), 'Kathmandu')]"))).click()
+        self.select2.pick((By.ID, "select2-current-address-container"), "Kathmandu", required=True)
         logging.info("Selected address")
         self.__take_screenshot("FORM_FILLED")
 
@@ -245,11 +221,11 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
         # Wait for Print Sticker button to be clickable and take screenshot
         try:
             print_sticker_btn = self.wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "printStikerBtn")))
-            self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", print_sticker_btn)
-            time.sleep(1)  # Extended pause to ensure visibility
-            sticker_screenshot_path = os.path.join(screenshot_dir, f"PRINT_STICKER_BTN_{self.patient_id}_{time.strftime('%Y%m%d_%H%M%S')}.png")
-            print_sticker_btn.screenshot(sticker_screenshot_path)
-            logging.info(f"Print Sticker button screenshot saved: {sticker_screenshot_path}")
+            # Under the on_failure policy capture() takes no shot, so skip the scroll and pause
+            if self.screenshots.policy != "on_failure":
+                self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", print_sticker_btn)
+                time.sleep(1)  # Extended pause to ensure visibility
+            self.screenshots.capture(f"PRINT_STICKER_BTN_{self.patient_id}", self._testMethodName, element=print_sticker_btn)
         except Exception as e:
             logging.warning(f"Could not take screenshot of Print Sticker button: {str(e)}")
             self.__take_screenshot("PRINT_STICKER_ERROR")
@@ -262,7 +238,7 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
             # Navigate to EMR Billing
             self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
             billing_link = self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/bill/createBill?bt=Emergency']")))
+                (By.XPATH, f"//a[@href='{self.base_url}bill/createBill?bt=Emergency']")))
             billing_link.click()
             logging.info("Navigated to EMR Billing page")
             self.__take_screenshot("EMR_BILLING_PAGE")
@@ -325,45 +301,7 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
         
         for test_name in tests:
             try:
-                # Locate and open the test dropdown
-                try:
-                    dropdown = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"))
-                    )
-                except TimeoutException:
-                    dropdown = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"))
-                    )
-                dropdown.click()
-                logging.info(f"Test dropdown clicked for {test_name}")
-                self.__take_screenshot(f"TEST_DROPDOWN_CLICKED_{test_name.replace(' ', '_')}")
-                time.sleep(0.5)
-
-                # Locate search input
-                try:
-                    search_input = short_wait.until(EC.presence_of_element_located(
-                        (By.XPATH, "//div[contains(@class, 'select2-drop-active')]//input"))
-                    )
-                except TimeoutException:
-                    search_input = short_wait.until(EC.presence_of_element_located(
-                        (By.XPATH, "//div[contains(@class, 'select2-drop-active')]//input"))
-                    )
-                
-                search_input.clear()
-                search_input.send_keys(test_name)
-                logging.info(f"Entered {test_name} in search")
-                time.sleep(1)
-
-                # Select the test
-                try:
-                    test_option = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, f"//div[contains(@class, 'select2-result-label') and contains(text(), '{test_name}')]"))
-                    )
-                except TimeoutException:
-                    test_option = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, f"//div[contains(text(), '{test_name}')]"))
-                    )
-                test_option.click()
+                self.select2.pick((By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"), test_name, required=True)
                 logging.info(f"{test_name} selected")
                 self.__take_screenshot(f"{test_name.replace(' ', '_')}_SELECTED")
 
@@ -418,6 +356,8 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
             )
             time.sleep(0.5)
             
+            # Only responses to this save count; earlier lookups can carry other patients' ids
+            self.network.mark()
             submit_btn.click()
             logging.info("Clicked Submit button to complete the billing process")
             self.__take_screenshot("BILLING_FORM_SUBMITTED")
@@ -524,7 +464,16 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
         """
         Capture Bill No from new window and Bill ID from main page by hovering over Print Bill button
         """
-        wait_for_windows = WebDriverWait(self.driver, 20)
+        # Bill No and Bill ID from the intercepted popup, the createBill response or the invoice page
+        # over HTTP, whichever is switched on; otherwise from the invoice window below
+        bill = self.bill_capture.capture(original_window, self.patient_id)
+        if bill:
+            self.bill_no = bill["bill_no"]
+            self.bill_id = bill["bill_id"]
+            return
+
+        # No window will open while popups are intercepted, or if BillCapture already waited for it
+        wait_for_windows = WebDriverWait(self.driver, self.bill_capture.fallback_window_timeout(20))
         try:
             # Wait for new window or tab to open
             wait_for_windows.until(lambda d: len(d.window_handles) > 1)
@@ -728,14 +677,9 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
 
     def __extract_bill_id_from_tooltip(self):
         """
@@ -848,36 +792,37 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
 
     def tearDown(self):
         """
-        Test-level teardown: Save patient ID and bill info to separate JSON files if captured.
+        Test-level teardown: Save patient ID and bill info to the artifact journal if captured.
         """
+        self.screenshots.end_test(self)
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}.json")
             data = {
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(json_file, "w") as f:
-                json.dump(data, f, indent=4)
-            logging.info(f"Patient ID {self.patient_id} saved to {json_file}")
+            ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+            ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+            logging.info(f"Patient ID {self.patient_id} saved to the artifact journal")
 
         if self.bill_no:
-            # Save bill information directly in bill_nos folder
-            bill_json_file = os.path.join(bill_nos_dir, f"{self.bill_no.zfill(8)}.json")
             bill_data = {
                 "bill_no": self.bill_no.zfill(8),
                 "bill_id": self.bill_id if hasattr(self, 'bill_id') and self.bill_id else "unknown",
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(bill_json_file, "w") as f:
-                json.dump(bill_data, f, indent=4)
-            logging.info(f"Bill information saved to {bill_json_file}")
+            ArtifactRegistry.shared().record("bill_no", bill_data["bill_no"], os.path.basename(report_dir), **bill_data)
+            ArtifactJournal.shared().append("bill_no", os.path.basename(report_dir), **bill_data)
+            logging.info("Bill information saved to the artifact journal")
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
+        cls.popups.uninstall()
+        cls.http.close()
         logging.info("Cleaning up browser windows...")
         try:
             # Ensure we have time to write XML before cleanup
@@ -914,6 +859,7 @@ class CombinedEMRRegistrationBilling(unittest.TestCase):
             except Exception:
                 pass
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 
 if __name__ == "__main__":
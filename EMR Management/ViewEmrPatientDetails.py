@@ -5,13 +5,17 @@ import logging
 import unittest
 import json
 import xmlrunner
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
+from utilities.http_client import HmisHttpClient
 
 
 # Folder configuration
@@ -29,18 +33,15 @@ class ViewEMRPatientDetails(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
         cls.wait = WebDriverWait(cls.driver, 20)
         cls.base_url = cls.config["base_url"]
+        cls.http = HmisHttpClient(cls.driver, cls.base_url)
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
 
@@ -48,53 +49,42 @@ class ViewEMRPatientDetails(unittest.TestCase):
         """
         Test-level setup: Navigate to base URL, login, and initialize patient_id.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
         self.patient_id = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
-
     def test_view_emr_patient_details(self):
         """
         Main test method: Navigate to EMR patient view, select a patient, and perform automation on patient details page.
         """
-        # Navigate to View Emergency Patients page
-        self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
-        self.wait.until(EC.element_to_be_clickable(
-            (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/patient/view_emergency']"))).click()
-        logging.info("Navigated to View Emergency Patients page")
-        self.__take_screenshot("VIEW_EMERGENCY_PATIENTS_PAGE")
-
-        # Wait for patient table to load
-        self.wait.until(EC.presence_of_element_located((By.XPATH, "//table[@id='patientTable']")))
-        logging.info("Patient table loaded")
-
-        # Click on the first patient's View button
-        try:
-            view_btn = self.wait.until(EC.element_to_be_clickable((By.XPATH, "//table[@id='patientTable']//tbody//tr[1]//a[contains(@class, 'btn-info') and contains(@href, 'emergency_patient_details')]")))
-            patient_href = view_btn.get_attribute("href")
-            logging.info(f"Found patient details link: {patient_href}")
-            view_btn.click()
-            logging.info("Clicked on View button for first patient")
-            self.__take_screenshot("CLICKED_VIEW_BUTTON")
-        except TimeoutException:
-            logging.error("Could not find or click the View button for the first patient")
-            self.__take_screenshot("VIEW_BUTTON_ERROR")
-            raise
+        # With HMIS_HTTP_LOOKUPS=1 the first patient's details link is read from the list over HTTP
+        links = self.http.patient_detail_links("emergency")
+        if links:
+            logging.info(f"Found patient details link over HTTP: {links[0]}")
+            self.driver.get(links[0])
+        else:
+            # Navigate to View Emergency Patients page
+            self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
+            self.wait.until(EC.element_to_be_clickable(
+                (By.XPATH, f"//a[@href='{self.base_url}patient/view_emergency']"))).click()
+            logging.info("Navigated to View Emergency Patients page")
+            self.__take_screenshot("VIEW_EMERGENCY_PATIENTS_PAGE")
+
+            # Wait for patient table to load
+            self.wait.until(EC.presence_of_element_located((By.XPATH, "//table[@id='patientTable']")))
+            logging.info("Patient table loaded")
+
+            # Click on the first patient's View button
+            try:
+                view_btn = self.wait.until(EC.element_to_be_clickable((By.XPATH, "//table[@id='patientTable']//tbody//tr[1]//a[contains(@class, 'btn-info') and contains(@href, 'emergency_patient_details')]")))
+                patient_href = view_btn.get_attribute("href")
+                logging.info(f"Found patient details link: {patient_href}")
+                view_btn.click()
+                logging.info("Clicked on View button for first patient")
+                self.__take_screenshot("CLICKED_VIEW_BUTTON")
+            except TimeoutException:
+                logging.error("Could not find or click the View button for the first patient")
+                self.__take_screenshot("VIEW_BUTTON_ERROR")
+                raise
 
         # Wait for patient details page to load
         self.wait.until(EC.presence_of_element_located((By.XPATH, "//div[contains(@class, 'ibox-title') and contains(., 'Patient Detail')]")))
@@ -160,34 +150,31 @@ class ViewEMRPatientDetails(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
 
     def tearDown(self):
         """
-        Test-level teardown: Save patient ID to a separate JSON file if captured.
+        Test-level teardown: Save patient ID to the artifact journal if captured.
         """
+        self.screenshots.end_test(self)
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}.json")
             data = {
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(json_file, "w") as f:
-                json.dump(data, f, indent=4)
-            logging.info(f"Patient ID {self.patient_id} saved to {json_file}")
+            ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+            ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+            logging.info(f"Patient ID {self.patient_id} saved to the artifact journal")
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
+        cls.http.close()
         logging.info("Cleaning up browser windows...")
         try:
             while len(cls.driver.window_handles) > 1:
@@ -196,6 +183,7 @@ class ViewEMRPatientDetails(unittest.TestCase):
             cls.driver.switch_to.window(cls.driver.window_handles[0])
         finally:
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 
 if __name__ == "__main__":
@@ -9,7 +9,6 @@ import unittest
 import json
 import xmlrunner
 import glob
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -17,11 +16,23 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import TimeoutException, ElementClickInterceptedException
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.command_stats import CommandStats
+from utilities.wait_conditions import ReadyWait
+from utilities.table_snapshot import TableSnapshot
+from utilities.bill_list_pager import BillListPager
+from utilities.collection_checkpoint import CollectionCheckpoint
+from utilities.bill_watermark import BillWatermark
+from utilities.screenshot_service import ScreenshotService
 import xml.etree.ElementTree as ET
 
 # Folder configuration
 screenshot_dir = os.path.join("screenshots", "ipd_collect_due")
 report_dir = os.path.join("reports", "ipd_collect_due")
+command_stats_dir = os.path.join(report_dir, "command_stats")
+# WebDriver round-trips one test may send before it fails (HMIS_COMMAND_BUDGET overrides)
+command_budget = 20000
+batch_checkpoint_file = os.path.join(report_dir, "batch_checkpoint.json")
 os.makedirs(screenshot_dir, exist_ok=True)
 os.makedirs(report_dir, exist_ok=True)
 
@@ -31,54 +42,112 @@ class IPDCollectDueBills(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        chrome_options.add_argument("--disable-logging")
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
         cls.wait = WebDriverWait(cls.driver, 20)
         cls.short_wait = WebDriverWait(cls.driver, 10)  # Increased for modal handling
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.table_snapshot = TableSnapshot(cls.driver)
         cls.base_url = cls.config["base_url"]
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
 
     def setUp(self):
         """
-        Test-level setup: Navigate to base URL, login.
+        Test-level setup: Navigate to base URL, login, start counting WebDriver commands and load the bill watermark.
         """
-        self.driver.get(self.base_url)
-        self.__login()
-
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
+        self.session_pool.ensure_logged_in(self.driver)
+        self.command_stats = CommandStats(self.driver, self.id()).attach()
+        self.watermark = BillWatermark("IPD", "due", self.base_url)
 
     def test_collect_ipd_due_bills(self):
         """
         Test method: Navigate to IPD bill list, find due bills, and collect them.
         """
         logging.info("Starting IPD Due Bill Collection...")
-        self.__collect_ipd_due_bills()
+        if CollectionCheckpoint.batch_enabled():
+            self.__collect_ipd_due_bills_batch()
+        else:
+            self.__collect_ipd_due_bills()
+
+    def __collect_ipd_due_bills_batch(self):
+        """
+        Batch mode: snapshot every due/credit bill in the list first, then open each bill's
+        collect link directly and collect it, checkpointing progress so an interrupted batch resumes.
+        """
+        checkpoint = CollectionCheckpoint(batch_checkpoint_file)
+        if checkpoint.resumable():
+            logging.info(f"Resuming batch with {len(checkpoint.pending())} due bills left")
+        else:
+            checkpoint.start(self.__snapshot_ipd_due_bills())
+        
+        for bill in checkpoint.pending():
+            bill_no = bill["bill_no"]
+            if not bill["collect_href"]:
+                logging.warning(f"No collect link for due bill {bill_no}, skipping")
+                checkpoint.mark_failed(bill, "No collect link")
+                continue
+            try:
+                self.driver.get(bill["collect_href"])
+                logging.info(f"Opened collection for due bill {bill_no}")
+                collected = self.__handle_bill_collection()
+            except Exception as e:
+                logging.error(f"Error collecting due bill {bill_no}: {str(e)}")
+                self.__take_screenshot(f"BATCH_COLLECTION_ERROR_{bill_no}")
+                checkpoint.mark_failed(bill, e)
+                continue
+            if collected:
+                checkpoint.mark_done(bill, status=bill["status"])
+            else:
+                checkpoint.mark_failed(bill, "Bill was not submitted")
+        
+        # Bills that failed but have attempts left stay pending for the next run
+        if not checkpoint.pending():
+            checkpoint.finish()
+
+    def __snapshot_ipd_due_bills(self):
+        """
+        Read every page of the IPD bill list and return the due/credit bills with a
+        navigable collect link as dicts.
+        """
+        list_url = f"{self.base_url}bill/bill_list?list=IPD"
+        self.driver.get(list_url)
+        self.ready.ajax_idle()
+        bills = []
+        scanned = []
+        pager = BillListPager(self.driver, self.ready)
+        for page_number in pager.pages(list_url):
+            bill_table = self.wait.until(EC.presence_of_element_located((By.XPATH, "//table[contains(@class, 'table')]")))
+            new_bills = [bill for bill in map(self.__ipd_bill, self.table_snapshot.rows(bill_table)) if self.watermark.is_new(bill["bill_id"])]
+            scanned.extend((bill["bill_id"], None) for bill in new_bills)
+            bills.extend(bill for bill in new_bills if bill["due"])
+            logging.info(f"Found {len(bills)} new due bills up to page {page_number}")
+        self.__take_screenshot("DUE_BILLS_SNAPSHOT")
+        self.watermark.advance(scanned, [(bill["bill_id"], None) for bill in bills])
+        return bills
+
+    def __ipd_bill(self, row):
+        """
+        Bill fields of an IPD bill list row: id, number, status, whether it is due/credit
+        and the collect link (empty if the link cannot be opened directly).
+        """
+        status_text = row.cell(3).lower()  # Assuming 4th column is status
+        collect_btn = row.control(text="Collect", href="collect", cls="collect", tag="a")
+        if collect_btn is None:
+            collect_btn = next((btn for btn in row.controls if btn.matches(text="collect") or btn.matches(text="pay") or btn.matches(text="due")), None)
+        collect_href = collect_btn.href if collect_btn is not None and collect_btn.href.startswith("http") else ""
+        bill_id_match = re.search(r'billId=(\d+)', collect_href)
+        return {
+            "bill_id": row.attr("data-bill-id") or (bill_id_match.group(1) if bill_id_match else row.cell(0)),
+            "bill_no": row.cell(0),
+            "status": row.cell(3),
+            "due": len(row.cells) >= 4 and ("due" in status_text or "credit" in status_text),
+            "collect_href": collect_href
+        }
 
     def __collect_ipd_due_bills(self):
         """
@@ -86,7 +155,7 @@ class IPDCollectDueBills(unittest.TestCase):
         """
         try:
             # Navigate directly to IPD Bill List
-            self.driver.get("http://lunivacare.ddns.net:8080/himsnew/bill/bill_list?list=IPD")
+            self.driver.get(f"{self.base_url}bill/bill_list?list=IPD")
             time.sleep(3)  # Wait for page to load
             logging.info("Navigated to IPD Bill List page")
             self.__take_screenshot("IPD_BILL_LIST_PAGE")
@@ -97,20 +166,21 @@ class IPDCollectDueBills(unittest.TestCase):
                 logging.info("Bill table found")
                 self.__take_screenshot("BILL_TABLE_FOUND")
                 
-                # Find all rows in the table
-                rows = bill_table.find_elements(By.XPATH, ".//tbody//tr")
-                logging.info(f"Found {len(rows)} bill rows")
+                # Read the whole table (cells, row attributes, buttons) in one round-trip;
+                # bills at or below the watermark were settled in an earlier run. Only page 1
+                # is read here, so the watermark is left for the full scan in batch mode to move
+                all_rows = self.table_snapshot.rows(bill_table)
+                rows = [row for row in all_rows if self.watermark.is_new(self.__ipd_bill(row)["bill_id"])]
+                logging.info(f"Found {len(rows)} new bill rows")
                 
                 # Process each row to find due bills
                 due_bills_found = 0
-                for i, row in enumerate(rows):
+                for row in rows:
+                    i = row.index
                     try:
-                        # Get cells in the row
-                        cells = row.find_elements(By.XPATH, ".//td")
-                        if len(cells) >= 4:  # Ensure we have enough cells
+                        if len(row.cells) >= 4:  # Ensure we have enough cells
                             # Check if this is a due bill (look for "Due" in status column)
-                            status_cell = cells[3]  # Assuming 4th column is status
-                            status_text = status_cell.text.strip().lower()
+                            status_text = row.cell(3).lower()  # Assuming 4th column is status
                             
                             if "due" in status_text or "credit" in status_text:
                                 due_bills_found += 1
@@ -118,14 +188,13 @@ class IPDCollectDueBills(unittest.TestCase):
                                 self.__take_screenshot(f"DUE_BILL_FOUND_ROW_{i+1}")
                                 
                                 # Look for collect button in this row
-                                collect_buttons = row.find_elements(By.XPATH, ".//a[contains(@class, 'collect') or contains(text(), 'Collect') or contains(@href, 'collect')]")
-                                if collect_buttons:
-                                    collect_btn = collect_buttons[0]
+                                collect_btn = row.control(text="Collect", href="collect", cls="collect", tag="a")
+                                if collect_btn is not None:
                                     logging.info(f"Collect button found for due bill in row {i+1}")
                                     
                                     # Click the collect button
                                     try:
-                                        collect_btn.click()
+                                        self.table_snapshot.click(bill_table, row, collect_btn)
                                         logging.info(f"Clicked collect button for due bill in row {i+1}")
                                         self.__take_screenshot(f"COLLECT_BUTTON_CLICKED_ROW_{i+1}")
                                         
@@ -142,13 +211,12 @@ class IPDCollectDueBills(unittest.TestCase):
                                     logging.warning(f"No collect button found for due bill in row {i+1}")
                                     self.__take_screenshot(f"NO_COLLECT_BUTTON_ROW_{i+1}")
                                     # Try to find any button that might be for collection
-                                    all_buttons = row.find_elements(By.XPATH, ".//button | .//a")
-                                    for btn in all_buttons:
+                                    for btn in row.controls:
                                         btn_text = btn.text.lower()
                                         if "collect" in btn_text or "pay" in btn_text or "due" in btn_text:
                                             logging.info(f"Found potential collection button: {btn_text}")
                                             try:
-                                                btn.click()
+                                                self.table_snapshot.click(bill_table, row, btn)
                                                 logging.info(f"Clicked potential collection button: {btn_text}")
                                                 self.__take_screenshot(f"POTENTIAL_COLLECT_BUTTON_CLICKED_{i+1}")
                                                 self.__handle_bill_collection()
@@ -157,7 +225,7 @@ class IPDCollectDueBills(unittest.TestCase):
                                                 logging.error(f"Error clicking potential collection button: {str(e)}")
                                                 self.__take_screenshot(f"POTENTIAL_COLLECT_BUTTON_ERROR_{i+1}")
                         else:
-                            logging.debug(f"Row {i+1} doesn't have enough cells: {len(cells)}")
+                            logging.debug(f"Row {i+1} doesn't have enough cells: {len(row.cells)}")
                             
                     except Exception as e:
                         logging.warning(f"Error processing row {i+1}: {str(e)}")
@@ -181,7 +249,9 @@ class IPDCollectDueBills(unittest.TestCase):
     def __handle_bill_collection(self):
         """
         Handle the bill collection process after clicking collect button.
+        Returns True once the collection was submitted.
         """
+        collected = False
         try:
             # Wait for collection modal or page to load
             time.sleep(2)
@@ -233,6 +303,7 @@ class IPDCollectDueBills(unittest.TestCase):
                     submit_btn.click()
                     logging.info("Clicked submit/confirm button for bill collection")
                     self.__take_screenshot("COLLECTION_SUBMIT_CLICKED")
+                    collected = True
                     
                     # Wait for success notification
                     try:
@@ -255,23 +326,30 @@ class IPDCollectDueBills(unittest.TestCase):
         except Exception as e:
             logging.error(f"Error in bill collection handling: {str(e)}")
             self.__take_screenshot("COLLECTION_HANDLING_ERROR")
+        return collected
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
+
+    def tearDown(self):
+        """
+        Test-level teardown: Report WebDriver command counts and enforce the command budget.
+        """
+        self.screenshots.end_test(self)
+        self.command_stats.detach()
+        self.command_stats.log_summary()
+        self.command_stats.save(command_stats_dir)
+        self.command_stats.assert_within(CommandStats.budget_from_env(default=command_budget))
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
         logging.info("Cleaning up browser windows...")
         try:
             time.sleep(2)
@@ -303,6 +381,7 @@ class IPDCollectDueBills(unittest.TestCase):
             except Exception:
                 pass
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -7,15 +7,22 @@ import time
 import logging
 import unittest
 import json
-import glob
 import xmlrunner
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.wait_conditions import ReadyWait
+from utilities.locator_registry import LocatorRegistry
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.patient_allocator import PatientAllocator
+from utilities.screenshot_service import ScreenshotService
+from utilities.network_capture import NetworkCapture
+from utilities.popup_interceptor import PopupInterceptor
 
 
 # Folder configuration
@@ -33,17 +40,18 @@ class IPDRegistration(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
+        cls.network = NetworkCapture(cls.driver)
+        cls.popups = PopupInterceptor(cls.driver)
+        cls.popups.install()
         cls.wait = WebDriverWait(cls.driver, 20)
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.locators = LocatorRegistry.shared()
         cls.base_url = cls.config["base_url"]
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
@@ -52,71 +60,22 @@ class IPDRegistration(unittest.TestCase):
         """
         Test-level setup: Navigate to base URL, login, and initialize patient_id and ipd_id.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
+        self.popups.reset()
         self.patient_id = None
+        self.patient_lease = None
         self.ipd_id = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        # self.__take_screenshot("LOGIN_SUCCESS")  # Uncomment for debugging screenshots
-
     def __get_latest_patient_id(self):
         """
-        Get the latest patient ID from the patient_ids folder.
-        Returns the most recent patient ID based on file modification time.
+        Lease the latest not yet admitted patient ID recorded by any of the workflows below.
+        The lease keeps parallel runs off this patient until tearDown releases it.
         """
         try:
-            # Get all JSON files from patient_ids folder (check multiple possible locations)
-            json_files = []
-            
-            # Check the standard OPD combined location
-            opd_combined_path = os.path.join("..", "reports", "opd_combined", "patient_ids")
-            if os.path.exists(opd_combined_path):
-                json_files.extend(glob.glob(os.path.join(opd_combined_path, "*.json")))
-            
-            # Check if we found files, if not try current directory structure
-            if not json_files:
-                # Try to find patient ID files in various locations
-                possible_paths = [
-                    os.path.join("..", "reports", "opd_combined", "patient_ids"),
-                    os.path.join("..", "..", "reports", "opd_combined", "patient_ids"),
-                    os.path.join("reports", "opd_combined", "patient_ids"),
-                    os.path.join("..", "OPD Management", "reports", "opd_combined", "patient_ids")
-                ]
-                
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        files = glob.glob(os.path.join(path, "*.json"))
-                        json_files.extend(files)
-                        if files:
-                            break
-            
-            if not json_files:
-                raise ValueError("No patient ID files found in patient_ids folder")
-            
-            # Find the most recent file
-            latest_file = max(json_files, key=os.path.getmtime)
-            
-            # Extract patient ID from filename (e.g., "2134.json" -> "2134")
-            filename = os.path.basename(latest_file)
-            patient_id = os.path.splitext(filename)[0]
-            
-            logging.info(f"Latest patient ID found: {patient_id}")
-            return patient_id
-            
+            self.patient_lease = PatientAllocator.shared().acquire(os.path.basename(report_dir), [
+                "opd_combined"
+            ], admitted=False)
+            return self.patient_lease.patient_id
         except Exception as e:
             logging.error(f"Error getting latest patient ID: {str(e)}")
             raise
@@ -127,7 +86,7 @@ class IPDRegistration(unittest.TestCase):
         submit, and capture IPD ID.
         """
         # Navigate directly to IPD registration page
-        self.driver.get("http://lunivacare.ddns.net:8080/himsnew/ipd/register/IPD")
+        self.driver.get(f"{self.base_url}ipd/register/IPD")
         self.wait.until(EC.presence_of_element_located((By.NAME, "searchOPDId")))
         logging.info("Navigated to IPD Registration page")
         # self.__take_screenshot("IPD_REGISTER_PAGE")  # Uncomment for debugging
@@ -236,6 +195,8 @@ class IPDRegistration(unittest.TestCase):
         # Wait a bit for any modals to close
         time.sleep(2)
         
+        # Only responses to this save count; earlier lookups can carry other patients' ids
+        self.network.mark()
         # Try to click the submit button, with fallback to JavaScript click if intercepted
         try:
             submit_btn = self.wait.until(EC.element_to_be_clickable((By.ID, "submitNewButton")))
@@ -268,61 +229,36 @@ class IPDRegistration(unittest.TestCase):
         """
         bed_selected = False
         
-        # Approach 1: Try to find available beds (not occupied)
+        # Approaches 1-3: free-bed locators, raced in one lookup with the historically best first
+        candidates = [
+            (By.XPATH, "//div[@id='bedContainers']//div[contains(@class, 'panel-heading') and not(contains(@class, 'occupied'))]"),
+            (By.XPATH, "//div[@id='bedContainers']//*[@data-id and not(contains(@class, 'occupied'))]"),
+            (By.XPATH, "//div[@id='bedContainers']//div[@class='panel-heading' and not(contains(@class, 'occupied'))]")
+        ]
         try:
-            available_beds = self.driver.find_elements(By.XPATH, "//div[@id='bedContainers']//div[contains(@class, 'panel-heading') and not(contains(@class, 'occupied'))]")
-            if available_beds:
-                # Click the first available bed
-                self.driver.execute_script("arguments[0].click();", available_beds[0])
-                bed_name = available_beds[0].text.strip()
-                logging.info(f"Selected first available bed (approach 1): {bed_name}")
+            match = self.locators.find(self.ready, "ipd_registration.available_bed", candidates, timeout=0, visible=False, required=False)
+            if match:
+                bed_element, locator = match
+                self.driver.execute_script("arguments[0].click();", bed_element)
+                bed_name = bed_element.text.strip()
+                logging.info(f"Selected available bed: {bed_name} (locator: {locator[1]})")
                 bed_selected = True
-                # self.__take_screenshot("BED_SELECTED_APPROACH1")  # Uncomment for debugging
+                # self.__take_screenshot("BED_SELECTED")  # Uncomment for debugging
         except Exception as e:
-            logging.warning(f"Approach 1 for bed selection failed: {str(e)}")
+            logging.warning(f"Available bed lookup failed: {str(e)}")
         
-        # Approach 2: If no available beds found, try to find any bed with data-id
+        # Fallback: no free bed found, select the first bed with a data-id
         if not bed_selected:
             try:
                 bed_elements = self.driver.find_elements(By.XPATH, "//div[@id='bedContainers']//*[@data-id]")
-                if bed_elements:
-                    # Try to find one that's not occupied
-                    for bed_element in bed_elements:
-                        try:
-                            class_attr = bed_element.get_attribute("class")
-                            if class_attr and "occupied" not in class_attr:
-                                self.driver.execute_script("arguments[0].click();", bed_element)
-                                bed_name = bed_element.text.strip()
-                                logging.info(f"Selected available bed (approach 2): {bed_name}")
-                                bed_selected = True
-                                # self.__take_screenshot("BED_SELECTED_APPROACH2")  # Uncomment for debugging
-                                break
-                        except:
-                            continue
-                    
-                    # If no non-occupied beds found, just select the first one
-                    if not bed_selected and bed_elements:
-                        self.driver.execute_script("arguments[0].click();", bed_elements[0])
-                        bed_name = bed_elements[0].text.strip()
-                        logging.info(f"Selected first bed (approach 2 fallback): {bed_name}")
-                        bed_selected = True
-                        # self.__take_screenshot("BED_SELECTED_APPROACH2_FALLBACK")  # Uncomment for debugging
-            except Exception as e:
-                logging.warning(f"Approach 2 for bed selection failed: {str(e)}")
-        
-        # Approach 3: Try to find beds by specific data attributes
-        if not bed_selected:
-            try:
-                # Try to find beds with class 'panel-heading' that are not occupied
-                bed_elements = self.driver.find_elements(By.XPATH, "//div[@id='bedContainers']//div[@class='panel-heading' and not(contains(@class, 'occupied'))]")
                 if bed_elements:
                     self.driver.execute_script("arguments[0].click();", bed_elements[0])
                     bed_name = bed_elements[0].text.strip()
-                    logging.info(f"Selected available bed (approach 3): {bed_name}")
+                    logging.info(f"Selected first bed (fallback): {bed_name}")
                     bed_selected = True
-                    # self.__take_screenshot("BED_SELECTED_APPROACH3")  # Uncomment for debugging
+                    # self.__take_screenshot("BED_SELECTED_FALLBACK")  # Uncomment for debugging
             except Exception as e:
-                logging.warning(f"Approach 3 for bed selection failed: {str(e)}")
+                logging.warning(f"Fallback bed selection failed: {str(e)}")
         
         # If no approach worked, log error but continue
         if not bed_selected:
@@ -335,20 +271,31 @@ class IPDRegistration(unittest.TestCase):
         """
         Handle success notification after IPD form submission and capture IPD ID.
         """
+        # From the intercepted deposit slip popup, without the wait for its window (HMIS_SUPPRESS_POPUPS=1)
+        slip = self.popups.ids("ipd_id")
+        if slip:
+            self.ipd_id = slip["ipd_id"]
+            return
+
+        # IPD ID straight from the admission response (or the deposit slip URL) when network capture is on
+        captured = self.network.wait_for("ipd_id")
+        if captured:
+            self.ipd_id = captured["ipd_id"]
+            self.network.close_popups(self.driver.current_window_handle)
+            logging.info(f"Captured IPD ID {self.ipd_id} from the network")
+            return
+
         try:
-            # Wait for the deposit slip print window to open
-            time.sleep(8)  # Give more time for the print window to open
+            # Wait for the deposit slip print window to open (up to 8s, returns as soon as it does;
+            # none opens while popups are intercepted)
+            original_window = self.driver.current_window_handle
+            slip_window = self.ready.new_window([original_window], timeout=self.popups.window_timeout(8), required=False)
             
             # Check if a new window opened (deposit slip print window)
-            if len(self.driver.window_handles) > 1:
-                # Store original window handle
-                original_window = self.driver.current_window_handle
-                
+            if slip_window:
                 # Switch to the new window (deposit slip print window)
-                for window_handle in self.driver.window_handles:
-                    if window_handle != original_window:
-                        self.driver.switch_to.window(window_handle)
-                        break
+                self.driver.switch_to.window(slip_window)
+                self.ready.dom_ready(required=False)
                 
                 logging.info("Switched to deposit slip print window")
                 # self.__take_screenshot("DEPOSIT_SLIP_PRINT_WINDOW")  # Uncomment for debugging
@@ -470,36 +417,36 @@ class IPDRegistration(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes. Commented out by default to avoid overhead.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
 
     def tearDown(self):
         """
-        Test-level teardown: Save patient ID and IPD ID to a separate JSON file if captured.
-        Each patient ID is stored in a file named as ID.json
+        Test-level teardown: Save patient ID and IPD ID to the artifact journal if captured, then release the patient lease.
         """
+        self.screenshots.end_test(self)
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}_ipd.json")
             data = {
                 "patient_id": self.patient_id,
                 "ipd_id": self.ipd_id if self.ipd_id else "unknown",
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(json_file, "w") as f:
-                json.dump(data, f, indent=4)
-            logging.info(f"Patient/IPD information saved to {json_file}")
+            ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+            ArtifactRegistry.shared().record("ipd_id", data["ipd_id"], os.path.basename(report_dir), **data)
+            ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+            logging.info("Patient/IPD information saved to the artifact journal")
+        if self.patient_lease:
+            self.patient_lease.release()
+            self.patient_lease = None
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
+        cls.popups.uninstall()
         logging.info("Cleaning up browser windows...")
         try:
             while len(cls.driver.window_handles) > 1:
@@ -508,6 +455,7 @@ class IPDRegistration(unittest.TestCase):
             cls.driver.switch_to.window(cls.driver.window_handles[0])
         finally:
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 
 if __name__ == "__main__":
@@ -7,8 +7,6 @@ import time
 import logging
 import unittest
 import json
-import glob
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -16,6 +14,13 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.action_chains import ActionChains
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.wait_conditions import ReadyWait
+from utilities.select2 import Select2Picker
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
+from utilities.popup_interceptor import PopupInterceptor
 
 # Folder configuration
 screenshot_dir = os.path.join("screenshots", "ipd_combined")
@@ -54,19 +59,17 @@ class IpdRegisterAndBilling(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
+        cls.popups = PopupInterceptor(cls.driver)
+        cls.popups.install()
         cls.wait = WebDriverWait(cls.driver, 20)
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.select2 = Select2Picker(cls.driver, cls.ready)
         cls.base_url = cls.config["base_url"]
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
@@ -75,51 +78,22 @@ class IpdRegisterAndBilling(unittest.TestCase):
         """
         Test-level setup: Navigate to base URL, login, and initialize patient_id, bill_no and bill_id.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
+        self.popups.reset()
         self.patient_id = None
         self.ipd_id = None
         self.bill_no = None
         self.bill_id = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
-
     def __get_latest_patient_id(self):
         """
-        Get the latest patient ID from the patient_ids folder.
-        Returns the most recent patient ID based on file modification time.
+        Get the latest patient ID from the artifact registry.
+        Returns the patient ID most recently recorded by any of the workflows below.
         """
         try:
-            # Get all JSON files from patient_ids folder
-            json_files = glob.glob(os.path.join("reports", "opd_combined", "patient_ids", "*.json"))
-            
-            if not json_files:
-                raise ValueError("No patient ID files found in patient_ids folder")
-            
-            # Find the most recent file
-            latest_file = max(json_files, key=os.path.getmtime)
-            
-            # Extract patient ID from filename (e.g., "2134.json" -> "2134")
-            filename = os.path.basename(latest_file)
-            patient_id = os.path.splitext(filename)[0]
-            
-            logging.info(f"Latest patient ID found: {patient_id}")
-            return patient_id
-            
+            return ArtifactRegistry.shared().latest_patient_id([
+                "opd_combined"
+            ])
         except Exception as e:
             logging.error(f"Error getting latest patient ID: {str(e)}")
             raise
@@ -145,7 +119,7 @@ class IpdRegisterAndBilling(unittest.TestCase):
         Perform IPD registration process using existing patient ID
         """
         # Navigate directly to IPD registration page
-        self.driver.get("http://lunivacare.ddns.net:8080/himsnew/ipd/register/IPD")
+        self.driver.get(f"{self.base_url}ipd/register/IPD")
         self.wait.until(EC.presence_of_element_located((By.NAME, "searchOPDId")))
         logging.info("Navigated to IPD Registration page")
         self.__take_screenshot("IPD_REGISTER_PAGE")
@@ -271,14 +245,14 @@ class IpdRegisterAndBilling(unittest.TestCase):
         try:
             # Navigate to IPD Billing with timeout handling
             try:
-                self.driver.get("http://lunivacare.ddns.net:8080/himsnew/bill/createBill?bt=IPD")
+                self.driver.get(f"{self.base_url}bill/createBill?bt=IPD")
                 self.wait.until(EC.presence_of_element_located((By.ID, "ipdId")))
                 logging.info("Navigated to IPD Billing page")
                 self.__take_screenshot("IPD_BILLING_PAGE")
             except Exception as e:
                 logging.error(f"Error navigating to IPD billing page: {str(e)}")
                 # Try alternative navigation
-                self.driver.get("http://lunivacare.ddns.net:8080/himsnew/bill/createBill?bt=IPD")
+                self.driver.get(f"{self.base_url}bill/createBill?bt=IPD")
                 time.sleep(5)  # Wait for page to load
                 logging.info("Retried navigation to IPD Billing page")
                 self.__take_screenshot("IPD_BILLING_PAGE_RETRY")
@@ -332,45 +306,7 @@ class IpdRegisterAndBilling(unittest.TestCase):
         
         for test_name in tests:
             try:
-                # Locate and open the test dropdown
-                try:
-                    dropdown = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"))
-                    )
-                except TimeoutException:
-                    dropdown = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"))
-                    )
-                dropdown.click()
-                logging.info(f"Test dropdown clicked for {test_name}")
-                self.__take_screenshot(f"TEST_DROPDOWN_CLICKED_{test_name.replace(' ', '_')}")
-                time.sleep(0.5)
-
-                # Locate search input
-                try:
-                    search_input = short_wait.until(EC.presence_of_element_located(
-                        (By.XPATH, "//div[contains(@class, 'select2-drop-active')]//input"))
-                    )
-                except TimeoutException:
-                    search_input = short_wait.until(EC.presence_of_element_located(
-                        (By.XPATH, "//div[contains(@class, 'select2-drop-active')]//input"))
-                    )
-                
-                search_input.clear()
-                search_input.send_keys(test_name)
-                logging.info(f"Entered {test_name} in search")
-                time.sleep(1)
-
-                # Select the test
-                try:
-                    test_option = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, f"//div[contains(@class, 'select2-result-label') and contains(text(), '{test_name}')]"))
-                    )
-                except TimeoutException:
-                    test_option = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, f"//div[contains(text(), '{test_name}')]"))
-                    )
-                test_option.click()
+                self.select2.pick((By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"), test_name, required=True)
                 logging.info(f"{test_name} selected")
                 self.__take_screenshot(f"{test_name.replace(' ', '_')}_SELECTED")
 
@@ -438,20 +374,24 @@ class IpdRegisterAndBilling(unittest.TestCase):
         """
         Handle success notification after IPD form submission and capture IPD ID.
         """
+        # From the intercepted deposit slip popup, without the wait for its window (HMIS_SUPPRESS_POPUPS=1)
+        slip = self.popups.ids("ipd_id")
+        if slip:
+            self.ipd_id = slip["ipd_id"]
+            self.__take_screenshot("IPD_ID_CAPTURED_FROM_SLIP")
+            return
+
         try:
-            # Wait for the deposit slip print window to open
-            time.sleep(8)  # Give more time for the print window to open
+            # Wait for the deposit slip print window to open (up to 8s, returns as soon as it does;
+            # none opens while popups are intercepted)
+            original_window = self.driver.current_window_handle
+            slip_window = self.ready.new_window([original_window], timeout=self.popups.window_timeout(8), required=False)
             
             # Check if a new window opened (deposit slip print window)
-            if len(self.driver.window_handles) > 1:
-                # Store original window handle
-                original_window = self.driver.current_window_handle
-                
+            if slip_window:
                 # Switch to the new window (deposit slip print window)
-                for window_handle in self.driver.window_handles:
-                    if window_handle != original_window:
-                        self.driver.switch_to.window(window_handle)
-                        break
+                self.driver.switch_to.window(slip_window)
+                self.ready.dom_ready(required=False)
                 
                 logging.info("Switched to deposit slip print window")
                 self.__take_screenshot("DEPOSIT_SLIP_PRINT_WINDOW")
@@ -905,33 +845,27 @@ class IpdRegisterAndBilling(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
 
     def tearDown(self):
         """
-        Test-level teardown: Save patient ID, IPD ID and bill info to separate JSON files if captured.
+        Test-level teardown: Save patient ID, IPD ID and bill info to the artifact journal if captured.
         """
+        self.screenshots.end_test(self)
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}_ipd.json")
             data = {
                 "patient_id": self.patient_id,
                 "ipd_id": self.ipd_id if self.ipd_id else "unknown",
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(json_file, "w") as f:
-                json.dump(data, f, indent=4)
-            logging.info(f"Patient/IPD information saved to {json_file}")
+            ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+            ArtifactRegistry.shared().record("ipd_id", data["ipd_id"], os.path.basename(report_dir), **data)
+            ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+            logging.info("Patient/IPD information saved to the artifact journal")
 
         if self.bill_no:
-            # Save bill information directly in bill_nos folder
-            bill_json_file = os.path.join(bill_nos_dir, f"{self.bill_no.zfill(8)}.json")
             bill_data = {
                 "bill_no": self.bill_no.zfill(8),
                 "bill_id": self.bill_id if hasattr(self, 'bill_id') and self.bill_id else "unknown",
@@ -939,15 +873,17 @@ class IpdRegisterAndBilling(unittest.TestCase):
                 "ipd_id": self.ipd_id if self.ipd_id else "unknown",
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(bill_json_file, "w") as f:
-                json.dump(bill_data, f, indent=4)
-            logging.info(f"Bill information saved to {bill_json_file}")
+            ArtifactRegistry.shared().record("bill_no", bill_data["bill_no"], os.path.basename(report_dir), **bill_data)
+            ArtifactJournal.shared().append("bill_no", os.path.basename(report_dir), **bill_data)
+            logging.info("Bill information saved to the artifact journal")
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
+        cls.popups.uninstall()
         logging.info("Cleaning up browser windows...")
         try:
             # Ensure we have time to write XML before cleanup
@@ -984,6 +920,7 @@ class IpdRegisterAndBilling(unittest.TestCase):
             except Exception:
                 pass
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 
 if __name__ == "__main__":
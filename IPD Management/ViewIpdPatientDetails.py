@@ -5,13 +5,16 @@ import logging
 import unittest
 import json
 import xmlrunner
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
 
 
 # Folder configuration
@@ -29,16 +32,12 @@ class ViewIPDPatientDetails(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
         cls.wait = WebDriverWait(cls.driver, 20)
         cls.base_url = cls.config["base_url"]
         cls.valid_username = cls.config["username"]
@@ -48,26 +47,9 @@ class ViewIPDPatientDetails(unittest.TestCase):
         """
         Test-level setup: Navigate to base URL, login, and initialize patient_id.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
         self.patient_id = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
-
     def test_view_ipd_patient_details(self):
         """
         Main test method: Navigate to IPD patient view, select a patient, and perform automation on patient details page.
@@ -75,7 +57,7 @@ class ViewIPDPatientDetails(unittest.TestCase):
         # Navigate to View IPD Patients page (assuming similar structure to EMR)
         self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
         self.wait.until(EC.element_to_be_clickable(
-            (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/patient/view_ipd']"))).click()
+            (By.XPATH, f"//a[@href='{self.base_url}patient/view_ipd']"))).click()
         logging.info("Navigated to View IPD Patients page")
         self.__take_screenshot("VIEW_IPD_PATIENTS_PAGE")
 
@@ -160,34 +142,30 @@ class ViewIPDPatientDetails(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
 
     def tearDown(self):
         """
-        Test-level teardown: Save patient ID to a separate JSON file if captured.
+        Test-level teardown: Save patient ID to the artifact journal if captured.
         """
+        self.screenshots.end_test(self)
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}.json")
             data = {
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(json_file, "w") as f:
-                json.dump(data, f, indent=4)
-            logging.info(f"Patient ID {self.patient_id} saved to {json_file}")
+            ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+            ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+            logging.info(f"Patient ID {self.patient_id} saved to the artifact journal")
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
         logging.info("Cleaning up browser windows...")
         try:
             while len(cls.driver.window_handles) > 1:
@@ -196,6 +174,7 @@ class ViewIPDPatientDetails(unittest.TestCase):
             cls.driver.switch_to.window(cls.driver.window_handles[0])
         finally:
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 
 if __name__ == "__main__":
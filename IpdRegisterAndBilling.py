@@ -5,7 +5,6 @@ import time
 import logging
 import unittest
 import json
-import glob
 from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
@@ -14,6 +13,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.action_chains import ActionChains
 from utilities.config_loader import ConfigLoader
+from utilities.artifact_registry import ArtifactRegistry
 
 # Folder configuration
 screenshot_dir = os.path.join("screenshots", "ipd_combined")
@@ -98,26 +98,13 @@ class IpdRegisterAndBilling(unittest.TestCase):
 
     def __get_latest_patient_id(self):
         """
-        Get the latest patient ID from the patient_ids folder.
-        Returns the most recent patient ID based on file modification time.
+        Get the latest patient ID from the artifact registry.
+        Returns the patient ID most recently recorded by any of the workflows below.
         """
         try:
-            # Get all JSON files from patient_ids folder
-            json_files = glob.glob(os.path.join("reports", "opd_combined", "patient_ids", "*.json"))
-            
-            if not json_files:
-                raise ValueError("No patient ID files found in patient_ids folder")
-            
-            # Find the most recent file
-            latest_file = max(json_files, key=os.path.getmtime)
-            
-            # Extract patient ID from filename (e.g., "2134.json" -> "2134")
-            filename = os.path.basename(latest_file)
-            patient_id = os.path.splitext(filename)[0]
-            
-            logging.info(f"Latest patient ID found: {patient_id}")
-            return patient_id
-            
+            return ArtifactRegistry.shared().latest_patient_id([
+                "opd_combined"
+            ])
         except Exception as e:
             logging.error(f"Error getting latest patient ID: {str(e)}")
             raise
@@ -8,13 +8,20 @@ import logging
 import unittest
 import json
 import xmlrunner
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoAlertPresentException
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.wait_conditions import ReadyWait
+from utilities.select2 import Select2Picker
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
+from utilities.network_capture import NetworkCapture
+from utilities.popup_interceptor import PopupInterceptor
 import xml.etree.ElementTree as ET
 
 # Folder configuration
@@ -85,22 +92,19 @@ class OPDRegistration(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        # Disable print dialog
-        chrome_options.add_argument("--kiosk-printing")
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging", kiosk_printing=True)
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
+        cls.network = NetworkCapture(cls.driver)
+        cls.popups = PopupInterceptor(cls.driver)
+        cls.popups.install()
         cls.wait = WebDriverWait(cls.driver, 20)
         cls.short_wait = WebDriverWait(cls.driver, 5)
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.select2 = Select2Picker(cls.driver, cls.ready)
         cls.base_url = cls.config["base_url"]
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
@@ -109,26 +113,10 @@ class OPDRegistration(unittest.TestCase):
         """
         Test-level setup: Navigate to base URL, login, and initialize patient_id.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
+        self.popups.reset()
         self.patient_id = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
-
     def test_opd_registration(self):
         """
         Test method: Perform OPD registration.
@@ -144,7 +132,7 @@ class OPDRegistration(unittest.TestCase):
             # Navigate to OPD Registration
             self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
             self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/ipd/register/OPD']"))).click()
+                (By.XPATH, f"//a[@href='{self.base_url}ipd/register/OPD']"))).click()
             logging.info("Navigated to OPD Registration page")
             self.__take_screenshot("OPD_REGISTER_PAGE")
 
@@ -164,11 +152,7 @@ class OPDRegistration(unittest.TestCase):
             logging.info("Entered personal details")
 
             # Select address
-            self.driver.find_element(By.XPATH, "//span[@id='select2-current-address-container']").click()
-            search_field = self.wait.until(EC.presence_of_element_located((By.XPATH, "//input[@class='select2-search__field']")))
-            search_field.send_keys("Kathmandu")
-            self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//li[contains(@class, 'select2-results__option') and contains(text(), 'Kathmandu')]"))).click()
+            self.select2.pick((By.ID, "select2-current-address-container"), "Kathmandu", required=True)
             logging.info("Selected address")
             self.__take_screenshot("FORM_FILLED")
 
@@ -179,6 +163,8 @@ class OPDRegistration(unittest.TestCase):
             # Capture URL before submission
             pre_submit_url = self.driver.current_url
             logging.info(f"Pre-submit URL: {pre_submit_url}")
+            # Only responses to this save count; earlier lookups can carry other patients' ids
+            self.network.mark()
             submit_btn.click()
             logging.info("Form submitted")
             self.__take_screenshot("FORM_SUBMITTED")
@@ -193,11 +179,11 @@ class OPDRegistration(unittest.TestCase):
             # Wait for Print Sticker button and take screenshot
             try:
                 print_sticker_btn = self.wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "printStikerBtn")))
-                self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", print_sticker_btn)
-                time.sleep(1)
-                sticker_screenshot_path = os.path.join(screenshot_dir, f"PRINT_STICKER_BTN_{self.patient_id}_{time.strftime('%Y%m%d_%H%M%S')}.png")
-                print_sticker_btn.screenshot(sticker_screenshot_path)
-                logging.info(f"Print Sticker button screenshot saved: {sticker_screenshot_path}")
+                # Under the on_failure policy capture() takes no shot, so skip the scroll and pause
+                if self.screenshots.policy != "on_failure":
+                    self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", print_sticker_btn)
+                    time.sleep(1)
+                self.screenshots.capture(f"PRINT_STICKER_BTN_{self.patient_id}", self._testMethodName, element=print_sticker_btn)
             except Exception as e:
                 logging.warning(f"Could not take screenshot of Print Sticker button: {str(e)}")
                 self.__take_screenshot("PRINT_STICKER_ERROR")
@@ -256,6 +242,18 @@ class OPDRegistration(unittest.TestCase):
         Handles unexpected navigation to chrome://print/.
         """
         main_window = self.driver.current_window_handle
+        # From the intercepted sticker popup URL (HMIS_SUPPRESS_POPUPS=1)
+        printed = self.popups.ids("patient_id")
+        if printed:
+            return printed["patient_id"]
+
+        # Straight from the register response (or the sticker URL) when network capture is on
+        captured = self.network.wait_for("patient_id")
+        if captured:
+            self.network.close_popups(main_window)
+            logging.info(f"Captured Patient ID {captured['patient_id']} from the network")
+            return captured["patient_id"]
+
         current_url = self.driver.current_url
         logging.info(f"Current URL after submission: {current_url}")
 
@@ -412,64 +410,30 @@ class OPDRegistration(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        self.screenshots.capture(name, self._testMethodName)
 
     def tearDown(self):
         """
-        Test-level teardown: Save patient ID to JSON file if captured.
+        Test-level teardown: Record the patient ID in the artifact journal if captured.
         """
+        self.screenshots.end_test(self)
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}.json")
             data = {
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
             try:
-                # Verify directory exists and is writable
-                if not os.path.exists(patient_json_dir):
-                    os.makedirs(patient_json_dir, exist_ok=True)
-                    logging.info(f"Created directory: {patient_json_dir}")
-                
-                # Check write permissions
-                if not os.access(patient_json_dir, os.W_OK):
-                    logging.error(f"No write permission for directory: {patient_json_dir}")
-                    raise PermissionError(f"No write permission for directory: {patient_json_dir}")
-                
-                # Write JSON file
-                with open(json_file, "w", encoding='utf-8') as f:
-                    json.dump(data, f, indent=4)
-                
-                # Verify file was created
-                if os.path.exists(json_file):
-                    logging.info(f"Patient ID {self.patient_id} saved to {json_file}")
-                    # Read back to confirm content
-                    with open(json_file, "r", encoding='utf-8') as f:
-                        saved_data = json.load(f)
-                        if saved_data["patient_id"] == self.patient_id:
-                            logging.info(f"Verified Patient ID {self.patient_id} in {json_file}")
-                        else:
-                            logging.error(f"Patient ID mismatch in {json_file}. Expected {self.patient_id}, found {saved_data['patient_id']}")
-                else:
-                    logging.error(f"Failed to create JSON file: {json_file}")
-                    raise IOError(f"Failed to create JSON file: {json_file}")
-                
-            except PermissionError as e:
-                logging.error(f"Permission error saving patient ID to {json_file}: {str(e)}")
-                self.__take_screenshot("JSON_SAVE_PERMISSION_ERROR")
-                raise
-            except IOError as e:
-                logging.error(f"IO error saving patient ID to {json_file}: {str(e)}")
+                ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+                ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+                logging.info(f"Patient ID {self.patient_id} saved to the artifact journal")
+            except OSError as e:
+                logging.error(f"IO error saving patient ID to the artifact journal: {str(e)}")
                 self.__take_screenshot("JSON_SAVE_IO_ERROR")
                 raise
             except Exception as e:
-                logging.error(f"Unexpected error saving patient ID to {json_file}: {str(e)}")
+                logging.error(f"Unexpected error saving patient ID to the artifact journal: {str(e)}")
                 self.__take_screenshot("JSON_SAVE_ERROR")
                 raise
 
@@ -478,6 +442,8 @@ class OPDRegistration(unittest.TestCase):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
+        cls.popups.uninstall()
         logging.info("Cleaning up browser windows...")
         try:
             # Ensure we have time to write XML and JSON before cleanup
@@ -514,6 +480,7 @@ class OPDRegistration(unittest.TestCase):
             except Exception:
                 pass
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -8,15 +8,23 @@ import logging
 import unittest
 import json
 import xmlrunner
-import glob
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.action_chains import ActionChains
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.wait_conditions import ReadyWait, TracedWait
+from utilities.timing import Tracer, traced
+from utilities.select2 import Select2Picker
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
+from utilities.network_capture import NetworkCapture
+from utilities.popup_interceptor import PopupInterceptor
+from utilities.http_client import HmisHttpClient
+from utilities.bill_capture import BillCapture
 import xml.etree.ElementTree as ET
 
 
@@ -25,6 +33,7 @@ screenshot_dir = os.path.join("screenshots", "opd_combined")
 report_dir = os.path.join("reports", "opd_combined")
 patient_json_dir = os.path.join(report_dir, "patient_ids")
 bill_nos_dir = os.path.join(report_dir, "bill_nos")
+trace_dir = os.path.join(report_dir, "traces")
 os.makedirs(screenshot_dir, exist_ok=True)
 os.makedirs(report_dir, exist_ok=True)
 os.makedirs(patient_json_dir, exist_ok=True)
@@ -118,75 +127,52 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """
-        Class-level setup: Load config, initialize WebDriver with options, and set up wait and credentials.
+        Class-level setup: Load config, borrow a logged-in WebDriver session from the pool, and set up wait and credentials.
         """
         cls.config = ConfigLoader.load_credentials("staging")
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
-        cls.wait = WebDriverWait(cls.driver, 20)
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
+        cls.network = NetworkCapture(cls.driver)
+        cls.popups = PopupInterceptor(cls.driver)
+        cls.popups.install()
+        cls.wait = TracedWait(cls.driver, 20)
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.select2 = Select2Picker(cls.driver, cls.ready)
         cls.base_url = cls.config["base_url"]
+        cls.http = HmisHttpClient(cls.driver, cls.base_url)
+        cls.bill_capture = BillCapture(cls.driver, cls.popups, cls.network, cls.http)
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
 
     def setUp(self):
         """
-        Test-level setup: Navigate to base URL, login, and initialize patient_id, bill_no and bill_id.
+        Test-level setup: Start the timing trace, navigate to base URL, login, and initialize patient_id, bill_no and bill_id.
         """
-        self.driver.get(self.base_url)
-        self.__login()
+        self.tracer = Tracer(self.id())
+        self.wait.tracer = self.tracer
+        self.ready.tracer = self.tracer
+        with self.tracer.span("ensure_logged_in"):
+            self.session_pool.ensure_logged_in(self.driver)
+        self.popups.reset()
         self.patient_id = None
         self.bill_no = None
         self.bill_id = None
 
-    def __login(self):
-        """
-        Private method to handle login with explicit waits and logging.
-        """
-        username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-        password_field = self.driver.find_element(By.NAME, "Password")
-        login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-        username_field.clear()
-        password_field.clear()
-        username_field.send_keys(self.valid_username)
-        password_field.send_keys(self.valid_password)
-        login_btn.click()
-        self.wait.until(EC.url_contains("/dashboard"))
-        logging.info("Login successful")
-        self.__take_screenshot("LOGIN_SUCCESS")
-
     def __get_latest_patient_id(self):
         """
-        Get the latest patient ID from the patient_ids folder.
-        Returns the most recent patient ID based on file modification time.
+        Get the latest patient ID from the artifact registry.
+        Returns the patient ID most recently recorded by any of the workflows below.
         """
         try:
-            # Get all JSON files from patient_ids folder
-            json_files = glob.glob(os.path.join(patient_json_dir, "*.json"))
-            
-            if not json_files:
-                raise ValueError("No patient ID files found in patient_ids folder")
-            
-            # Find the most recent file
-            latest_file = max(json_files, key=os.path.getmtime)
-            
-            # Extract patient ID from filename (e.g., "2134.json" -> "2134")
-            filename = os.path.basename(latest_file)
-            patient_id = os.path.splitext(filename)[0]
-            
-            logging.info(f"Latest patient ID found: {patient_id}")
-            return patient_id
-            
+            return ArtifactRegistry.shared().latest_patient_id([
+                "opd_combined"
+            ])
         except Exception as e:
             logging.error(f"Error getting latest patient ID: {str(e)}")
             raise
 
+    @traced(category="test")
     def test_combined_opd_registration_and_billing(self):
         """
         Combined test method: 
@@ -203,13 +189,14 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
         logging.info("Starting OPD Billing...")
         self.__perform_opd_billing()
 
+    @traced()
     def __perform_opd_registration(self):
         """
         Perform OPD registration process
         """
         self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
         self.wait.until(EC.element_to_be_clickable(
-            (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/ipd/register/OPD']"))).click()
+            (By.XPATH, f"//a[@href='{self.base_url}ipd/register/OPD']"))).click()
         logging.info("Navigated to OPD Registration page")
         self.__take_screenshot("OPD_REGISTER_PAGE")
 
@@ -226,11 +213,7 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
         self.driver.find_element(By.ID, "age").send_keys("30")
         logging.info("Entered personal details")
 
-        self.driver.find_element(By.XPATH, "//span[@id='select2-current-address-container']").click()
-        search_field = self.wait.until(EC.presence_of_element_located((By.XPATH, "//input[@class='select2-search__field']")))
-        search_field.send_keys("Kathmandu")
-        self.wait.until(EC.element_to_be_clickable(
-            (By.XPATH, "//li[contains(@class, 'select2-results__option') and contains(text(), 'Kathmandu')]"))).click()
+        self.select2.pick((By.ID, "select2-current-address-container"), "Kathmandu", required=True)
         logging.info("Selected address")
         self.__take_screenshot("FORM_FILLED")
 
@@ -245,15 +228,16 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
         # Wait for Print Sticker button to be clickable and take screenshot
         try:
             print_sticker_btn = self.wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "printStikerBtn")))
-            self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", print_sticker_btn)
-            time.sleep(1)  # Extended pause to ensure visibility
-            sticker_screenshot_path = os.path.join(screenshot_dir, f"PRINT_STICKER_BTN_{self.patient_id}_{time.strftime('%Y%m%d_%H%M%S')}.png")
-            print_sticker_btn.screenshot(sticker_screenshot_path)
-            logging.info(f"Print Sticker button screenshot saved: {sticker_screenshot_path}")
+            # Under the on_failure policy capture() takes no shot, so skip the scroll and pause
+            if self.screenshots.policy != "on_failure":
+                self.driver.execute_script("arguments[0].scrollIntoView({behavior: 'smooth', block: 'center'});", print_sticker_btn)
+                time.sleep(1)  # Extended pause to ensure visibility
+            self.screenshots.capture(f"PRINT_STICKER_BTN_{self.patient_id}", self._testMethodName, element=print_sticker_btn)
         except Exception as e:
             logging.warning(f"Could not take screenshot of Print Sticker button: {str(e)}")
             self.__take_screenshot("PRINT_STICKER_ERROR")
 
+    @traced()
     def __perform_opd_billing(self):
         """
         Perform OPD billing process using the registered patient ID
@@ -262,7 +246,7 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             # Navigate to OPD Billing
             self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
             billing_link = self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/bill/createBill?bt=OPD']")))
+                (By.XPATH, f"//a[@href='{self.base_url}bill/createBill?bt=OPD']")))
             billing_link.click()
             logging.info("Navigated to OPD Billing page")
             self.__take_screenshot("OPD_BILLING_PAGE")
@@ -316,54 +300,17 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             logging.error(f"Billing test failed: {str(e)}")
             raise
 
+    @traced()
     def __select_test(self):
         """
         Select CBC and ABO & Rh Factor tests from dropdown and handle performedByModal
         """
-        short_wait = WebDriverWait(self.driver, 5)
+        short_wait = TracedWait(self.driver, 5, tracer=self.tracer)
         tests = ["Complete Blood Cell Count", "ABO & Rh Factor"]
         
         for test_name in tests:
             try:
-                # Locate and open the test dropdown
-                try:
-                    dropdown = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"))
-                    )
-                except TimeoutException:
-                    dropdown = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"))
-                    )
-                dropdown.click()
-                logging.info(f"Test dropdown clicked for {test_name}")
-                self.__take_screenshot(f"TEST_DROPDOWN_CLICKED_{test_name.replace(' ', '_')}")
-                time.sleep(0.5)
-
-                # Locate search input
-                try:
-                    search_input = short_wait.until(EC.presence_of_element_located(
-                        (By.XPATH, "//div[contains(@class, 'select2-drop-active')]//input"))
-                    )
-                except TimeoutException:
-                    search_input = short_wait.until(EC.presence_of_element_located(
-                        (By.XPATH, "//div[contains(@class, 'select2-drop-active')]//input"))
-                    )
-                
-                search_input.clear()
-                search_input.send_keys(test_name)
-                logging.info(f"Entered {test_name} in search")
-                time.sleep(1)
-
-                # Select the test
-                try:
-                    test_option = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, f"//div[contains(@class, 'select2-result-label') and contains(text(), '{test_name}')]"))
-                    )
-                except TimeoutException:
-                    test_option = short_wait.until(EC.element_to_be_clickable(
-                        (By.XPATH, f"//div[contains(text(), '{test_name}')]"))
-                    )
-                test_option.click()
+                self.select2.pick((By.XPATH, "//span[starts-with(@id, 'select2-chosen-')]"), test_name, required=True)
                 logging.info(f"{test_name} selected")
                 self.__take_screenshot(f"{test_name.replace(' ', '_')}_SELECTED")
 
@@ -400,6 +347,7 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
                 logging.error(f"Failed to select {test_name}: {str(e)}")
                 raise
 
+    @traced()
     def __submit_billing_form(self):
         """
         Submit the billing form
@@ -418,6 +366,8 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             )
             time.sleep(0.5)
             
+            # Only responses to this save count; earlier lookups can carry other patients' ids
+            self.network.mark()
             submit_btn.click()
             logging.info("Clicked Submit button to complete the billing process")
             self.__take_screenshot("BILLING_FORM_SUBMITTED")
@@ -427,6 +377,7 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             logging.error(f"Failed to submit billing form: {str(e)}")
             raise
 
+    @traced()
     def __handle_duplicate_patient_modal(self):
         """
         Handle potential duplicate patient modal after entering mobile number.
@@ -436,21 +387,22 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             if self.driver.find_elements(*modal_locator):
                 logging.info("Duplicate patient modal detected")
                 self.__take_screenshot("DUPLICATE_MODAL_PRESENT")
-                proceed_btn = WebDriverWait(self.driver, 3).until(
+                proceed_btn = TracedWait(self.driver, 3, tracer=self.tracer).until(
                     EC.element_to_be_clickable((By.ID, "proceedToRegister")))
                 self.driver.execute_script("arguments[0].click();", proceed_btn)
                 logging.info("Clicked proceed button")
                 self.__take_screenshot("MODAL_HANDLED")
-                WebDriverWait(self.driver, 3).until(EC.invisibility_of_element_located(modal_locator))
+                TracedWait(self.driver, 3, tracer=self.tracer).until(EC.invisibility_of_element_located(modal_locator))
         except TimeoutException:
             logging.info("No duplicate modal present")
 
+    @traced()
     def __handle_success_notification(self):
         """
         Verify success notification after form submission.
         """
         try:
-            notification = WebDriverWait(self.driver, 20).until(
+            notification = TracedWait(self.driver, 20, tracer=self.tracer).until(
                 EC.visibility_of_element_located((By.XPATH,
                     "//div[contains(@class, 'ui-pnotify-container') and contains(@class, 'brighttheme-success')]"
                 ))
@@ -462,7 +414,7 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             try:
                 close_btn = notification.find_element(By.CSS_SELECTOR, ".ui-pnotify-closer")
                 self.driver.execute_script("arguments[0].click();", close_btn)
-                WebDriverWait(self.driver, 5).until(EC.invisibility_of_element_located(notification))
+                TracedWait(self.driver, 5, tracer=self.tracer).until(EC.invisibility_of_element_located(notification))
             except Exception:
                 logging.info("Notification auto-closed or close button not needed")
         except TimeoutException:
@@ -470,27 +422,28 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             logging.error("Success notification not found")
             raise
 
+    @traced()
     def __handle_billing_success_notification(self):
         """
         Handle success notification for billing
         """
         try:
             success_message_locator = (By.XPATH, "//div[contains(@class, 'ui-pnotify-container') and contains(@class, 'brighttheme-success')]")
-            notification = WebDriverWait(self.driver, 20).until(
+            notification = TracedWait(self.driver, 20, tracer=self.tracer).until(
                 EC.visibility_of_element_located(success_message_locator))
             logging.info("Billing success notification detected.")
             self.__take_screenshot("BILLING_SUCCESS_NOTIFICATION")
             return True
         except TimeoutException:
             try:
-                notification = WebDriverWait(self.driver, 10).until(
+                notification = TracedWait(self.driver, 10, tracer=self.tracer).until(
                     EC.visibility_of_element_located((By.XPATH, "//div[contains(@class, 'ui-pnotify-container') or contains(@class, 'alert-success')]")))
                 logging.info("Generic billing success notification detected.")
                 self.__take_screenshot("GENERIC_BILLING_SUCCESS_NOTIFICATION")
                 return True
             except TimeoutException:
                 try:
-                    confirmation = WebDriverWait(self.driver, 5).until(
+                    confirmation = TracedWait(self.driver, 5, tracer=self.tracer).until(
                         EC.visibility_of_element_located((By.XPATH, "//div[contains(text(), 'Success') or contains(text(), 'Bill created')]")))
                     logging.info("Bill creation confirmation detected.")
                     self.__take_screenshot("BILL_CONFIRMATION")
@@ -500,12 +453,13 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
                     logging.warning("No explicit billing success notification found, proceeding with caution")
                     return False
 
+    @traced()
     def __capture_patient_id(self):
         """
         Capture patient ID from either a new window or URL change after submission.
         """
         main_window = self.driver.current_window_handle
-        WebDriverWait(self.driver, 20).until(
+        TracedWait(self.driver, 20, tracer=self.tracer).until(
             lambda d: "create_stiker" in d.current_url or len(d.window_handles) > 1
         )
         if len(self.driver.window_handles) > 1:
@@ -520,11 +474,21 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
         self.__take_screenshot("PATIENT_ID_CAPTURED")
         return patient_id
 
+    @traced()
     def __capture_and_handle_bill_info(self, original_window):
         """
         Capture Bill No from new window and Bill ID from main page by hovering over Print Bill button
         """
-        wait_for_windows = WebDriverWait(self.driver, 20)
+        # Bill No and Bill ID from the intercepted popup, the createBill response or the invoice page
+        # over HTTP, whichever is switched on; otherwise from the invoice window below
+        bill = self.bill_capture.capture(original_window, self.patient_id)
+        if bill:
+            self.bill_no = bill["bill_no"]
+            self.bill_id = bill["bill_id"]
+            return
+
+        # No window will open while popups are intercepted, or if BillCapture already waited for it
+        wait_for_windows = TracedWait(self.driver, self.bill_capture.fallback_window_timeout(20), tracer=self.tracer)
         try:
             # Wait for new window or tab to open
             wait_for_windows.until(lambda d: len(d.window_handles) > 1)
@@ -655,11 +619,12 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             return match.group(1)
         raise ValueError(f"Patient ID not found in URL: {url}")
 
+    @traced()
     def __extract_bill_no_from_invoice(self):
         """Extract bill No from the invoice page."""
         try:
             # Wait for the bill information to load
-            bill_element = WebDriverWait(self.driver, 10).until(
+            bill_element = TracedWait(self.driver, 10, tracer=self.tracer).until(
                 EC.presence_of_element_located((By.XPATH, "//div[contains(text(), 'Bill No:') or contains(strong/text(), 'Bill No:')]"))
             )
             
@@ -698,6 +663,7 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             self.__take_screenshot("BILL_NO_EXTRACTION_ERROR")
             return None
 
+    @traced()
     def __capture_bill_no_fallback(self):
         """Fallback method to capture bill No from current page"""
         try:
@@ -728,15 +694,12 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
 
     def __take_screenshot(self, name):
         """
-        Take a screenshot for debugging purposes.
+        Take a screenshot for debugging purposes; the screenshot policy decides whether it is kept.
         """
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
+        with self.tracer.span("screenshot", "screenshot", screenshot=name):
+            self.screenshots.capture(name, self._testMethodName)
 
+    @traced()
     def __extract_bill_id_from_tooltip(self):
         """
         Extract Bill ID from Print Bill button tooltip
@@ -798,6 +761,7 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             # Try fallback method
             self.__extract_bill_id_from_page_elements()
 
+    @traced()
     def __extract_bill_id_from_page_elements(self):
         """
         Fallback method to extract Bill ID from page elements
@@ -848,36 +812,42 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
 
     def tearDown(self):
         """
-        Test-level teardown: Save patient ID and bill info to separate JSON files if captured.
+        Test-level teardown: Save the timing trace, and patient ID and bill info to the artifact journal if captured.
         """
+        self.screenshots.end_test(self)
+        self.tracer.log_summary()
+        self.tracer.save(trace_dir)
+        self.wait.tracer = None
+        self.ready.tracer = None
+
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}.json")
             data = {
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(json_file, "w") as f:
-                json.dump(data, f, indent=4)
-            logging.info(f"Patient ID {self.patient_id} saved to {json_file}")
+            ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+            ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+            logging.info(f"Patient ID {self.patient_id} saved to the artifact journal")
 
         if self.bill_no:
-            # Save bill information directly in bill_nos folder
-            bill_json_file = os.path.join(bill_nos_dir, f"{self.bill_no.zfill(8)}.json")
             bill_data = {
                 "bill_no": self.bill_no.zfill(8),
                 "bill_id": self.bill_id if hasattr(self, 'bill_id') and self.bill_id else "unknown",
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
-            with open(bill_json_file, "w") as f:
-                json.dump(bill_data, f, indent=4)
-            logging.info(f"Bill information saved to {bill_json_file}")
+            ArtifactRegistry.shared().record("bill_no", bill_data["bill_no"], os.path.basename(report_dir), **bill_data)
+            ArtifactJournal.shared().append("bill_no", os.path.basename(report_dir), **bill_data)
+            logging.info("Bill information saved to the artifact journal")
 
     @classmethod
     def tearDownClass(cls):
         """
         Class-level teardown: Clean up extra browser windows, keeping the main one open.
         """
+        cls.screenshots.close()
+        cls.popups.uninstall()
+        cls.http.close()
         logging.info("Cleaning up browser windows...")
         try:
             # Ensure we have time to write XML before cleanup
@@ -914,6 +884,7 @@ class CombinedOPDRegistrationBilling(unittest.TestCase):
             except Exception:
                 pass
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 
 if __name__ == "__main__":
@@ -8,7 +8,6 @@ import logging
 import unittest
 import json
 import xmlrunner
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -17,6 +16,16 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import TimeoutException, NoAlertPresentException
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.wait_conditions import ReadyWait
+from utilities.select2 import Select2Picker
+from utilities.artifact_registry import ArtifactRegistry
+from utilities.artifact_journal import ArtifactJournal
+from utilities.screenshot_service import ScreenshotService
+from utilities.network_capture import NetworkCapture
+from utilities.popup_interceptor import PopupInterceptor
+from utilities.http_client import HmisHttpClient
+from utilities.bill_capture import BillCapture
 import xml.etree.ElementTree as ET
 
 # Folder configuration
@@ -115,59 +124,34 @@ class ServiceRegistration(unittest.TestCase):
     def setUpClass(cls):
         # Load credentials FIRST
         cls.config = ConfigLoader.load_credentials("staging")
-
-        # THEN initialize browser components
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
-        chrome_options.add_argument("--disable-web-security")
-        chrome_options.add_argument("--disable-site-isolation-trials")
-        chrome_options.add_argument("--kiosk-printing")  # Handle print dialogs
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging", kiosk_printing=True)
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
+        cls.network = NetworkCapture(cls.driver)
+        cls.popups = PopupInterceptor(cls.driver)
+        cls.popups.install()
         # Initialize wait AFTER driver creation
         cls.wait = WebDriverWait(cls.driver, 20)
         cls.short_wait = WebDriverWait(cls.driver, 5)
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.select2 = Select2Picker(cls.driver, cls.ready)
         
         # Set credentials from config
         cls.base_url = cls.config["base_url"]
+        cls.http = HmisHttpClient(cls.driver, cls.base_url)
+        cls.bill_capture = BillCapture(cls.driver, cls.popups, cls.network, cls.http)
         cls.valid_username = cls.config["username"]
         cls.valid_password = cls.config["password"]
 
     def setUp(self):
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
+        self.popups.reset()
         self.patient_id = None
         self.bill_no = None
         self.bill_id = None
 
     def __take_screenshot(self, name):
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
-
-    def __login(self):
-        try:
-            username_field = self.wait.until(EC.presence_of_element_located((By.NAME, "Username")))
-            password_field = self.driver.find_element(By.NAME, "Password")
-            login_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-            username_field.clear()
-            password_field.clear()
-            username_field.send_keys(self.valid_username)
-            password_field.send_keys(self.valid_password)
-            login_btn.click()
-            self.wait.until(EC.url_contains("/dashboard"))
-            logging.info("Login successful")
-            self.__take_screenshot("LOGIN_SUCCESS")
-        except Exception as e:
-            self.__take_screenshot("LOGIN_FAILURE")
-            logging.error(f"Login failed: {str(e)}")
-            raise
+        self.screenshots.capture(name, self._testMethodName)
 
     def test_service_registration(self):
         try:
@@ -178,7 +162,7 @@ class ServiceRegistration(unittest.TestCase):
             # Navigate to Service Registration
             self.wait.until(EC.element_to_be_clickable((By.XPATH, "//li[@id='patient_menu']/a"))).click()
             service_register_link = self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/patient/register']")))
+                (By.XPATH, f"//a[@href='{self.base_url}patient/register']")))
             service_register_link.click()
             logging.info("Navigated to SERVICE Registration page")
             self.__take_screenshot("SERVICE_REGISTER_PAGE")
@@ -207,14 +191,7 @@ class ServiceRegistration(unittest.TestCase):
             logging.info("Entered personal details")
 
             # Handle address selection
-            self.driver.find_element(By.XPATH, "//span[@id='select2-current-address-container']").click()
-            search_field = self.wait.until(EC.presence_of_element_located(
-                (By.XPATH, "//input[@class='select2-search__field']")))
-            search_field.send_keys("Kathmandu")
-            
-            address_option = self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//li[contains(@class, 'select2-results__option') and contains(text(), 'Kathmandu')]")))
-            address_option.click()
+            self.select2.pick((By.ID, "select2-current-address-container"), "Kathmandu", required=True)
             logging.info("Selected address")
             self.__take_screenshot("FORM_FILLED")
 
@@ -293,35 +270,12 @@ class ServiceRegistration(unittest.TestCase):
             logging.info("Doctor selection modal detected")
             self.__take_screenshot("DOCTOR_SELECTION_MODAL")
 
-            select2_container = self.short_wait.until(
+            self.short_wait.until(
                 EC.element_to_be_clickable((By.ID, "select2-docLists-container"))
             )
-
-            aria_expanded = select2_container.get_attribute("aria-expanded")
-            if aria_expanded == "false":
-                logging.info("Opening the doctor selection dropdown")
-                select2_container.click()
-
-            dropdown_visible = self.short_wait.until(
-                EC.visibility_of_element_located((By.CLASS_NAME, "select2-results__options"))
-            )
-            logging.info("Dropdown is open, proceeding to search for the doctor")
-
-            search_field = self.short_wait.until(
-                EC.element_to_be_clickable((By.CLASS_NAME, "select2-search__field"))
-            )
-            search_field.clear()
             doctor_name = "Dr. Usha Karki"
-            search_field.send_keys(doctor_name)
-            time.sleep(1)
-
-            doctor_option = self.short_wait.until(
-                EC.element_to_be_clickable(
-                    (By.XPATH, f"//li[contains(@class, 'select2-results__option') and contains(text(), '{doctor_name}')]")
-                )
-            )
             logging.info(f"Selecting doctor: {doctor_name}")
-            doctor_option.click()
+            self.select2.pick((By.ID, "select2-docLists-container"), doctor_name, required=True)
 
             self.short_wait.until(
                 EC.text_to_be_present_in_element((By.ID, "select2-docLists-container"), doctor_name)
@@ -434,6 +388,8 @@ class ServiceRegistration(unittest.TestCase):
                 final_submit_button
             )
             time.sleep(0.5)
+            # Only responses to this save count; earlier lookups can carry other patients' ids
+            self.network.mark()
             final_submit_button.click()
             logging.info("Clicked final Submit button to complete the billing process")
 
@@ -511,9 +467,18 @@ class ServiceRegistration(unittest.TestCase):
 
     def __capture_and_handle_bill_info(self, original_window):
         """Capture Bill No from new window and Bill ID from main page by hovering over Print Bill button"""
+        # Bill No and Bill ID from the intercepted popup, the createBill response or the invoice page
+        # over HTTP, whichever is switched on; otherwise from the invoice window below
+        bill = self.bill_capture.capture(original_window, self.patient_id)
+        if bill:
+            self.bill_no = bill["bill_no"]
+            self.bill_id = bill["bill_id"]
+            self.patient_id = self.patient_id or bill["patient_id"]
+            return
+
         try:
-            # Check for new windows
-            self.short_wait.until(lambda d: len(d.window_handles) > 1)
+            # Check for new windows; none will open while popups are intercepted, or if BillCapture already waited for it
+            WebDriverWait(self.driver, self.bill_capture.fallback_window_timeout(5)).until(lambda d: len(d.window_handles) > 1)
             logging.info(f"Number of windows: {len(self.driver.window_handles)}")
             
             invoice_window = None
@@ -804,22 +769,21 @@ class ServiceRegistration(unittest.TestCase):
 
     def tearDown(self):
         """Handle patient ID and bill info in reports"""
+        self.screenshots.end_test(self)
         if self.patient_id:
-            json_file = os.path.join(patient_json_dir, f"{self.patient_id}.json")
             data = {
                 "patient_id": self.patient_id,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
             try:
-                with open(json_file, "w", encoding='utf-8') as f:
-                    json.dump(data, f, indent=4)
-                logging.info(f"Patient ID {self.patient_id} saved to {json_file}")
+                ArtifactRegistry.shared().record("patient_id", self.patient_id, os.path.basename(report_dir), **data)
+                ArtifactJournal.shared().append("patient_id", os.path.basename(report_dir), **data)
+                logging.info(f"Patient ID {self.patient_id} saved to the artifact journal")
             except Exception as e:
-                logging.error(f"Error saving patient ID to {json_file}: {str(e)}")
+                logging.error(f"Error saving patient ID to the artifact journal: {str(e)}")
                 self.__take_screenshot("PATIENT_ID_SAVE_ERROR")
 
         if self.bill_no and self.bill_no != "unknown" and self.bill_no != "error":
-            bill_json_file = os.path.join(bill_nos_dir, f"{self.bill_no.zfill(8)}.json")
             bill_data = {
                 "bill_no": self.bill_no.zfill(8),
                 "bill_id": self.bill_id if hasattr(self, 'bill_id') and self.bill_id else "unknown",
@@ -827,15 +791,18 @@ class ServiceRegistration(unittest.TestCase):
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
             try:
-                with open(bill_json_file, "w", encoding='utf-8') as f:
-                    json.dump(bill_data, f, indent=4)
-                logging.info(f"Bill information saved to {bill_json_file}")
+                ArtifactRegistry.shared().record("bill_no", bill_data["bill_no"], os.path.basename(report_dir), **bill_data)
+                ArtifactJournal.shared().append("bill_no", os.path.basename(report_dir), **bill_data)
+                logging.info("Bill information saved to the artifact journal")
             except Exception as e:
-                logging.error(f"Error saving bill info to {bill_json_file}: {str(e)}")
+                logging.error(f"Error saving bill info to the artifact journal: {str(e)}")
                 self.__take_screenshot("BILL_INFO_SAVE_ERROR")
 
     @classmethod
     def tearDownClass(cls):
+        cls.screenshots.close()
+        cls.popups.uninstall()
+        cls.http.close()
         logging.info("Cleaning up browser windows...")
         try:
             time.sleep(2)
@@ -867,6 +834,7 @@ class ServiceRegistration(unittest.TestCase):
             except Exception:
                 pass
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
 if __name__ == "__main__":
     unittest.main(
@@ -4,7 +4,6 @@ import time
 import logging
 import unittest
 import xmlrunner
-from selenium import webdriver
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -16,6 +15,10 @@ import os
 # Add the parent directory to sys.path to allow imports from sibling packages
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utilities.config_loader import ConfigLoader
+from utilities.session_pool import SessionPool
+from utilities.wait_conditions import ReadyWait
+from utilities.select2 import Select2Picker
+from utilities.screenshot_service import ScreenshotService
 import xml.etree.ElementTree as ET  # To store Patient Id in XML report
 
 
@@ -34,23 +37,13 @@ class OPDRegistration(unittest.TestCase):
     def setUpClass(cls):
         # Load credentials FIRST
         cls.config = ConfigLoader.load_credentials("staging")
-
-        # THEN initialize browser components
-        chrome_options = webdriver.ChromeOptions()
-        chrome_options.add_argument("--disable-popup-blocking")
-        chrome_options.add_argument("--enable-javascript")
-
-        # Corrected experimental options:
-        chrome_options.add_experimental_option("detach", True)
-        chrome_options.add_experimental_option(
-            "excludeSwitches",
-            ["disable-popup-blocking"]
-        )
-
-        cls.driver = webdriver.Chrome(options=chrome_options)
-        cls.driver.maximize_window()
+        cls.session_pool = SessionPool.shared("staging")
+        cls.driver = cls.session_pool.acquire()
+        cls.screenshots = ScreenshotService(cls.driver, screenshot_dir)
         # Initialize wait AFTER driver creation
         cls.wait = WebDriverWait(cls.driver, 20)  # <--- THIS WAS MISSING
+        cls.ready = ReadyWait(cls.driver, timeout=20)
+        cls.select2 = Select2Picker(cls.driver, cls.ready)
 
         # Set credentials from config
         cls.base_url = cls.config["base_url"]
@@ -58,40 +51,11 @@ class OPDRegistration(unittest.TestCase):
         cls.valid_password = cls.config["password"]
 
     def setUp(self):
-        self.driver.get(self.base_url)
-        self.__login()
+        self.session_pool.ensure_logged_in(self.driver)
         self.patient_id = None
 
     def __take_screenshot(self, name):
-        filename = f"{screenshot_dir}/{name}_{time.strftime('%Y%m%d_%H%M%S')}.png"
-        try:
-            self.driver.save_screenshot(filename)
-            logging.info(f"Screenshot saved: {filename}")
-        except Exception as e:
-            logging.error(f"Error taking screenshot: {str(e)}")
-
-    def __login(self):
-        try:
-            self.driver.find_element(By.NAME, "Username").clear()
-            self.driver.find_element(By.NAME, "Password").clear()
-
-            username_field = self.wait.until(
-                EC.presence_of_element_located((By.NAME, "Username")))
-            password_field = self.driver.find_element(By.NAME, "Password")
-            login_btn = self.driver.find_element(
-                By.CSS_SELECTOR, "button[type='submit']")
-
-            username_field.send_keys(self.valid_username)
-            password_field.send_keys(self.valid_password)
-            login_btn.click()
-
-            self.wait.until(EC.url_contains("/dashboard"))
-            logging.info("Login successful")
-            # self.__take_screenshot("LOGIN_SUCCESS")
-        except Exception as e:
-            # self.__take_screenshot("LOGIN_FAILURE")
-            logging.error(f"Login failed: {str(e)}")
-            raise
+        self.screenshots.capture(name, self._testMethodName)
 
     def test_opd_registration(self):
         try:
@@ -100,7 +64,7 @@ class OPDRegistration(unittest.TestCase):
                 (By.XPATH, "//li[@id='patient_menu']/a"))).click()
 
             opd_register_link = self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//a[@href='http://lunivacare.ddns.net:8080/himsnew/ipd/register/OPD']")))
+                (By.XPATH, f"//a[@href='{self.base_url}ipd/register/OPD']")))
             opd_register_link.click()
             logging.info("Navigated to OPD Registration page")
             # self.__take_screenshot("OPD_REGISTER_PAGE")
@@ -128,15 +92,7 @@ class OPDRegistration(unittest.TestCase):
             logging.info("Entered personal details")
 
             # Handle address selection
-            self.driver.find_element(
-                By.XPATH, "//span[@id='select2-current-address-container']").click()
-            search_field = self.wait.until(EC.presence_of_element_located(
-                (By.XPATH, "//input[@class='select2-search__field']")))
-            search_field.send_keys("Kathmandu")
-
-            address_option = self.wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//li[contains(@class, 'select2-results__option') and contains(text(), 'Kathmandu')]")))
-            address_option.click()
+            self.select2.pick((By.ID, "select2-current-address-container"), "Kathmandu", required=True)
             logging.info("Selected address")
             # self.__take_screenshot("FORM_FILLED")
 
@@ -373,6 +329,7 @@ class OPDRegistration(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        cls.screenshots.close()
         logging.info("Cleaning up browser windows...")
         try:
             # Close all windows except the main one
@@ -385,9 +342,11 @@ class OPDRegistration(unittest.TestCase):
             logging.error(f"Error during cleanup: {str(e)}")
         finally:
             logging.info("Cleanup completed. Main window remains open.")
+        cls.session_pool.release(cls.driver)
 
     def tearDown(self):
         """Handle patient ID in reports safely"""
+        self.screenshots.end_test(self)
         if hasattr(self, 'patient_id'):
             # Include Patient ID in XML test report
             if hasattr(self, "_outcome"):
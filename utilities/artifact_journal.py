@@ -0,0 +1,189 @@
+import os
+import sys
+# Make the project root importable when run as "python utilities/artifact_journal.py"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import glob
+import time
+import uuid
+import atexit
+import logging
+import argparse
+import threading
+
+reports_root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reports")
+journal_dir = os.path.join(reports_root, "journal")
+
+# Legacy per-file layout: reports/<workflow>/<folder>/<id>.json for each artifact kind
+LEGACY_LAYOUT = {
+    "patient_id": ("patient_ids", "patient_id"),
+    "bill_no": ("bill_nos", "bill_no"),
+    "collected_bill": ("collected_bills", "bill_no")
+}
+
+
+class ArtifactJournal:
+    """
+    Append-only JSONL journal of the artifacts the workflows produce (patient ids, bill
+    numbers, collected bills), replacing one pretty-printed JSON file per id.
+    Every entry is one line written with a single O_APPEND write, so parallel workers can
+    share the file without interleaving. The file is fsync'ed at most every
+    HMIS_JOURNAL_FSYNC_SECONDS (5 by default) and on exit, and rotated to
+    artifacts.<timestamp>.jsonl once it grows past HMIS_JOURNAL_MAX_BYTES (50 MB).
+    `export_legacy` (or --export) writes the old reports/<workflow>/patient_ids/<id>.json
+    files back out for tools that still read them.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, directory=journal_dir, max_bytes=None, fsync_interval=None):
+        self.directory = directory
+        self.journal_file = os.path.join(directory, "artifacts.jsonl")
+        self.max_bytes = max_bytes or int(os.environ.get("HMIS_JOURNAL_MAX_BYTES", 50 * 1024 * 1024))
+        self.fsync_interval = fsync_interval if fsync_interval is not None else float(os.environ.get("HMIS_JOURNAL_FSYNC_SECONDS", 5))
+        self._lock = threading.Lock()
+        self._fd = None
+        self._last_sync = time.time()
+        self._unsynced = False
+
+    @classmethod
+    def shared(cls):
+        """
+        Return the process-wide journal under reports/journal, flushed on exit.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                atexit.register(cls._shared.close)
+            return cls._shared
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._fd = os.open(self.journal_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _current(self):
+        """
+        The open journal descriptor, reopened when another process rotated the file away.
+        """
+        if self._fd is not None:
+            try:
+                if os.fstat(self._fd).st_ino == os.stat(self.journal_file).st_ino:
+                    return self._fd
+            except FileNotFoundError:
+                pass
+            self._close_fd()
+        self._open()
+        return self._fd
+
+    def _close_fd(self):
+        if self._fd is not None:
+            if self._unsynced:
+                os.fsync(self._fd)
+                self._unsynced = False
+            os.close(self._fd)
+            self._fd = None
+
+    def _rotate(self):
+        rotated = os.path.join(self.directory, f"artifacts.{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{uuid.uuid4().hex[:6]}.jsonl")
+        try:
+            # Only rotate the file this process has open; another process may have done it already
+            if os.fstat(self._fd).st_ino == os.stat(self.journal_file).st_ino:
+                os.rename(self.journal_file, rotated)
+                logging.info(f"Rotated artifact journal to {rotated}")
+        except FileNotFoundError:
+            pass
+        self._close_fd()
+
+    def append(self, kind, workflow, **fields):
+        """
+        Append one artifact, e.g. append("bill_no", "emr_billing", bill_no=..., bill_id=..., patient_id=..., timestamp=...).
+        """
+        entry = dict(kind=kind, workflow=workflow, pid=os.getpid(), **fields)
+        line = (json.dumps(entry, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            fd = self._current()
+            os.write(fd, line)
+            self._unsynced = True
+            if time.time() - self._last_sync >= self.fsync_interval:
+                os.fsync(fd)
+                self._unsynced = False
+                self._last_sync = time.time()
+            if os.fstat(fd).st_size >= self.max_bytes:
+                self._rotate()
+
+    def flush(self):
+        """
+        fsync everything appended so far.
+        """
+        with self._lock:
+            if self._fd is not None and self._unsynced:
+                os.fsync(self._fd)
+                self._unsynced = False
+                self._last_sync = time.time()
+
+    def close(self):
+        with self._lock:
+            self._close_fd()
+
+    def entries(self):
+        """
+        Yield every journal entry, oldest file first (rotated files, then the current one).
+        """
+        files = sorted(glob.glob(os.path.join(self.directory, "artifacts.*.jsonl")), key=lambda path: (os.path.getmtime(path), path))
+        if os.path.exists(self.journal_file):
+            files.append(self.journal_file)
+        for path in files:
+            with open(path, "r", encoding="utf-8") as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash mid-write
+                        logging.warning(f"Skipping unreadable journal line {path}:{number}")
+
+    def export_legacy(self, reports_dir=reports_root):
+        """
+        Write the journal out in the legacy layout, one pretty-printed file per id:
+        reports/<workflow>/patient_ids/<id>.json (<id>_ipd.json for IPD admissions),
+        bill_nos/<bill_no>.json and collected_bills/<bill_no>.json. Later entries win.
+        Returns the number of files written.
+        """
+        files = {}
+        for entry in self.entries():
+            layout = LEGACY_LAYOUT.get(entry.get("kind"))
+            if layout is None:
+                continue
+            folder, key = layout
+            fields = {name: value for name, value in entry.items() if name not in ("kind", "workflow", "pid")}
+            if not fields.get(key):
+                continue
+            suffix = "_ipd" if entry["kind"] == "patient_id" and "ipd_id" in fields else ""
+            files[os.path.join(reports_dir, entry["workflow"], folder, f"{fields[key]}{suffix}.json")] = fields
+        for path, fields in files.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(fields, f, indent=4)
+        logging.info(f"Exported {len(files)} legacy artifact files to {reports_dir}")
+        return len(files)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or export the HMIS artifact journal.")
+    parser.add_argument("--export", nargs="?", const=reports_root, default=None, metavar="REPORTS_DIR", help="Write the legacy per-id JSON files")
+    parser.add_argument("--tail", type=int, default=None, metavar="N", help="Print the last N journal entries")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    journal = ArtifactJournal()
+    if args.export:
+        journal.export_legacy(os.path.abspath(args.export))
+    if args.tail:
+        for entry in list(journal.entries())[-args.tail:]:
+            print(json.dumps(entry))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+import os
+import sys
+# Make the project root importable when run as "python utilities/artifact_registry.py"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import re
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import argparse
+import threading
+
+reports_root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reports")
+artifact_db_file = os.path.join(reports_root, "artifacts.sqlite3")
+
+# Legacy JSON folders under reports/<workflow>/ and the artifact kind they hold
+LEGACY_FOLDERS = {
+    "patient_ids": "patient_id",
+    "bill_nos": "bill_no",
+    "collected_bills": "collected_bill"
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    workflow TEXT NOT NULL,
+    patient_id TEXT,
+    bill_no TEXT,
+    bill_id TEXT,
+    ipd_id TEXT,
+    data TEXT,
+    created_at REAL NOT NULL,
+    run_id TEXT,
+    source TEXT UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_kind_workflow_created ON artifacts (kind, workflow, created_at);
+CREATE INDEX IF NOT EXISTS idx_artifacts_patient ON artifacts (patient_id);
+CREATE TABLE IF NOT EXISTS registry_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_FIELDS = ("patient_id", "bill_no", "bill_id", "ipd_id")
+
+
+def _parse_timestamp(value, default):
+    """
+    Epoch seconds for a "YYYY-MM-DD HH:MM:SS" timestamp, or `default`.
+    """
+    try:
+        return time.mktime(time.strptime(str(value), "%Y-%m-%d %H:%M:%S"))
+    except (TypeError, ValueError):
+        return default
+
+
+class ArtifactRegistry:
+    """
+    One indexed SQLite store for the artifacts the workflows hand to each other: patient
+    ids, bill nos/ids, IPD ids, payment codes and collected bills, each with the workflow
+    that produced it (the reports/<workflow> folder name), a timestamp and the run id.
+    "Latest patient of these workflows" is one index probe per workflow instead of a
+    glob and stat over every patient_ids folder.
+    The existing reports/*/patient_ids, bill_nos and collected_bills JSON files are
+    imported the first time the registry is opened (or with --import).
+    HMIS_RUN_ID tags the rows of one suite run; by default each process gets its own id.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_file=artifact_db_file, run_id=None, import_legacy=True):
+        self.db_file = db_file
+        self.run_id = run_id or os.environ.get("HMIS_RUN_ID") or f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL lets parallel suite workers read while one of them writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        if import_legacy and self._meta("legacy_imported") is None:
+            self.import_legacy()
+
+    @classmethod
+    def shared(cls):
+        """
+        Return the process-wide registry backed by reports/artifacts.sqlite3.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM registry_meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def record(self, kind, value, workflow, created_at=None, source=None, **fields):
+        """
+        Store one artifact, e.g. record("bill_no", "00001234", "emr_billing", bill_id=..., patient_id=...).
+        Known fields (patient_id, bill_no, bill_id, ipd_id) get their own indexed columns; the
+        full set of fields is kept as JSON. A failure is logged, never raised, so a workflow
+        is not failed by its bookkeeping.
+        """
+        if value in (None, "", "unknown"):
+            return
+        columns = {field: (str(fields[field]) if fields.get(field) not in (None, "", "unknown") else None) for field in _FIELDS}
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO artifacts (kind, value, workflow, patient_id, bill_no, bill_id, ipd_id, data, created_at, run_id, source) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, str(value), workflow, columns["patient_id"], columns["bill_no"], columns["bill_id"], columns["ipd_id"],
+                     json.dumps(fields, default=str), created_at if created_at is not None else time.time(), self.run_id, source)
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Could not record {kind} {value} for {workflow} in {self.db_file}: {str(e)}")
+
+    def latest(self, kind, workflows):
+        """
+        Most recent artifact row of `kind` produced by any of `workflows`, or None.
+        """
+        latest = None
+        with self._lock:
+            for workflow in workflows:
+                row = self._conn.execute(
+                    "SELECT * FROM artifacts WHERE kind = ? AND workflow = ? ORDER BY created_at DESC, id DESC LIMIT 1",
+                    (kind, workflow)
+                ).fetchone()
+                if row is not None and (latest is None or row["created_at"] > latest["created_at"]):
+                    latest = row
+        return dict(latest) if latest is not None else None
+
+    def latest_patient_id(self, workflows):
+        """
+        The newest patient id registered or billed by any of `workflows`.
+        Raises ValueError when none of them has produced one yet.
+        """
+        row = self.latest("patient_id", workflows)
+        if row is None:
+            raise ValueError(f"No patient ID recorded for any of: {', '.join(workflows)}")
+        logging.info(f"Latest patient ID found: {row['value']} (from {row['workflow']}, run {row['run_id']})")
+        return row["value"]
+
+    def find(self, kind, **fields):
+        """
+        All artifacts of `kind` matching the given column values (workflow, patient_id, bill_no, ...), newest first.
+        """
+        clauses, params = ["kind = ?"], [kind]
+        for field, value in fields.items():
+            if field not in _FIELDS + ("workflow", "value", "run_id"):
+                raise ValueError(f"Unknown artifact field: {field}")
+            clauses.append(f"{field} = ?")
+            params.append(str(value))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT * FROM artifacts WHERE {' AND '.join(clauses)} ORDER BY created_at DESC, id DESC", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def import_legacy(self, reports_dir=reports_root):
+        """
+        Import reports/<workflow>/{patient_ids,bill_nos,collected_bills}/*.json. Each file is
+        imported once (keyed by its path), so running this again only picks up new files.
+        Returns the number of artifacts added.
+        """
+        added = 0
+        if os.path.isdir(reports_dir):
+            for workflow in sorted(os.listdir(reports_dir)):
+                for folder, kind in LEGACY_FOLDERS.items():
+                    folder_path = os.path.join(reports_dir, workflow, folder)
+                    if not os.path.isdir(folder_path):
+                        continue
+                    for filename in sorted(os.listdir(folder_path)):
+                        if filename.endswith(".json"):
+                            added += self._import_file(kind, workflow, os.path.join(folder_path, filename))
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO registry_meta (key, value) VALUES ('legacy_imported', ?)", (time.strftime("%Y-%m-%d %H:%M:%S"),))
+            self._conn.commit()
+        if added:
+            logging.info(f"Imported {added} legacy artifacts from {reports_dir} into {self.db_file}")
+        return added
+
+    def _import_file(self, kind, workflow, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                data = {}
+        except Exception:
+            data = {}
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if stem == "patient_ids":
+            # Aggregate list some registrations keep next to the per-patient files
+            return 0
+        # Older files are only named after their id ("2154.json", "2154_ipd.json", "patient_2131_20250812_153200.json")
+        match = re.search(r'\d+', stem)
+        fallback = match.group(0) if match else stem
+        value = data.get("bill_no" if kind == "collected_bill" else kind) or fallback
+        fields = {field: data.get(field) for field in _FIELDS if data.get(field) not in (None, "", "unknown")}
+        if kind == "patient_id":
+            fields["patient_id"] = value
+        with self._lock:
+            # Files written since the registry existed were recorded by their workflow already
+            exists = self._conn.execute("SELECT 1 FROM artifacts WHERE kind = ? AND workflow = ? AND value = ? LIMIT 1", (kind, workflow, str(value))).fetchone()
+        if exists:
+            return 0
+        try:
+            modified = os.path.getmtime(path)
+        except OSError:
+            modified = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO artifacts (kind, value, workflow, patient_id, bill_no, bill_id, ipd_id, data, created_at, run_id, source) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, str(value), workflow, fields.get("patient_id"), fields.get("bill_no"), fields.get("bill_id"), fields.get("ipd_id"),
+                 json.dumps(data, default=str), _parse_timestamp(data.get("timestamp"), modified), "legacy", os.path.relpath(path, os.path.dirname(reports_root)))
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or import the HMIS workflow artifact registry.")
+    parser.add_argument("--import", dest="import_dir", nargs="?", const=reports_root, default=None, help="Import legacy JSON files from a reports folder")
+    parser.add_argument("--latest", nargs="+", metavar="WORKFLOW", help="Print the latest patient id of these workflows")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    registry = ArtifactRegistry(import_legacy=False)
+    if args.import_dir:
+        print(f"{registry.import_legacy(os.path.abspath(args.import_dir))} artifacts imported")
+    if args.latest:
+        print(registry.latest_patient_id(args.latest))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import os
+import logging
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from utilities.network_capture import ids_from_url
+
+
+class BillCapture:
+    """
+    Finds the bill no and bill id of the bill a workflow has just saved without reading the
+    invoice window. It tries, in order:
+    the invoice popup recorded by PopupInterceptor (HMIS_SUPPRESS_POPUPS=1),
+    the createBill response seen by NetworkCapture (HMIS_NETWORK_CAPTURE=1),
+    and the invoice page read over HTTP (HMIS_HTTP_LOOKUPS=1), using the bill id from the
+    URL of the invoice window the save opened (or tried to open, when popups are intercepted).
+    `capture` returns None when none of these is on or all of them fail, and the workflow
+    falls back to reading the invoice window and the Print Bill tooltip itself, waiting for
+    the window no longer than `fallback_window_timeout` says.
+    """
+    def __init__(self, driver, popups, network, http, window_timeout=None):
+        self.driver = driver
+        self.popups = popups
+        self.network = network
+        self.http = http
+        self.window_timeout = window_timeout or float(os.environ.get("HMIS_BILL_WINDOW_TIMEOUT", 20))
+        # Set when the last `capture` already waited the full window timeout without a window
+        self.window_missed = False
+
+    def capture(self, original_window, patient_id=None):
+        """
+        bill_no, bill_id and patient_id (None when unknown) of the bill just saved, or None.
+        Any invoice window found is closed and the driver is back on `original_window`.
+        `patient_id`, if given, is checked against the invoice read over HTTP.
+        """
+        self.window_missed = False
+        invoice = self.popups.ids("bill_no", "bill_id")
+        if invoice:
+            return dict(invoice, patient_id=self.popups.found.get("patient_id"))
+
+        captured = self.network.wait_for("bill_no", "bill_id")
+        if captured:
+            self.network.close_popups(original_window, wait=self.popups.window_timeout(2))
+            logging.info(f"Captured Bill No {captured['bill_no']} and Bill ID {captured['bill_id']} from the network")
+            return dict(captured, patient_id=self.network.captured.get("patient_id"))
+
+        if not self.http.enabled:
+            return None
+        bill_ids = [ids_from_url(url).get("bill_id") for url in self._invoice_urls(original_window)]
+        bill_id = next((bill_id for bill_id in bill_ids if bill_id), None)
+        invoice = self.http.invoice(bill_id) if bill_id else None
+        if not invoice or not invoice["bill_no"]:
+            return None
+        if patient_id and invoice["patient_id"] and invoice["patient_id"] != str(patient_id):
+            logging.warning(f"Invoice {bill_id} is for patient {invoice['patient_id']}, not {patient_id}; using the invoice window")
+            return None
+        self.network.close_popups(original_window, wait=self.popups.window_timeout(2))
+        logging.info(f"Read Bill No {invoice['bill_no']} of Bill ID {bill_id} from its invoice over HTTP")
+        return invoice
+
+    def fallback_window_timeout(self, timeout):
+        """
+        How long the workflow's own fallback should wait for the invoice window: `timeout`
+        seconds, or 0 while popups are intercepted or when `capture` already waited for the
+        window in vain.
+        """
+        return 0 if self.window_missed else self.popups.window_timeout(timeout)
+
+    def _invoice_urls(self, original_window):
+        """
+        URLs of the windows the save opened, empty if none opened in time. Leaves the windows
+        open, for the workflow's own fallback, and switches back to `original_window`.
+        """
+        if self.popups.enabled:
+            # No window opens while popups are intercepted; the URLs were recorded instead
+            return self.popups.opened()
+
+        def loaded_window_urls(driver):
+            urls = []
+            for window_handle in driver.window_handles:
+                if window_handle == original_window:
+                    continue
+                try:
+                    driver.switch_to.window(window_handle)
+                    url = driver.current_url
+                except WebDriverException:
+                    continue
+                # A new window shows about:blank until its page starts loading
+                if url and url != "about:blank" and not url.startswith("devtools://"):
+                    urls.append(url)
+            return urls
+
+        try:
+            return WebDriverWait(self.driver, self.window_timeout).until(loaded_window_urls)
+        except TimeoutException:
+            logging.info("No invoice window opened; using the page fallback")
+            self.window_missed = True
+            return []
+        finally:
+            self.driver.switch_to.window(original_window)
@@ -0,0 +1,110 @@
+import os
+import logging
+from selenium.common.exceptions import WebDriverException
+from utilities.wait_conditions import ReadyWait
+
+# Sets the page length (the largest entry of the length menu unless one is given) and
+# jumps to a page through the DataTables API, answering once the table's draw event
+# fired. Returns null when the table is not a DataTable, so the caller can fall back.
+_SHOW_PAGE_JS = """
+var tableId = arguments[0], page = arguments[1], length = arguments[2], timeoutMs = arguments[3], done = arguments[arguments.length - 1];
+var $ = window.jQuery;
+if (!$ || !$.fn || !$.fn.dataTable || !document.getElementById(tableId) || !$.fn.dataTable.isDataTable('#' + tableId)) { done(null); return; }
+var $table = $('#' + tableId), api = $table.DataTable();
+if (length === null) {
+    var menu = api.settings()[0].aLengthMenu || [];
+    var values = $.isArray(menu[0]) ? menu[0] : menu;
+    length = api.page.len();
+    for (var i = 0; i < values.length; i++) {
+        var value = parseInt(values[i], 10);
+        if (value === -1) { length = -1; break; }
+        if (value > length) { length = value; }
+    }
+}
+function info() {
+    var i = api.page.info();
+    return {page: i.page, pages: i.pages, length: i.length, records: i.recordsDisplay, serverSide: !!i.serverSide};
+}
+var current = api.page.info();
+if (current.length === length && current.page === page) { done(info()); return; }
+var finished = false;
+function finish(result) { if (!finished) { finished = true; done(result); } }
+setTimeout(function() { finish({error: 'Table was not redrawn within ' + timeoutMs + 'ms'}); }, timeoutMs);
+$table.one('draw.dt', function() { finish(info()); });
+if (current.length !== length) { api.page.len(length); }
+api.page(page).draw('page');
+"""
+
+_HAS_NEXT_PAGE_JS = """
+var next = document.getElementById(arguments[0] + '_next');
+return next ? next.className.indexOf('disabled') === -1 : false;
+"""
+
+
+class BillListPager:
+    """
+    Walks the pages of the bill list DataTable (#tbl-bill-list). It sets the largest page
+    length the table offers and moves between pages through the DataTables API, waiting
+    for the draw event instead of reloading the list and sleeping. On pages without
+    DataTables it falls back to loading `...&page=N` and checking the Next button.
+    HMIS_BILL_PAGE_LENGTH forces a page length (e.g. 100, or -1 for all rows).
+    """
+    def __init__(self, driver, ready=None, table_id="tbl-bill-list", page_length=None, timeout=30):
+        self.driver = driver
+        self.ready = ready or ReadyWait(driver, timeout=20)
+        self.table_id = table_id
+        env_length = os.environ.get("HMIS_BILL_PAGE_LENGTH")
+        self.page_length = page_length if page_length is not None else (int(env_length) if env_length else None)
+        self.timeout = timeout
+        self.datatable = None
+
+    def show(self, page_index):
+        """
+        Draw the zero-based page `page_index` at the maximum page length. Returns the
+        DataTables page info ({page, pages, length, records, serverSide}), or None when
+        the table is not a DataTable or did not redraw in time.
+        """
+        try:
+            self.driver.set_script_timeout(self.timeout + 2)
+            info = self.driver.execute_async_script(_SHOW_PAGE_JS, self.table_id, page_index, self.page_length, int(self.timeout * 1000))
+        except WebDriverException as e:
+            logging.warning(f"DataTables paging of #{self.table_id} failed: {str(e)}")
+            return None
+        if info and info.get("error"):
+            logging.warning(f"DataTables paging of #{self.table_id} failed: {info['error']}")
+            return None
+        return info
+
+    def has_next_page(self):
+        return bool(self.driver.execute_script(_HAS_NEXT_PAGE_JS, self.table_id))
+
+    def pages(self, list_url):
+        """
+        Yield 1-based page numbers with that page of the list drawn. The list at `list_url`
+        must already be open for page 1; the caller may navigate away and back between pages.
+        """
+        page_index = 0
+        while True:
+            info = None
+            if self.datatable is not False:
+                info = self.show(page_index)
+                if info is None and self.datatable:
+                    # The list was reloaded and DataTables may not be initialised yet
+                    self.ready.ajax_idle(required=False)
+                    info = self.show(page_index)
+                if self.datatable is None:
+                    self.datatable = info is not None
+                    logging.info(f"Bill list paging via {'DataTables API' if self.datatable else 'page URLs'}")
+            if info is not None:
+                logging.info(f"Showing bill list page {info['page'] + 1} of {info['pages']} ({info['records']} bills, {info['length']} per page)")
+                yield page_index + 1
+                if page_index + 1 >= info["pages"]:
+                    break
+            else:
+                if page_index > 0:
+                    self.driver.get(f"{list_url}&page={page_index + 1}")
+                    self.ready.ajax_idle(required=False)
+                yield page_index + 1
+                if not self.has_next_page():
+                    break
+            page_index += 1
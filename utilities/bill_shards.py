@@ -0,0 +1,292 @@
+import os
+import sys
+# Make the project root importable when run as "python utilities/bill_shards.py"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import time
+import queue
+import logging
+import argparse
+import datetime
+import collections
+import multiprocessing
+from utilities.suite_runner import PROJECT_ROOT, SuiteRunner, WorkflowTask, run_task, worker_setup, worker_teardown
+
+shard_run_dir = os.path.join("reports", "shard_runs")
+# The only collector that reads its shard (HMIS_SHARD) and writes the shard's checkpoint;
+# the due-bill collectors would each work through the whole list
+COLLECTOR_MODULE = os.path.join(PROJECT_ROOT, "EMR Management", "EmrCollectCreditBills.py")
+COLLECTOR_CLASS = "EMRCollectCreditBills"
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def date_shards(from_date, to_date, days=1):
+    """
+    Split the inclusive YYYY-MM-DD range into consecutive (from, to) shards of `days` days.
+    """
+    days = max(1, days)
+    start = datetime.date.fromisoformat(from_date)
+    end = datetime.date.fromisoformat(to_date)
+    shards = []
+    while start <= end:
+        stop = min(end, start + datetime.timedelta(days=days - 1))
+        shards.append((start.isoformat(), stop.isoformat()))
+        start = stop + datetime.timedelta(days=1)
+    return shards
+
+
+class BillShard:
+    """
+    One date-range shard of a sharded collection run, as seen from inside the worker that
+    runs it. Bills are claimed with exclusive-create claim files shared by all workers of
+    the run, so each bill is collected by exactly one worker even if shards overlap or the
+    list ignores the date filter. Collected bills are appended to the shard's result file.
+    """
+    def __init__(self, run_dir, from_date, to_date):
+        self.run_dir = run_dir
+        self.from_date = from_date
+        self.to_date = to_date
+
+    @classmethod
+    def current(cls):
+        """
+        The shard this process was started for (HMIS_SHARD_DIR/HMIS_SHARD), or None.
+        """
+        run_dir = os.environ.get("HMIS_SHARD_DIR")
+        shard = os.environ.get("HMIS_SHARD")
+        if not run_dir or not shard:
+            return None
+        from_date, to_date = shard.split(":")
+        return cls(run_dir, from_date, to_date)
+
+    @property
+    def label(self):
+        return f"{self.from_date}_{self.to_date}"
+
+    def environ(self):
+        """
+        Environment a worker sets before running the collector on this shard.
+        """
+        return {
+            "HMIS_SHARD_DIR": self.run_dir,
+            "HMIS_SHARD": f"{self.from_date}:{self.to_date}",
+            "HMIS_BILL_FROM_DATE": self.from_date,
+            "HMIS_BILL_TO_DATE": self.to_date
+        }
+
+    @property
+    def checkpoint_file(self):
+        return os.path.join(self.run_dir, "checkpoints", f"{self.label}.json")
+
+    def claim(self, bill_key):
+        """
+        Claim a bill for this shard. Returns False if another shard already claimed it.
+        A shard re-running after an interruption keeps its own claims.
+        """
+        claim_dir = os.path.join(self.run_dir, "claims")
+        os.makedirs(claim_dir, exist_ok=True)
+        claim_file = os.path.join(claim_dir, "".join(char if char.isalnum() or char in "._-" else "_" for char in str(bill_key)) + ".claim")
+        try:
+            fd = os.open(claim_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(claim_file, "r", encoding="utf-8") as f:
+                    return f.read().strip() == self.label
+            except OSError:
+                return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(self.label)
+        return True
+
+    def record(self, bill, collected, **details):
+        """
+        Append the outcome for one claimed bill to this shard's result file.
+        """
+        result_dir = os.path.join(self.run_dir, "results")
+        os.makedirs(result_dir, exist_ok=True)
+        entry = dict(bill, shard=self.label, collected=bool(collected), pid=os.getpid(), at=time.strftime("%Y-%m-%d %H:%M:%S"), **details)
+        with open(os.path.join(result_dir, f"{self.label}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+class ShardRunner:
+    """
+    Split a date range into shards and run the bill collector on them with a pool of
+    worker processes, one browser each, then merge the per-shard results into one file.
+    The run's parameters are saved as run.json in its directory, so an interrupted run can
+    be picked up again with `resume`: finished shards are skipped, and the others continue
+    from their checkpoints with the claims already made.
+    """
+    def __init__(self, from_date, to_date, shard_days=1, workers=None, run_dir=None):
+        self.from_date = from_date
+        self.to_date = to_date
+        self.shard_days = shard_days
+        self.shards = date_shards(from_date, to_date, shard_days)
+        self.workers = workers or int(os.environ.get("HMIS_SUITE_WORKERS", min(4, os.cpu_count() or 1)))
+        self.task = WorkflowTask(COLLECTOR_MODULE, COLLECTOR_CLASS)
+        self.run_dir = os.path.abspath(run_dir or os.path.join(shard_run_dir, f"{from_date}_{to_date}_{time.strftime('%Y%m%d_%H%M%S')}"))
+
+    @classmethod
+    def resume(cls, run_dir, workers=None):
+        """
+        A runner for the interrupted run in `run_dir`, with the parameters it was started with.
+        """
+        with open(os.path.join(run_dir, "run.json"), "r", encoding="utf-8") as f:
+            params = json.load(f)
+        return cls(params["from_date"], params["to_date"], params["shard_days"], workers, run_dir)
+
+    def _save_params(self):
+        params = {
+            "from_date": self.from_date,
+            "to_date": self.to_date,
+            "shard_days": self.shard_days
+        }
+        with open(os.path.join(self.run_dir, "run.json"), "w", encoding="utf-8") as f:
+            json.dump(params, f, indent=4)
+
+    def _finished(self, shard):
+        """
+        True if the shard's batch checkpoint says it was collected to the end.
+        """
+        checkpoint_file = BillShard(self.run_dir, *shard).checkpoint_file
+        try:
+            with open(checkpoint_file, "r", encoding="utf-8") as f:
+                return bool(json.load(f).get("finished_at"))
+        except (OSError, ValueError):
+            return False
+
+    def run(self):
+        """
+        Run every shard not finished yet and return the merged result dictionary.
+        """
+        os.makedirs(self.run_dir, exist_ok=True)
+        self._save_params()
+        pending = [shard for shard in self.shards if not self._finished(shard)]
+        if len(pending) < len(self.shards):
+            logging.info(f"Resuming {self.run_dir}: {len(self.shards) - len(pending)} of {len(self.shards)} shards already finished")
+        if not pending:
+            return self.merge([], 0.0)
+        worker_count = max(1, min(self.workers, len(pending)))
+        context = multiprocessing.get_context("spawn")
+        shard_queue = context.Queue()
+        result_queue = context.Queue()
+        for shard in pending:
+            shard_queue.put(shard)
+        for _ in range(worker_count):
+            shard_queue.put(None)
+
+        logging.info(f"Collecting {len(pending)} shards of {self.task.name} on {worker_count} workers into {self.run_dir}")
+        started = time.time()
+        workers = [
+            context.Process(target=_shard_worker_main, args=(worker_id, shard_queue, result_queue, PROJECT_ROOT, self.task.module_path, self.task.class_name, self.run_dir))
+            for worker_id in range(1, worker_count + 1)
+        ]
+        for worker in workers:
+            worker.start()
+
+        runs = []
+        while len(runs) < len(pending):
+            try:
+                runs.append(result_queue.get(timeout=5))
+                last = runs[-1]
+                logging.info(f"[{len(runs)}/{len(pending)}] shard {last['shard']} -> {last['status']} in {last['duration']:.1f}s (worker {last['worker']})")
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    logging.error("All workers exited before every shard reported a result")
+                    break
+        for worker in workers:
+            worker.join()
+
+        finished = {run["shard"] for run in runs}
+        for from_date, to_date in pending:
+            if f"{from_date}_{to_date}" not in finished:
+                run = SuiteRunner._result(self.task.name, 0, "crashed", 0.0, error="Worker exited without reporting")
+                run["shard"] = f"{from_date}_{to_date}"
+                runs.append(run)
+
+        return self.merge(runs, time.time() - started)
+
+    def merge(self, runs, wall_time):
+        """
+        Merge the per-shard result files into collected_bills.json in the run directory.
+        """
+        # Retries append to the same shard file, so the last entry per bill wins
+        latest = {}
+        shards_per_bill = collections.defaultdict(set)
+        result_dir = os.path.join(self.run_dir, "results")
+        for filename in sorted(os.listdir(result_dir)) if os.path.isdir(result_dir) else []:
+            with open(os.path.join(result_dir, filename), "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    bill = json.loads(line)
+                    key = str(bill.get("bill_id") if bill.get("bill_id") not in (None, "unknown") else bill.get("bill_no"))
+                    latest[key] = bill
+                    shards_per_bill[key].add(bill["shard"])
+        bills = list(latest.values())
+        duplicates = sorted(key for key, shards in shards_per_bill.items() if len(shards) > 1)
+        if duplicates:
+            logging.error(f"Bills recorded by more than one shard: {', '.join(duplicates)}")
+        merged = {
+            "workflow": self.task.name,
+            "shards": [f"{from_date}_{to_date}" for from_date, to_date in self.shards],
+            "wall_time": wall_time,
+            "collected": sum(1 for bill in bills if bill.get("collected")),
+            "failed": sum(1 for bill in bills if not bill.get("collected")),
+            "duplicates": duplicates,
+            "runs": runs,
+            "bills": bills
+        }
+        merged_file = os.path.join(self.run_dir, "collected_bills.json")
+        with open(merged_file, "w", encoding="utf-8") as f:
+            json.dump(merged, f, indent=4)
+        logging.info(f"{merged['collected']} bills collected, {merged['failed']} failed in {wall_time:.1f}s; merged results saved to {merged_file}")
+        return merged
+
+
+def _shard_worker_main(worker_id, shard_queue, result_queue, root, module_path, class_name, run_dir):
+    """
+    Worker process loop: run the collector once per shard until the sentinel arrives.
+    """
+    worker_setup(root)
+    # Every shard is settled in one pass; the collector sees HMIS_SHARD and claims its bills
+    os.environ["HMIS_BATCH_COLLECT"] = "1"
+    try:
+        while True:
+            shard = shard_queue.get()
+            if shard is None:
+                break
+            bill_shard = BillShard(run_dir, *shard)
+            os.environ.update(bill_shard.environ())
+            result = run_task(worker_id, module_path, class_name)
+            result["shard"] = bill_shard.label
+            result_queue.put(result)
+    finally:
+        worker_teardown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collect bills over a date range, sharded across parallel browser workers.")
+    parser.add_argument("--from", dest="from_date", help="First bill date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="to_date", help="Last bill date (YYYY-MM-DD)")
+    parser.add_argument("--shard-days", type=int, default=1, help="Days per shard, e.g. 1 (daily) or 7 (weekly)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes (one browser each)")
+    parser.add_argument("--resume", metavar="RUN_DIR", help="Continue an interrupted run (reports/shard_runs/<run>) with its original range")
+    args = parser.parse_args(argv)
+    if not args.resume and not (args.from_date and args.to_date):
+        parser.error("--from and --to are required unless --resume is given")
+
+    # Paths given on the command line are relative to where the command was run
+    run_dir = os.path.abspath(args.resume) if args.resume else None
+    os.chdir(PROJECT_ROOT)
+    if run_dir:
+        runner = ShardRunner.resume(run_dir, args.workers)
+    else:
+        runner = ShardRunner(args.from_date, args.to_date, args.shard_days, args.workers)
+    merged = runner.run()
+    return 0 if not merged["duplicates"] and all(run["status"] == "passed" for run in merged["runs"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+from urllib.parse import urlsplit
+
+bill_watermark_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reports", "bill_watermarks")
+
+
+def _bill_number(bill_id):
+    """
+    Numeric value of a bill id, or None if it has no digits (e.g. "unknown").
+    """
+    digits = re.sub(r'\D', '', str(bill_id or ""))
+    return int(digits) if digits else None
+
+
+def _bill_date(bill_date):
+    """
+    The YYYY-MM-DD part of a bill list date cell, or None.
+    """
+    match = re.search(r'\d{4}-\d{2}-\d{2}', str(bill_date or ""))
+    return match.group(0) if match else None
+
+
+class BillWatermark:
+    """
+    High-water mark for one scanner (credit, due, ...) of one bill list (list=Emergency,
+    list=IPD, ...) on one server: every bill at or below it was seen in a scan and needed
+    no more work from that scanner. Later scans start from its date and skip bills at or
+    below it, so a nightly run only looks at newer bills.
+    Bills still open (credit/due) at scan time stay above the mark and are looked at again.
+    `--full-rescan` on the command line or HMIS_FULL_RESCAN=1 ignores the mark for one run.
+    A frozen watermark (e.g. in a sharded run, where each worker sees one date range)
+    neither filters bills nor moves.
+    """
+    def __init__(self, list_name, scanner, base_url=None, watermark_dir=bill_watermark_dir, full_rescan=None, frozen=False):
+        self.list_name = list_name
+        self.scanner = scanner
+        host = urlsplit(base_url).netloc if base_url else ""
+        safe_name = re.sub(r'[^\w.-]', '_', "_".join(part for part in (host, list_name, scanner) if part))
+        self.watermark_file = os.path.join(watermark_dir, f"{safe_name}.json")
+        self.frozen = frozen
+        self.full_rescan = frozen or (self.full_rescan_requested() if full_rescan is None else full_rescan)
+        self.mark = {} if self.full_rescan else self._load()
+        if frozen:
+            logging.info(f"Bill list '{list_name}' {scanner} watermark is frozen for this run")
+        elif self.full_rescan:
+            logging.info(f"Full {scanner} rescan of bill list '{list_name}', ignoring its watermark")
+        elif self.mark:
+            logging.info(f"Bill list '{list_name}' {scanner} watermark: bill {self.mark.get('bill_id')} on {self.mark.get('bill_date')}")
+
+    @staticmethod
+    def full_rescan_requested(argv=None):
+        argv = sys.argv if argv is None else argv
+        return "--full-rescan" in argv or os.environ.get("HMIS_FULL_RESCAN", "0").lower() in ("1", "true", "yes")
+
+    def _load(self):
+        if not os.path.exists(self.watermark_file):
+            return {}
+        try:
+            with open(self.watermark_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logging.warning(f"Could not read bill watermark {self.watermark_file}: {str(e)}")
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.watermark_file), exist_ok=True)
+            # Write to a temp file first so an interrupted run never leaves a half-written watermark
+            temp_file = f"{self.watermark_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self.mark, f, indent=4)
+            os.replace(temp_file, self.watermark_file)
+        except Exception as e:
+            logging.error(f"Could not save bill watermark {self.watermark_file}: {str(e)}")
+
+    def is_new(self, bill_id):
+        """
+        True if the bill is above the watermark (bills without a numeric id always are).
+        """
+        number = _bill_number(bill_id)
+        mark = self.mark.get("bill_id")
+        return mark is None or number is None or number > mark
+
+    def date_range(self, default_from, default_to):
+        """
+        From/To dates for the bill list filter: HMIS_BILL_FROM_DATE/HMIS_BILL_TO_DATE if set,
+        otherwise from the watermark's date to today, otherwise the given defaults.
+        """
+        from_date = os.environ.get("HMIS_BILL_FROM_DATE")
+        to_date = os.environ.get("HMIS_BILL_TO_DATE")
+        if not from_date and self.mark.get("bill_date"):
+            from_date = self.mark["bill_date"]
+            to_date = to_date or max(time.strftime("%Y-%m-%d"), from_date)
+        return from_date or default_from, to_date or default_to
+
+    def advance(self, scanned, still_open):
+        """
+        Move the mark after a scan. `scanned` and `still_open` are (bill_id, bill_date) pairs
+        for every bill read and for the bills that still need work (e.g. credit/due ones).
+        The mark stops just below the oldest open bill so it is scanned again next time.
+        """
+        scanned = [(_bill_number(bill_id), _bill_date(bill_date)) for bill_id, bill_date in scanned]
+        scanned = [(number, day) for number, day in scanned if number is not None]
+        open_bills = [(_bill_number(bill_id), _bill_date(bill_date)) for bill_id, bill_date in still_open]
+        open_bills = [(number, day) for number, day in open_bills if number is not None]
+        if self.frozen or not scanned:
+            return
+        if open_bills:
+            number, day = min(open_bills)
+            number -= 1
+        else:
+            number, day = max(scanned)
+        previous = self.mark.get("bill_id")
+        if previous is not None and number <= previous:
+            return
+        self.mark = {
+            "list": self.list_name,
+            "scanner": self.scanner,
+            "bill_id": number,
+            "bill_date": day or self.mark.get("bill_date"),
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        self._save()
+        logging.info(f"Bill list '{self.list_name}' {self.scanner} watermark moved to bill {number} on {self.mark['bill_date']}")
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import logging
+
+
+class CollectionCheckpoint:
+    """
+    Progress file for batch bill collection. The batch stores the bills it planned to
+    collect (from one bill list snapshot) and marks each one done as it goes, so an
+    interrupted run resumes with the remaining bills instead of rescanning the list.
+    HMIS_BATCH_COLLECT=1 switches the collectors to batch mode.
+    """
+    def __init__(self, checkpoint_file, key="bill_id", fallback_key="bill_no", max_attempts=3):
+        self.checkpoint_file = checkpoint_file
+        self.key = key
+        self.fallback_key = fallback_key
+        self.max_attempts = max_attempts
+        self.state = self._load()
+
+    @staticmethod
+    def batch_enabled():
+        return os.environ.get("HMIS_BATCH_COLLECT", "0").lower() in ("1", "true", "yes")
+
+    def _load(self):
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        try:
+            with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            logging.warning(f"Could not read batch checkpoint {self.checkpoint_file}: {str(e)}")
+            return None
+        if state.get("finished_at"):
+            return None
+        return state
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.checkpoint_file) or ".", exist_ok=True)
+            # Write to a temp file first so an interrupted run never leaves a half-written checkpoint
+            temp_file = f"{self.checkpoint_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=4)
+            os.replace(temp_file, self.checkpoint_file)
+        except Exception as e:
+            logging.error(f"Could not save batch checkpoint {self.checkpoint_file}: {str(e)}")
+
+    def resumable(self):
+        """
+        True if an unfinished batch with bills left to collect was found.
+        """
+        return self.state is not None and bool(self.pending())
+
+    def start(self, bills):
+        """
+        Begin a new batch over `bills` (dicts carrying the key field).
+        """
+        self.state = {"started_at": time.strftime("%Y-%m-%d %H:%M:%S"), "finished_at": None, "bills": list(bills), "done": {}, "failed": {}}
+        self._save()
+        logging.info(f"Started batch of {len(self.state['bills'])} bills, checkpoint {self.checkpoint_file}")
+
+    def bill_key(self, bill):
+        """
+        The key a bill is tracked under: its id, or its bill no when the list showed no id
+        (TableSnapshot records those as "unknown", which would lump them together).
+        """
+        value = bill.get(self.key)
+        if value in (None, "", "unknown"):
+            value = bill.get(self.fallback_key)
+        return str(value)
+
+    def pending(self):
+        """
+        Bills that are neither done nor out of attempts, in planned order.
+        """
+        if self.state is None:
+            return []
+        return [
+            bill for bill in self.state["bills"]
+            if self.bill_key(bill) not in self.state["done"]
+            and self.state["failed"].get(self.bill_key(bill), {}).get("attempts", 0) < self.max_attempts
+        ]
+
+    def mark_done(self, bill, **details):
+        self.state["done"][self.bill_key(bill)] = dict(details, at=time.strftime("%Y-%m-%d %H:%M:%S"))
+        self.state["failed"].pop(self.bill_key(bill), None)
+        self._save()
+
+    def mark_failed(self, bill, error):
+        entry = self.state["failed"].setdefault(self.bill_key(bill), {"attempts": 0})
+        entry["attempts"] += 1
+        entry["error"] = str(error)[:500]
+        self._save()
+
+    def finish(self):
+        """
+        Close the batch; the next run starts from a fresh bill list snapshot.
+        """
+        self.state["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        self._save()
+        logging.info(f"Batch finished: {len(self.state['done'])} collected, {len(self.state['failed'])} failed of {len(self.state['bills'])}")
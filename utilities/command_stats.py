@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import logging
+import threading
+
+command_stats_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reports", "command_stats")
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000]
+
+
+class CommandStats:
+    """
+    Counts the WebDriver commands (HTTP round-trips to chromedriver) a test sends, by
+    command type, with a latency histogram. It wraps the driver's command executor
+    between attach() and detach(), so it works on pooled sessions shared across tests.
+    """
+    def __init__(self, driver, name=""):
+        self.driver = driver
+        self.name = name
+        self.counts = {}
+        self.latency = {}
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._original_execute = None
+
+    @staticmethod
+    def budget_from_env(default=None):
+        """
+        Command budget from HMIS_COMMAND_BUDGET (0 or unset means no budget).
+        """
+        budget = int(os.environ.get("HMIS_COMMAND_BUDGET", "0") or 0)
+        return budget or default
+
+    def attach(self):
+        """
+        Start counting commands sent through the driver. Returns self.
+        """
+        if self._executor is not None:
+            return self
+        executor = self.driver.command_executor
+        original_execute = executor.execute
+
+        def execute(command, params):
+            started = time.perf_counter()
+            try:
+                return original_execute(command, params)
+            finally:
+                self._record(command, time.perf_counter() - started)
+
+        executor.execute = execute
+        self._executor = executor
+        self._original_execute = original_execute
+        self.started = time.time()
+        return self
+
+    def detach(self):
+        """
+        Stop counting and restore the driver's own command executor.
+        """
+        if self._executor is None:
+            return self
+        self._executor.execute = self._original_execute
+        self._executor = None
+        self.finished = time.time()
+        return self
+
+    def __enter__(self):
+        return self.attach()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.detach()
+
+    def _record(self, command, elapsed):
+        elapsed_ms = elapsed * 1000
+        bucket = next((index for index, limit in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms < limit), len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            self.counts[command] = self.counts.get(command, 0) + 1
+            self.latency[command] = self.latency.get(command, 0.0) + elapsed
+            self.histogram[bucket] += 1
+
+    def total(self):
+        with self._lock:
+            return sum(self.counts.values())
+
+    def total_latency(self):
+        with self._lock:
+            return sum(self.latency.values())
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.latency.clear()
+            self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def to_dict(self):
+        with self._lock:
+            commands = {
+                command: {"count": count, "total_s": round(self.latency[command], 4), "avg_ms": round(1000 * self.latency[command] / count, 2)}
+                for command, count in sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+            }
+            labels = [f"<{limit}ms" for limit in LATENCY_BUCKETS_MS] + [f">={LATENCY_BUCKETS_MS[-1]}ms"]
+            histogram = dict(zip(labels, self.histogram))
+        return {
+            "test": self.name,
+            "total_commands": sum(command["count"] for command in commands.values()),
+            "total_latency_s": round(sum(command["total_s"] for command in commands.values()), 4),
+            "commands": commands,
+            "latency_histogram": histogram
+        }
+
+    def log_summary(self):
+        """
+        Log command counts by type and the latency histogram.
+        """
+        stats = self.to_dict()
+        logging.info("=" * 80)
+        logging.info(f"WebDriver commands for {self.name}: {stats['total_commands']} round-trips, {stats['total_latency_s']:.2f}s")
+        for command, entry in stats["commands"].items():
+            logging.info(f"{command:<40} {entry['count']:>7} {entry['total_s']:>9.2f}s {entry['avg_ms']:>8.1f}ms avg")
+        logging.info("Latency histogram: " + ", ".join(f"{label}: {count}" for label, count in stats["latency_histogram"].items()))
+        logging.info("=" * 80)
+
+    def save(self, stats_dir=command_stats_dir):
+        """
+        Save the statistics as JSON under `stats_dir` and return the file path.
+        """
+        os.makedirs(stats_dir, exist_ok=True)
+        safe_name = "".join(char if char.isalnum() or char in "._-" else "_" for char in self.name.split(".")[-1]) or "commands"
+        stats_file = os.path.join(stats_dir, f"{safe_name}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            with open(stats_file, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, indent=4)
+            logging.info(f"Command statistics saved to {stats_file}")
+        except Exception as e:
+            logging.error(f"Error saving command statistics to {stats_file}: {str(e)}")
+        return stats_file
+
+    def assert_within(self, budget):
+        """
+        Raise AssertionError if more than `budget` commands were sent (no-op when budget is None).
+        """
+        if budget is None:
+            return
+        total = self.total()
+        if total > budget:
+            top = ", ".join(f"{command}={count}" for command, count in sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:5])
+            raise AssertionError(f"{self.name} sent {total} WebDriver commands, over the budget of {budget} ({top})")
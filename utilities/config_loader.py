@@ -5,6 +5,19 @@ class ConfigLoader:
     """
     A class to load configuration from JSON files
     """
+    @staticmethod
+    def apply_overrides(config: dict):
+        """
+        Apply environment overrides to an environment's config. HMIS_BASE_URL points
+        every workflow at another server (e.g. utilities/stub_server.py); base_url
+        always ends with a slash so workflows can append paths to it.
+        """
+        config = dict(config)
+        base_url = os.environ.get("HMIS_BASE_URL") or config.get("base_url")
+        if base_url:
+            config["base_url"] = base_url.rstrip("/") + "/"
+        return config
+
     @staticmethod
     def load_credentials(environment: str = "staging"):
         """Handle path resolution properly"""
@@ -15,7 +28,7 @@ class ConfigLoader:
         try:
             with open(config_path, "r") as f:
                 config = json.load(f)
-                return config[environment]
+                return ConfigLoader.apply_overrides(config[environment])
         except FileNotFoundError:
             raise RuntimeError(f"Missing config file at: {config_path}")
         except KeyError:
@@ -48,7 +61,7 @@ class ConfigLoader:
         Get credentials for the specified environment
         """
         if environment in self.config_data:
-            return self.config_data[environment]
+            return self.apply_overrides(self.config_data[environment])
         else:
             raise ValueError(f"Environment '{environment}' not found in configuration")
     
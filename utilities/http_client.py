@@ -0,0 +1,206 @@
+import os
+import re
+import logging
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from utilities.table_snapshot import RowControl, TableRow
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    # Without requests every lookup returns None and the workflows stay on the UI path
+    requests = None
+
+
+def lookups_enabled():
+    return os.environ.get("HMIS_HTTP_LOOKUPS", "").lower() in ("1", "true", "yes", "on")
+
+
+class _TableParser(HTMLParser):
+    """
+    Collects the <tbody> rows of the first table whose class contains "table", in the same
+    shape TableSnapshot reads them from the DOM: cell texts, data-* attributes and the
+    links/buttons of each row.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._depth = 0
+        self._done = False
+        self._body = -1
+        self._row = None
+        self._cell = None
+        self._control = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self._done:
+            return
+        if tag == "table":
+            if self._depth or "table" in (attrs.get("class") or "").split():
+                self._depth += 1
+            return
+        if self._depth != 1:
+            return
+        if tag == "tbody":
+            self._body += 1
+        elif tag == "tr" and self._body >= 0:
+            self._row = {"body": self._body, "cls": attrs.get("class") or "", "cells": [], "controls": [],
+                         "attrs": {name: value or "" for name, value in attrs.items() if name.startswith("data-")}}
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = []
+        elif tag in ("a", "button") and self._row is not None:
+            self._control = {"tag": tag, "text": [], "href": attrs.get("href") or "", "cls": attrs.get("class") or ""}
+
+    def handle_endtag(self, tag):
+        if self._done or not self._depth:
+            return
+        if tag == "table":
+            self._depth -= 1
+            self._done = self._depth == 0
+        elif self._depth != 1:
+            return
+        elif tag in ("td", "th") and self._cell is not None:
+            self._row["cells"].append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag in ("a", "button") and self._control is not None:
+            self._control["text"] = " ".join("".join(self._control["text"]).split())
+            self._row["controls"].append(self._control)
+            self._control = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+        if self._control is not None:
+            self._control["text"].append(data)
+
+
+def table_rows(page, base_url=""):
+    """
+    The body rows of the first table in `page` as TableRow records, like TableSnapshot.rows.
+    """
+    parser = _TableParser()
+    parser.feed(page)
+    positions = {}
+    rows = []
+    for index, raw in enumerate(parser.rows):
+        position = positions.get(raw["body"], 0)
+        positions[raw["body"]] = position + 1
+        rows.append(TableRow(
+            index, raw["body"], position, raw["cls"], raw["attrs"], tuple(raw["cells"]),
+            tuple(RowControl(number, c["tag"], c["text"], urljoin(base_url, c["href"]) if c["href"] else "", c["cls"])
+                  for number, c in enumerate(raw["controls"]))
+        ))
+    return rows
+
+
+class HmisHttpClient:
+    """
+    Reads HMIS pages over HTTP with the browser's session, for id lookups that would
+    otherwise each cost a browser navigation (invoice and patient list pages). A pooled
+    requests.Session carries the cookies of the workflow's WebDriver session and re-reads
+    them when HMIS answers with the login form.
+    Opt-in with HMIS_HTTP_LOOKUPS=1 (needs the requests package); when it is off every
+    lookup returns None and the workflow stays on its UI path.
+    """
+    def __init__(self, driver, base_url, enabled=None, pool_size=None, timeout=None):
+        self.driver = driver
+        self.base_url = base_url
+        self.enabled = lookups_enabled() if enabled is None else enabled
+        self.timeout = timeout or float(os.environ.get("HMIS_HTTP_TIMEOUT", 15))
+        self.pool_size = pool_size or int(os.environ.get("HMIS_HTTP_POOL", 4))
+        if self.enabled and requests is None:
+            logging.warning("HMIS_HTTP_LOOKUPS is set but requests is not installed; using the UI lookups")
+            self.enabled = False
+        self._session = None
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # Same browser identity, so HMIS treats the requests as part of the logged-in session
+        session.headers["User-Agent"] = self.driver.execute_script("return navigator.userAgent;")
+        return session
+
+    def sync_cookies(self):
+        """
+        Copy the browser's current cookies into the HTTP session.
+        """
+        if self._session is None:
+            self._session = self._new_session()
+        self._session.cookies.clear()
+        for cookie in self.driver.get_cookies():
+            self._session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+
+    @staticmethod
+    def _is_login_page(response):
+        return "login" in response.url.lower() or 'name="Username"' in response.text
+
+    def get(self, path, **params):
+        """
+        GET a page (absolute URL or path under the base URL) and return its HTML.
+        Raises requests.HTTPError, or ValueError if the browser session itself has expired.
+        """
+        if self._session is None:
+            self.sync_cookies()
+        url = urljoin(self.base_url, path)
+        response = self._session.get(url, params=params or None, timeout=self.timeout)
+        if self._is_login_page(response):
+            # The browser logged in again since the cookies were copied
+            self.sync_cookies()
+            response = self._session.get(url, params=params or None, timeout=self.timeout)
+            if self._is_login_page(response):
+                raise ValueError(f"HTTP lookup of {url} was sent to the login page; the browser session has expired")
+        response.raise_for_status()
+        return response.text
+
+    def _lookup(self, description, function, *args):
+        """
+        Run one lookup; a failure is logged and returns None so the caller uses its UI path.
+        """
+        if not self.enabled:
+            return None
+        try:
+            return function(*args)
+        except Exception as e:
+            logging.warning(f"HTTP lookup of {description} failed, using the UI: {str(e)}")
+            return None
+
+    def invoice(self, bill_id):
+        """
+        Bill no and patient id printed on a bill's invoice, or None.
+        """
+        def read():
+            page = self.get(f"bill/invoice/{bill_id}")
+            bill_no = re.search(r"Bill\s*No\s*:?\s*(?:<[^>]*>\s*)*I?(\d+)", page, re.IGNORECASE)
+            patient_id = re.search(r"Patient\s*Id\s*:?\s*(?:<[^>]*>\s*)*(\d+)", page, re.IGNORECASE)
+            return {
+                "bill_id": str(bill_id),
+                "bill_no": bill_no.group(1) if bill_no else None,
+                "patient_id": patient_id.group(1) if patient_id else None
+            }
+        return self._lookup(f"invoice {bill_id}", read)
+
+    def patient_detail_links(self, view="emergency"):
+        """
+        Patient detail page URLs listed on patient/view_<view> (emergency or ipd), newest first, or None.
+        """
+        def read():
+            page = self.get(f"patient/view_{view}")
+            links = []
+            for row in table_rows(page, self.base_url):
+                control = row.control(href=f"{view}_patient_details", tag="a")
+                if control is not None:
+                    links.append(control.href)
+            return links
+        return self._lookup(f"the {view} patient list", read)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
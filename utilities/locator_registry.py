@@ -0,0 +1,169 @@
+import os
+import json
+import atexit
+import contextlib
+import time
+import logging
+import threading
+
+locator_stats_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reports", "locator_stats.json")
+
+
+class LocatorRegistry:
+    """
+    Remembers, across runs, which fallback locator actually finds each element.
+    Candidates for a named slot (e.g. "emr_billing.invoice_bill_no") are tried
+    best-first by historical hit rate, then by average lookup latency.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, stats_file=locator_stats_file):
+        self.stats_file = stats_file
+        self._lock = threading.Lock()
+        self._stats = self._read()
+        # Counts recorded since the last save, merged into the file on save
+        self._pending = {}
+
+    @classmethod
+    def shared(cls):
+        """
+        Return the process-wide registry backed by reports/locator_stats.json.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                atexit.register(cls._shared.save)
+            return cls._shared
+
+    @staticmethod
+    def _key(locator):
+        by, value = locator
+        return f"{by}={value}"
+
+    def _read(self):
+        if not os.path.exists(self.stats_file):
+            return {}
+        try:
+            with open(self.stats_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logging.warning(f"Could not read locator stats {self.stats_file}: {str(e)}")
+            return {}
+
+    def _entry(self, stats, slot, locator):
+        return stats.setdefault(slot, {}).setdefault(self._key(locator), {"hits": 0, "misses": 0, "hit_time": 0.0})
+
+    def ranked(self, slot, candidates):
+        """
+        Return `candidates` ordered best-first. Unknown candidates keep their original
+        order and rank as a 50% hit rate, so new locators still get tried.
+        """
+        def score(indexed):
+            index, locator = indexed
+            entry = self._stats.get(slot, {}).get(self._key(locator), {})
+            hits = entry.get("hits", 0)
+            misses = entry.get("misses", 0)
+            hit_rate = (hits + 1) / (hits + misses + 2)
+            latency = entry.get("hit_time", 0.0) / hits if hits else float("inf")
+            return (-hit_rate, latency, index)
+        return [locator for _, locator in sorted(enumerate(candidates), key=score)]
+
+    def record(self, slot, locator, hit, elapsed=0.0):
+        """
+        Count one hit (with its lookup latency) or miss for a candidate.
+        """
+        with self._lock:
+            for stats in (self._stats, self._pending):
+                entry = self._entry(stats, slot, locator)
+                if hit:
+                    entry["hits"] += 1
+                    entry["hit_time"] += elapsed
+                else:
+                    entry["misses"] += 1
+
+    def find(self, ready, slot, candidates, timeout=None, visible=True, required=True):
+        """
+        Race the ranked candidates with ReadyWait.first_of and record the outcome:
+        the winner gets a hit, candidates ranked ahead of it get a miss.
+        Returns (element, locator) or None.
+        """
+        ordered = self.ranked(slot, candidates)
+        started = time.time()
+        match = ready.first_of(*ordered, timeout=timeout, visible=visible, required=False)
+        elapsed = time.time() - started
+        losers = ordered[:ordered.index(match[1])] if match else ordered
+        for locator in losers:
+            self.record(slot, locator, False)
+        if match:
+            self.record(slot, match[1], True, elapsed)
+        elif required:
+            raise LookupError(f"No candidate locator matched for '{slot}'")
+        return match
+
+    @contextlib.contextmanager
+    def _file_lock(self, timeout=30, stale_after=60):
+        """
+        Hold <stats file>.lock, created with O_EXCL, so parallel suite workers merge their
+        counts one at a time. A lock older than `stale_after` seconds was left by a crashed
+        process and is broken.
+        """
+        lock_file = f"{self.stats_file}.lock"
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_file) > stale_after:
+                        os.remove(lock_file)
+                        continue
+                except OSError:
+                    # Released (or broken by another worker) in the meantime
+                    continue
+                if time.time() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for {lock_file}")
+                time.sleep(0.05)
+        try:
+            os.write(fd, str(os.getpid()).encode("utf-8"))
+            os.close(fd)
+            yield
+        finally:
+            os.remove(lock_file)
+
+    @staticmethod
+    def _merge(stats, counts):
+        """
+        Add the per-slot, per-locator `counts` into `stats`.
+        """
+        for slot, entries in counts.items():
+            for key, entry_counts in entries.items():
+                entry = stats.setdefault(slot, {}).setdefault(key, {"hits": 0, "misses": 0, "hit_time": 0.0})
+                for field in ("hits", "misses", "hit_time"):
+                    entry[field] += entry_counts[field]
+
+    def save(self):
+        """
+        Merge the counts recorded in this process into the stats file.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+        try:
+            os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
+            with self._file_lock():
+                stats = self._read()
+                self._merge(stats, pending)
+                temp_file = f"{self.stats_file}.{os.getpid()}.tmp"
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    json.dump(stats, f, indent=4)
+                os.replace(temp_file, self.stats_file)
+            self._stats = stats
+            logging.info(f"Locator statistics saved to {self.stats_file}")
+        except Exception as e:
+            logging.error(f"Error saving locator statistics to {self.stats_file}: {str(e)}")
+            # Nothing was written; keep the counts so the next save merges them
+            with self._lock:
+                self._merge(self._pending, pending)
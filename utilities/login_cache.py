@@ -0,0 +1,105 @@
+import os
+import re
+import json
+import time
+import logging
+from urllib.parse import urlsplit
+from selenium.webdriver.common.by import By
+
+login_cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reports", "login_cache")
+
+
+class LoginCache:
+    """
+    Snapshot of the HMIS session cookies taken after a successful UI login, keyed by
+    ConfigLoader environment, username and server host, so later sessions can skip the login form.
+    """
+    def __init__(self, environment, username, ttl=None, cache_dir=login_cache_dir, base_url=None):
+        self.environment = environment
+        self.username = username
+        self.ttl = ttl if ttl is not None else int(os.environ.get("HMIS_LOGIN_CACHE_TTL", "1800"))
+        # Cookies from the live server are useless against HMIS_BASE_URL overrides (and vice versa)
+        host = urlsplit(base_url).netloc if base_url else ""
+        safe_name = re.sub(r'[^\w.-]', '_', "_".join(part for part in (environment, username, host) if part))
+        self.cache_file = os.path.join(cache_dir, f"{safe_name}.json")
+
+    def load(self):
+        """
+        Return the cached entry, or None if there is none or it is older than the TTL.
+        """
+        if self.ttl <= 0 or not os.path.exists(self.cache_file):
+            return None
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except Exception as e:
+            logging.warning(f"Could not read login cache {self.cache_file}: {str(e)}")
+            return None
+        age = time.time() - entry.get("saved_at", 0)
+        if age > self.ttl:
+            logging.info(f"Login cache expired ({age:.0f}s old, TTL {self.ttl}s)")
+            return None
+        return entry
+
+    def save(self, driver):
+        """
+        Save the current browser cookies and dashboard URL after a successful login.
+        """
+        entry = {
+            "environment": self.environment,
+            "username": self.username,
+            "saved_at": time.time(),
+            "dashboard_url": driver.current_url,
+            "cookies": driver.get_cookies()
+        }
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            # Write to a temp file first so parallel workers never read a half-written snapshot
+            temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(temp_file, self.cache_file)
+            logging.info(f"Saved login cookies to {self.cache_file}")
+        except Exception as e:
+            logging.warning(f"Could not save login cache {self.cache_file}: {str(e)}")
+
+    def invalidate(self):
+        """
+        Drop the cached snapshot, e.g. after the probe found it stale.
+        """
+        try:
+            os.remove(self.cache_file)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Could not remove login cache {self.cache_file}: {str(e)}")
+
+    def restore(self, driver, base_url):
+        """
+        Inject cached cookies and probe the dashboard. Returns True if the browser is
+        logged in afterwards, False if the caller should fall back to the UI login.
+        """
+        entry = self.load()
+        if not entry:
+            return False
+        try:
+            # Cookies can only be added for the domain that is currently loaded
+            driver.get(base_url)
+            driver.delete_all_cookies()
+            for cookie in entry["cookies"]:
+                cookie = {key: value for key, value in cookie.items() if key != "sameSite" or value in ("Strict", "Lax", "None")}
+                if "expiry" in cookie:
+                    cookie["expiry"] = int(cookie["expiry"])
+                driver.add_cookie(cookie)
+
+            # Validity probe: the dashboard must load without bouncing back to the login form
+            driver.get(entry.get("dashboard_url") or base_url)
+            if "/dashboard" in driver.current_url and not driver.find_elements(By.NAME, "Username"):
+                logging.info("Logged in from cached session cookies")
+                return True
+        except Exception as e:
+            logging.warning(f"Could not restore cached login: {str(e)}")
+
+        logging.info("Cached session cookies are stale, falling back to UI login")
+        self.invalidate()
+        return False
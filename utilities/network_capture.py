@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import time
+import logging
+from selenium.common.exceptions import WebDriverException
+
+# Identifiers that appear in the URLs the app opens after saving
+URL_PATTERNS = {
+    "patient_id": [r"/create_stiker/(\d+)"],
+    "bill_id": [r"/bill/invoice/(\d+)", r"[?&]billId=(\d+)"],
+    "ipd_id": [r"/deposit_slip/(\d+)"]
+}
+
+# Keys the identifiers are returned under in the JSON responses of createBill/register
+JSON_KEYS = {
+    "bill_no": ("bill_no", "billNo", "billno", "bill_number"),
+    "bill_id": ("bill_id", "billId", "billid"),
+    "patient_id": ("patient_id", "patientId", "patientid"),
+    "ipd_id": ("ipd_id", "ipdId", "ipdid")
+}
+
+
+def capture_enabled():
+    return os.environ.get("HMIS_NETWORK_CAPTURE", "").lower() in ("1", "true", "yes", "on")
+
+
+def _find_key(data, keys):
+    """
+    First value stored under any of `keys`, searching nested dictionaries and lists breadth-first.
+    """
+    pending = [data]
+    while pending:
+        item = pending.pop(0)
+        if isinstance(item, dict):
+            for key in keys:
+                if item.get(key) not in (None, "", 0):
+                    return item[key]
+            pending.extend(item.values())
+        elif isinstance(item, list):
+            pending.extend(item)
+    return None
+
+
+def ids_from_url(url):
+    found = {}
+    for field, patterns in URL_PATTERNS.items():
+        for pattern in patterns:
+            match = re.search(pattern, url)
+            if match:
+                found[field] = match.group(1)
+                break
+    return found
+
+
+def ids_from_json(data):
+    found = {}
+    for field, keys in JSON_KEYS.items():
+        value = _find_key(data, keys)
+        if value is None:
+            continue
+        # Bill numbers come as "I00005001" on the invoice; keep the digits like the DOM scrapers do
+        match = re.search(r"\d+", str(value))
+        if match:
+            found[field] = match.group(0)
+    return found
+
+
+class NetworkCapture:
+    """
+    Reads bill numbers, bill ids, patient ids and IPD ids straight from the browser's
+    network traffic (the createBill/register XHR responses and the invoice, sticker and
+    deposit-slip URLs they open) through Chrome's performance log and the DevTools
+    Network domain, instead of scraping popup windows and tooltips.
+    Opt-in with HMIS_NETWORK_CAPTURE=1, which makes SessionPool start Chrome with network
+    logging. When it is off, or nothing was seen, `wait_for` returns None at once (or after
+    HMIS_NETWORK_CAPTURE_TIMEOUT seconds) and the workflow uses its DOM fallback.
+    """
+    def __init__(self, driver, enabled=None, timeout=None):
+        self.driver = driver
+        self.enabled = capture_enabled() if enabled is None else enabled
+        self.timeout = timeout if timeout is not None else float(os.environ.get("HMIS_NETWORK_CAPTURE_TIMEOUT", 5))
+        self.captured = {}
+        self._requests = {}
+        self._responses = {}
+
+    @staticmethod
+    def configure(chrome_options):
+        """
+        Turn on Chrome's performance (network) log for a new session when capture is enabled.
+        """
+        if capture_enabled():
+            chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+
+    def _events(self):
+        try:
+            entries = self.driver.get_log("performance")
+        except WebDriverException as e:
+            logging.warning(f"Network capture unavailable, using the page fallbacks: {str(e)}")
+            self.enabled = False
+            return []
+        events = []
+        for entry in entries:
+            try:
+                events.append(json.loads(entry["message"])["message"])
+            except (KeyError, ValueError):
+                continue
+        return events
+
+    def mark(self):
+        """
+        Forget everything seen so far; call before the actions whose ids should be captured.
+        """
+        if self.enabled:
+            self._events()
+        self.captured = {}
+        self._requests.clear()
+        self._responses.clear()
+
+    def _update(self, found, source):
+        for field, value in found.items():
+            if self.captured.get(field) != value:
+                logging.info(f"Network capture: {field} {value} from {source}")
+            self.captured[field] = value
+
+    def _body(self, request_id):
+        try:
+            result = self.driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        except WebDriverException:
+            # Evicted, or loaded in another window the DevTools session is not attached to
+            return None
+        return None if result.get("base64Encoded") else result.get("body")
+
+    def poll(self):
+        """
+        Read the new network events and update `captured`.
+        """
+        if not self.enabled:
+            return self.captured
+        for event in self._events():
+            method, params = event.get("method"), event.get("params", {})
+            if method == "Network.requestWillBeSent":
+                request = params.get("request", {})
+                self._requests[params.get("requestId")] = request.get("method")
+                self._update(ids_from_url(request.get("url", "")), request.get("url"))
+            elif method == "Network.responseReceived":
+                response = params.get("response", {})
+                if params.get("type") in ("XHR", "Fetch") and self._requests.get(params.get("requestId")) == "POST":
+                    self._responses[params.get("requestId")] = response.get("url")
+            elif method == "Network.loadingFinished" and params.get("requestId") in self._responses:
+                url = self._responses.pop(params["requestId"])
+                body = self._body(params["requestId"])
+                if not body or body.lstrip()[:1] not in ("{", "["):
+                    continue
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    continue
+                if isinstance(data, dict) and data.get("error"):
+                    continue
+                self._update(ids_from_json(data), url)
+        return self.captured
+
+    def wait_for(self, *fields, timeout=None):
+        """
+        Wait until every one of `fields` (bill_no, bill_id, patient_id, ipd_id) has been seen
+        since `mark` and return them as a dictionary, or None when capture is off or they
+        did not all show up in time.
+        """
+        if not self.enabled:
+            return None
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        while True:
+            self.poll()
+            if all(self.captured.get(field) for field in fields):
+                return {field: self.captured[field] for field in fields}
+            if not self.enabled or time.time() >= deadline:
+                missing = [field for field in fields if not self.captured.get(field)]
+                logging.info(f"Network capture did not see {', '.join(missing)}; using the page fallback")
+                return None
+            time.sleep(0.2)
+
+    def close_popups(self, keep_window, wait=2):
+        """
+        Close the invoice/sticker windows the save opened and switch back to `keep_window`.
+        Waits up to `wait` seconds for a popup that was opened but is not there yet, so it
+        cannot be mistaken for the next bill's invoice later.
+        """
+        deadline = time.time() + wait
+        while len(self.driver.window_handles) < 2 and time.time() < deadline:
+            time.sleep(0.2)
+        for window_handle in self.driver.window_handles:
+            if window_handle != keep_window:
+                try:
+                    self.driver.switch_to.window(window_handle)
+                    self.driver.close()
+                except WebDriverException:
+                    continue
+        self.driver.switch_to.window(keep_window)
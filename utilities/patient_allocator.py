@@ -0,0 +1,158 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from utilities.artifact_registry import ArtifactRegistry
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patient_leases (
+    patient_id TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    workflow TEXT NOT NULL,
+    leased_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Newest patient recorded by the source workflows that no one else holds a live lease on.
+# {admission} narrows it to patients with (or without) a recorded IPD admission.
+_CANDIDATE_SQL = """
+SELECT a.value AS patient_id, MAX(a.created_at) AS recorded_at
+FROM artifacts a
+WHERE a.kind = 'patient_id' AND a.workflow IN ({workflows})
+AND NOT EXISTS (
+    SELECT 1 FROM patient_leases l WHERE l.patient_id = a.value AND l.expires_at > ? AND l.holder != ?
+)
+{admission}
+GROUP BY a.value
+ORDER BY recorded_at DESC
+LIMIT 1
+"""
+
+# A patient chosen by the caller (HMIS_PATIENT_ID, e.g. from the registration pipeline)
+_PINNED_SQL = """
+SELECT ? AS patient_id
+WHERE NOT EXISTS (
+    SELECT 1 FROM patient_leases l WHERE l.patient_id = ? AND l.expires_at > ? AND l.holder != ?
+)
+"""
+
+_ADMITTED_SQL = "AND {negate}EXISTS (SELECT 1 FROM artifacts i WHERE i.patient_id = a.value AND i.ipd_id IS NOT NULL)"
+
+
+class PatientAllocator:
+    """
+    Hands out test patients from the artifact registry under exclusive, time-limited
+    leases, so billing and admission workflows running in parallel never pick the same
+    patient. A lease is taken in one write transaction on reports/artifacts.sqlite3 and
+    shared by every process using it; a lease left behind by a crashed run expires after
+    HMIS_PATIENT_LEASE_SECONDS (900 by default).
+    Eligibility is the set of workflows the patient may come from (OPD and/or Emergency
+    registrations) and, optionally, whether the patient must already be admitted (IPD).
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, registry=None, lease_seconds=None):
+        self.registry = registry or ArtifactRegistry.shared()
+        self.lease_seconds = lease_seconds or int(os.environ.get("HMIS_PATIENT_LEASE_SECONDS", 900))
+        self.holder_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        # Autocommit connection, transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(self.registry.db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    @classmethod
+    def shared(cls):
+        """
+        Return the process-wide allocator backed by the shared artifact registry.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def acquire(self, workflow, source_workflows, admitted=None, patient_id=None):
+        """
+        Lease the newest eligible patient for `workflow`. `source_workflows` are the
+        registration/billing workflows the patient may come from; `admitted` True/False
+        requires the patient to have/not have an IPD admission recorded (None: either).
+        A `patient_id` (default: HMIS_PATIENT_ID) is leased as given, skipping eligibility.
+        Returns a PatientLease. Raises ValueError when every eligible patient is leased.
+        """
+        holder = f"{self.holder_prefix}:{workflow}:{uuid.uuid4().hex[:8]}"
+        patient_id = patient_id or os.environ.get("HMIS_PATIENT_ID")
+        now = time.time()
+        if patient_id:
+            sql, params = _PINNED_SQL, (patient_id, patient_id, now, holder)
+        else:
+            admission = "" if admitted is None else _ADMITTED_SQL.format(negate="" if admitted else "NOT ")
+            sql = _CANDIDATE_SQL.format(workflows=", ".join("?" for _ in source_workflows), admission=admission)
+            params = (*source_workflows, now, holder)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(sql, params).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO patient_leases (patient_id, holder, workflow, leased_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                        (row["patient_id"], holder, workflow, now, now + self.lease_seconds)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None and patient_id:
+            raise ValueError(f"Patient {patient_id} is leased by another run")
+        if row is None:
+            eligibility = "" if admitted is None else (" admitted" if admitted else " not yet admitted")
+            raise ValueError(f"No unleased{eligibility} patient available from: {', '.join(source_workflows)}")
+        logging.info(f"Leased patient {row['patient_id']} to {workflow} for {self.lease_seconds}s")
+        return PatientLease(self, row["patient_id"], holder)
+
+    def renew(self, lease):
+        """
+        Extend a lease by another lease period. Returns False if it expired and was taken over.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE patient_leases SET expires_at = ? WHERE patient_id = ? AND holder = ?",
+                (time.time() + self.lease_seconds, lease.patient_id, lease.holder)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, lease):
+        """
+        Give the patient back. Only the lease holder's own row is removed.
+        """
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM patient_leases WHERE patient_id = ? AND holder = ?", (lease.patient_id, lease.holder))
+            logging.info(f"Released lease on patient {lease.patient_id}")
+        except sqlite3.Error as e:
+            logging.error(f"Could not release lease on patient {lease.patient_id}: {str(e)}")
+
+    def active_leases(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM patient_leases WHERE expires_at > ? ORDER BY leased_at", (time.time(),)).fetchall()
+        return [dict(row) for row in rows]
+
+
+class PatientLease:
+    """
+    An exclusive hold on one test patient, returned by PatientAllocator.acquire.
+    """
+    def __init__(self, allocator, patient_id, holder):
+        self.allocator = allocator
+        self.patient_id = patient_id
+        self.holder = holder
+
+    def renew(self):
+        return self.allocator.renew(self)
+
+    def release(self):
+        self.allocator.release(self)
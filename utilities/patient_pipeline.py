@@ -0,0 +1,271 @@
+import os
+import sys
+# Make the project root importable when run as "python utilities/patient_pipeline.py"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import time
+import queue
+import logging
+import argparse
+import itertools
+import multiprocessing
+from utilities.suite_runner import PROJECT_ROOT, run_task, worker_setup, worker_teardown
+
+pipeline_report_dir = os.path.join("reports", "pipeline_runs")
+
+# Registration workflows that produce patients: module, TestCase class, and the
+# workflow name their patient ids are recorded under in the artifact registry
+REGISTRATIONS = {
+    "opd": (os.path.join("OPD Management", "Opdregister.py"), "OPDRegistration", "opd_registration"),
+    "emergency": (os.path.join("EMR Management", "Emrregister.py"), "EMRRegistration", "emr_registration"),
+    "service": (os.path.join("OPD Management", "Serviceregister.py"), "ServiceRegistration", "opd_combined")
+}
+
+# Workflows that consume a patient; they take it through PatientAllocator (HMIS_PATIENT_ID)
+CONSUMERS = {
+    "emr_billing": (os.path.join("EMR Management", "EmrBilling.py"), "EMRBilling"),
+    "emr_billing_due": (os.path.join("EMR Management", "EmrBillingDue.py"), "EMRBillingDue"),
+    "ipd_admission": (os.path.join("IPD Management", "Ipdregister.py"), "IPDRegistration")
+}
+
+# Consumer stages each kind of fresh patient goes through, in order
+DEFAULT_ROUTES = {
+    "opd": ["ipd_admission"],
+    "emergency": ["emr_billing"],
+    "service": ["emr_billing_due"]
+}
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class PatientPipeline:
+    """
+    Producer/consumer mode for the registration and billing workflows. Registration
+    workers (OPD, Emergency, Service) register patients and push the new patient ids onto
+    a bounded queue; billing and IPD-admission workers take them off and run their
+    workflows on exactly that patient. Registration blocks while the queue is full, so
+    registrations never run more than `queue_limit` patients ahead of billing. Every
+    browser stays busy, and the summary reports registration-to-bill throughput.
+    """
+    def __init__(self, patients=10, kinds=("opd", "emergency", "service"), routes=None, registration_workers=1, billing_workers=2, queue_limit=4):
+        unknown = [kind for kind in kinds if kind not in REGISTRATIONS]
+        if unknown:
+            raise ValueError(f"Unknown registration kind(s): {', '.join(unknown)}")
+        self.routes = dict(DEFAULT_ROUTES, **(routes or {}))
+        for stages in self.routes.values():
+            for stage in stages:
+                if stage not in CONSUMERS:
+                    raise ValueError(f"Unknown consumer stage: {stage}")
+        # Registrations alternate between the kinds
+        self.jobs = list(itertools.islice(itertools.cycle(kinds), patients))
+        self.registration_workers = max(1, registration_workers)
+        self.billing_workers = max(1, billing_workers)
+        self.queue_limit = max(1, queue_limit)
+        self.run_id = f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}"
+
+    def run(self):
+        """
+        Run the pipeline until every registered patient went through its route.
+        Returns the summary dictionary.
+        """
+        context = multiprocessing.get_context("spawn")
+        job_queue = context.Queue()
+        patient_queue = context.Queue(maxsize=self.queue_limit)
+        event_queue = context.Queue()
+        for kind in self.jobs:
+            job_queue.put(kind)
+        for _ in range(self.registration_workers):
+            job_queue.put(None)
+
+        logging.info(
+            f"Pipeline {self.run_id}: {len(self.jobs)} registrations on {self.registration_workers} workers, "
+            f"{self.billing_workers} billing workers, queue limit {self.queue_limit}"
+        )
+        started = time.time()
+        producers = [
+            context.Process(target=_registration_worker_main, args=(worker_id, job_queue, patient_queue, event_queue, PROJECT_ROOT, self.run_id))
+            for worker_id in range(1, self.registration_workers + 1)
+        ]
+        consumers = [
+            context.Process(target=_consumer_worker_main, args=(worker_id, patient_queue, event_queue, PROJECT_ROOT, self.routes))
+            for worker_id in range(self.registration_workers + 1, self.registration_workers + self.billing_workers + 1)
+        ]
+        for worker in producers + consumers:
+            worker.start()
+
+        events = []
+        sentinels_sent = False
+        while True:
+            try:
+                event = event_queue.get(timeout=5)
+                events.append(event)
+                logging.info(f"{event['stage']} {event['kind']} patient {event.get('patient_id') or '-'} -> {event['status']} in {event['duration']:.1f}s (worker {event['worker']})")
+            except queue.Empty:
+                pass
+            if not sentinels_sent and not any(worker.is_alive() for worker in producers):
+                # Registration is done; let the consumers drain the queue and stop
+                for _ in consumers:
+                    while any(worker.is_alive() for worker in consumers):
+                        try:
+                            patient_queue.put(None, timeout=5)
+                            break
+                        except queue.Full:
+                            continue
+                sentinels_sent = True
+            if sentinels_sent and not any(worker.is_alive() for worker in consumers):
+                break
+        # Events put just before the consumers exited
+        while True:
+            try:
+                events.append(event_queue.get_nowait())
+            except queue.Empty:
+                break
+        for worker in producers + consumers:
+            worker.join()
+
+        return self._summarize(events, time.time() - started)
+
+    def _summarize(self, events, wall_time):
+        """
+        Log throughput and latency and save all events to reports/pipeline_runs.
+        """
+        registrations = [event for event in events if event["stage"] == "registration"]
+        registered = [event for event in registrations if event["status"] == "passed" and event.get("patient_id")]
+        billed = [event for event in events if event["stage"] != "registration" and event["status"] == "passed"]
+        # Registration-to-bill latency: from the end of a patient's registration to the end of its last stage
+        registered_at = {event["patient_id"]: event["finished"] for event in registered}
+        completed = {}
+        for event in events:
+            if event["stage"] != "registration" and event.get("patient_id") in registered_at and event.get("last_stage"):
+                completed[event["patient_id"]] = event
+        latencies = sorted(event["finished"] - registered_at[patient_id] for patient_id, event in completed.items() if event["status"] == "passed")
+        summary = {
+            "run_id": self.run_id,
+            "wall_time": wall_time,
+            "registration_workers": self.registration_workers,
+            "billing_workers": self.billing_workers,
+            "queue_limit": self.queue_limit,
+            "registered": len(registered),
+            "registration_failures": len(registrations) - len(registered),
+            "stages_passed": len(billed),
+            "patients_completed": len(latencies),
+            "patients_per_minute": len(latencies) / wall_time * 60 if wall_time else 0.0,
+            "median_latency": latencies[len(latencies) // 2] if latencies else None,
+            "max_latency": latencies[-1] if latencies else None,
+            "events": events
+        }
+        logging.info("=" * 80)
+        logging.info(f"{summary['registered']} patients registered, {summary['patients_completed']} went through their whole route in {wall_time:.1f}s")
+        logging.info(f"Throughput: {summary['patients_per_minute']:.2f} patients/min")
+        if latencies:
+            logging.info(f"Registration-to-bill latency: median {summary['median_latency']:.1f}s, max {summary['max_latency']:.1f}s")
+        logging.info("=" * 80)
+
+        os.makedirs(pipeline_report_dir, exist_ok=True)
+        summary_file = os.path.join(pipeline_report_dir, f"{self.run_id}.json")
+        try:
+            with open(summary_file, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=4)
+            logging.info(f"Pipeline summary saved to {summary_file}")
+        except Exception as e:
+            logging.error(f"Error saving pipeline summary to {summary_file}: {str(e)}")
+        return summary
+
+
+def _event(stage, kind, worker_id, result, started, patient_id=None, **extra):
+    return dict(
+        stage=stage, kind=kind, worker=worker_id, patient_id=patient_id, status=result["status"],
+        duration=result["duration"], started=started, finished=time.time(), error=result.get("error"), **extra
+    )
+
+
+def _registration_worker_main(worker_id, job_queue, patient_queue, event_queue, root, run_id):
+    """
+    Producer loop: register one patient per job and queue its id for the consumers.
+    """
+    worker_setup(root)
+    # Tag this worker's registry rows so it can find the patients it registered
+    os.environ["HMIS_RUN_ID"] = f"{run_id}_w{worker_id}"
+    from utilities.artifact_registry import ArtifactRegistry
+    try:
+        while True:
+            kind = job_queue.get()
+            if kind is None:
+                break
+            module, class_name, workflow = REGISTRATIONS[kind]
+            started = time.time()
+            result = run_task(worker_id, os.path.join(root, module), class_name)
+            patients = [
+                row["value"] for row in ArtifactRegistry.shared().find("patient_id", workflow=workflow, run_id=os.environ["HMIS_RUN_ID"])
+                if row["created_at"] >= started
+            ]
+            patient_id = patients[0] if patients else None
+            if result["status"] == "passed" and patient_id is None:
+                result = dict(result, status="failed", error="Registration passed but recorded no patient ID")
+            event_queue.put(_event("registration", kind, worker_id, result, started, patient_id))
+            if result["status"] == "passed":
+                # Blocks while the queue is full: registration waits for billing to catch up
+                patient_queue.put((kind, patient_id))
+    finally:
+        worker_teardown()
+
+
+def _consumer_worker_main(worker_id, patient_queue, event_queue, root, routes):
+    """
+    Consumer loop: run each queued patient through the stages of its route.
+    """
+    worker_setup(root)
+    try:
+        while True:
+            item = patient_queue.get()
+            if item is None:
+                break
+            kind, patient_id = item
+            stages = routes.get(kind, [])
+            # The consumers lease exactly this patient instead of picking the newest one
+            os.environ["HMIS_PATIENT_ID"] = patient_id
+            try:
+                for position, stage in enumerate(stages):
+                    module, class_name = CONSUMERS[stage]
+                    started = time.time()
+                    result = run_task(worker_id, os.path.join(root, module), class_name)
+                    last_stage = position == len(stages) - 1 or result["status"] != "passed"
+                    event_queue.put(_event(stage, kind, worker_id, result, started, patient_id, last_stage=last_stage))
+                    if result["status"] != "passed":
+                        logging.warning(f"Patient {patient_id} stopped at {stage}: {result['status']}")
+                        break
+            finally:
+                os.environ.pop("HMIS_PATIENT_ID", None)
+    finally:
+        worker_teardown()
+
+
+def _parse_routes(values):
+    """
+    Parse "--route kind=stage,stage" options into a routes dictionary.
+    """
+    routes = {}
+    for value in values or []:
+        kind, _, stages = value.partition("=")
+        routes[kind.strip()] = [stage.strip() for stage in stages.split(",") if stage.strip()]
+    return routes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Register patients and bill/admit them concurrently in a producer/consumer pipeline.")
+    parser.add_argument("-n", "--patients", type=int, default=10, help="Number of patients to register")
+    parser.add_argument("--kinds", nargs="+", default=["opd", "emergency", "service"], choices=sorted(REGISTRATIONS), help="Registration workflows to alternate between")
+    parser.add_argument("--route", action="append", metavar="KIND=STAGE[,STAGE]", help=f"Consumer stages for a kind of patient (stages: {', '.join(sorted(CONSUMERS))})")
+    parser.add_argument("-r", "--registration-workers", type=int, default=1, help="Registration worker processes (one browser each)")
+    parser.add_argument("-b", "--billing-workers", type=int, default=2, help="Billing/admission worker processes (one browser each)")
+    parser.add_argument("-q", "--queue-limit", type=int, default=4, help="Registered patients allowed to wait for billing before registration pauses")
+    args = parser.parse_args(argv)
+
+    os.chdir(PROJECT_ROOT)
+    pipeline = PatientPipeline(args.patients, args.kinds, _parse_routes(args.route), args.registration_workers, args.billing_workers, args.queue_limit)
+    summary = pipeline.run()
+    return 0 if summary["events"] and all(event["status"] == "passed" for event in summary["events"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import re
+import json
+import time
+import logging
+from selenium.common.exceptions import WebDriverException
+from utilities.network_capture import ids_from_url
+
+# Runs before the app's own scripts in every document of the tab. window.open and
+# target="_blank" links only record the URL (in sessionStorage, so it survives a redirect
+# after saving) and window.print does nothing, so no window or print dialog ever opens.
+_INTERCEPT_JS = r"""
+(function() {
+    if (window.__hmisPopupsIntercepted) { return; }
+    window.__hmisPopupsIntercepted = true;
+    function record(kind, url) {
+        try {
+            var opened = JSON.parse(sessionStorage.getItem('hmisOpened') || '[]');
+            opened.push({kind: kind, url: new URL(url || location.href, location.href).href, at: Date.now()});
+            sessionStorage.setItem('hmisOpened', JSON.stringify(opened));
+        } catch (e) {}
+    }
+    window.print = function() { record('print', null); };
+    window.open = function(url) {
+        record('open', url || 'about:blank');
+        var noop = function() {};
+        var stub = {closed: false, opener: window, location: {href: url || 'about:blank'},
+            document: {open: noop, write: noop, writeln: noop, close: noop},
+            focus: noop, blur: noop, print: noop, close: function() { stub.closed = true; }};
+        return stub;
+    };
+    document.addEventListener('click', function(event) {
+        var link = event.target && event.target.closest ? event.target.closest('a[target="_blank"]') : null;
+        if (link && link.href) {
+            event.preventDefault();
+            record('open', link.href);
+        }
+    }, true);
+})();
+"""
+
+_FETCH_JS = """
+var done = arguments[arguments.length - 1];
+fetch(arguments[0], {credentials: 'same-origin'}).then(function(r) { return r.ok ? r.text() : null; }).then(done, function() { done(null); });
+"""
+
+# Where the identifiers sit on the invoice, sticker and deposit-slip pages
+TEXT_PATTERNS = {
+    "bill_no": r"Bill\s*No\s*:?\s*(?:<[^>]*>\s*)*I?(\d+)",
+    "bill_id": r"Bill\s*Id\s*:?\s*(?:<[^>]*>\s*)*(\d+)",
+    "patient_id": r"Patient\s*Id\s*:?\s*(?:<[^>]*>\s*)*(\d+)",
+    "ipd_id": r"IPD\s*(?:Id|No)\s*:?\s*(?:<[^>]*>\s*)*(\d+)"
+}
+
+
+def suppression_enabled():
+    return os.environ.get("HMIS_SUPPRESS_POPUPS", "").lower() in ("1", "true", "yes", "on")
+
+
+def ids_from_text(text):
+    found = {}
+    for field, pattern in TEXT_PATTERNS.items():
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            found[field] = match.group(1)
+    return found
+
+
+class PopupInterceptor:
+    """
+    Keeps the invoice, sticker and deposit-slip windows and the print dialogs from opening.
+    With HMIS_SUPPRESS_POPUPS=1 a preload script (Page.addScriptToEvaluateOnNewDocument)
+    replaces window.open and window.print in the workflow's tab. The URLs the app tries to
+    open are recorded instead; `ids` reads bill/patient/IPD ids from them, fetching a page
+    in the background (with the tab's cookies) only when its URL alone is not enough.
+    When suppression is off every method is a no-op and returns None.
+    """
+    def __init__(self, driver, enabled=None, timeout=None):
+        self.driver = driver
+        self.enabled = suppression_enabled() if enabled is None else enabled
+        self.timeout = timeout if timeout is not None else float(os.environ.get("HMIS_POPUP_TIMEOUT", 10))
+        self.found = {}
+        self._script_id = None
+        self._pages = {}
+
+    def install(self):
+        """
+        Intercept popups in every page the tab loads from now on, and in the current one.
+        """
+        if not self.enabled or self._script_id is not None:
+            return
+        try:
+            result = self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": _INTERCEPT_JS})
+            self._script_id = result.get("identifier")
+            self.driver.execute_script(_INTERCEPT_JS)
+            logging.info("Popup and print interception installed")
+        except WebDriverException as e:
+            logging.warning(f"Popup interception unavailable, print windows will open: {str(e)}")
+            self.enabled = False
+
+    def uninstall(self):
+        """
+        Stop intercepting in pages loaded from now on; call from tearDownClass so the next
+        workflow borrowing this browser gets its popups back.
+        """
+        if self._script_id is None:
+            return
+        try:
+            self.driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": self._script_id})
+        except WebDriverException as e:
+            logging.warning(f"Could not remove popup interception: {str(e)}")
+        self._script_id = None
+
+    def reset(self):
+        """
+        Forget the URLs recorded so far; call before the actions whose popups matter.
+        """
+        self.found = {}
+        self._pages.clear()
+        if not self.enabled:
+            return
+        try:
+            self.driver.execute_script("try { sessionStorage.removeItem('hmisOpened'); } catch (e) {}")
+        except WebDriverException:
+            pass
+
+    def opened(self):
+        """
+        URLs the page tried to open since `reset`, oldest first.
+        """
+        if not self.enabled:
+            return []
+        try:
+            opened = json.loads(self.driver.execute_script("try { return sessionStorage.getItem('hmisOpened') || '[]'; } catch (e) { return '[]'; }"))
+        except (WebDriverException, ValueError):
+            return []
+        return [entry["url"] for entry in opened if entry.get("kind") == "open"]
+
+    def fetch(self, url):
+        """
+        The page at `url` as text, fetched from the workflow's tab (same session cookies), or None.
+        """
+        if url not in self._pages:
+            try:
+                page = self.driver.execute_async_script(_FETCH_JS, url)
+            except WebDriverException as e:
+                logging.warning(f"Could not fetch {url}: {str(e)}")
+                return None
+            # Only pages that loaded are kept; a failed fetch is tried again on the next poll
+            if page is None:
+                return None
+            self._pages[url] = page
+        return self._pages[url]
+
+    def window_timeout(self, timeout):
+        """
+        How long to wait for a popup window to open: `timeout` seconds, or 0 while popups
+        are intercepted, as the window then never opens.
+        """
+        return 0 if self.enabled else timeout
+
+    def ids(self, *fields, timeout=None):
+        """
+        Wait until the page tried to open a window and return `fields` (bill_no, bill_id,
+        patient_id, ipd_id) read from the recorded URLs, or from the pages they point at.
+        Returns None when suppression is off or not every field could be found in time.
+        Everything read along the way stays in `found`.
+        """
+        if not self.enabled:
+            return None
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        found = self.found
+        while True:
+            urls = self.opened()
+            for url in urls:
+                found.update({field: value for field, value in ids_from_url(url).items() if field not in found})
+            if urls and not all(found.get(field) for field in fields):
+                for url in urls:
+                    text = self.fetch(url)
+                    if text:
+                        found.update({field: value for field, value in ids_from_text(text).items() if field not in found})
+            if all(found.get(field) for field in fields):
+                logging.info(f"Read {', '.join(f'{field} {found[field]}' for field in fields)} from intercepted popups: {', '.join(urls)}")
+                return {field: found[field] for field in fields}
+            if time.time() >= deadline:
+                missing = [field for field in fields if not found.get(field)]
+                logging.info(f"Intercepted popups gave no {', '.join(missing)}; using the page fallback")
+                return None
+            time.sleep(0.2)
@@ -0,0 +1,132 @@
+import os
+import queue
+import base64
+import logging
+import threading
+import collections
+from utilities.screenshot_store import ScreenshotStore
+
+POLICIES = ("always", "on_failure", "ring")
+
+
+def test_failed(test):
+    """
+    True if the running test method of `test` (a unittest.TestCase, from its tearDown) failed or errored.
+    """
+    outcome = getattr(test, "_outcome", None)
+    if outcome is None:
+        return False
+    if getattr(outcome, "errors", None):
+        # Python < 3.11 collects the test's exceptions on the outcome until it finishes
+        return any(exc_info is not None for _, exc_info in outcome.errors)
+    result = getattr(outcome, "result", None)
+    problems = list(getattr(result, "failures", [])) + list(getattr(result, "errors", []))
+    return any(case is test for case, _ in problems) or not getattr(outcome, "success", True)
+
+
+class ScreenshotService:
+    """
+    Takes the workflows' debugging screenshots according to HMIS_SCREENSHOT_POLICY:
+      always     - every screenshot is saved (the default)
+      on_failure - nothing is captured while a test runs; one screenshot is taken when it fails
+      ring       - the last HMIS_SCREENSHOT_RING (10) screenshots are kept in memory and saved
+                   only if the test fails, together with a final one
+    Only the capture itself runs on the test's thread. Decoding the PNG and storing it in
+    the deduplicating ScreenshotStore, under the workflow named by `directory`'s last part,
+    happens on a background writer thread.
+    """
+    def __init__(self, driver, directory, policy=None, ring_size=None, store=None):
+        self.driver = driver
+        self.workflow = os.path.basename(os.path.normpath(directory))
+        self.store = store or ScreenshotStore.shared()
+        self.policy = (policy or os.environ.get("HMIS_SCREENSHOT_POLICY", "always")).lower().replace("-", "_")
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown screenshot policy '{self.policy}', expected one of: {', '.join(POLICIES)}")
+        self.ring = collections.deque(maxlen=max(1, ring_size or int(os.environ.get("HMIS_SCREENSHOT_RING", 10))))
+        # Screenshots taken so far per test, numbering the steps in the store's index
+        self.steps = collections.Counter()
+        self._queue = queue.Queue()
+        self._writer = None
+
+    def _frame(self, name, test, data):
+        self.steps[test] += 1
+        return (name, test, self.steps[test], data)
+
+    def _grab(self, name, element=None):
+        """
+        Capture the current page (or just `element`) as base64 PNG data, or None if the browser refused.
+        """
+        try:
+            if element is not None:
+                return element.screenshot_as_base64
+            return self.driver.get_screenshot_as_base64()
+        except Exception as e:
+            logging.error(f"Error taking screenshot {name}: {str(e)}")
+            return None
+
+    def _write(self, frame):
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="screenshot-writer", daemon=True)
+            self._writer.start()
+        self._queue.put(frame)
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                name, test, step, data = item
+                path = self.store.put(base64.b64decode(data), self.workflow, test, step, name)
+                logging.info(f"Screenshot saved: {name} ({test} step {step}) -> {path}")
+            except Exception as e:
+                logging.error(f"Error saving screenshot: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def capture(self, name, test="setup", element=None):
+        """
+        Take a screenshot named `name` during `test` (the test method name) as the policy
+        says, of the whole page or only `element`. Returns its step number within the test,
+        or None when the policy skipped it.
+        """
+        if self.policy == "on_failure":
+            return None
+        data = self._grab(name, element)
+        if data is None:
+            return None
+        frame = self._frame(name, test, data)
+        if self.policy == "ring":
+            self.ring.append(frame)
+        else:
+            self._write(frame)
+        return frame[2]
+
+    def end_test(self, test):
+        """
+        Call first thing in tearDown: on failure, save the ring buffer and/or a final
+        screenshot of the page the test failed on. The ring is emptied either way.
+        """
+        if test_failed(test) and self.policy != "always":
+            for frame in self.ring:
+                self._write(frame)
+            name = f"TEST_FAILED_{test._testMethodName}"
+            data = self._grab(name)
+            if data is not None:
+                self._write(self._frame(name, test._testMethodName, data))
+        self.ring.clear()
+
+    def flush(self):
+        """
+        Wait until every queued screenshot is in the store.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Flush and stop the writer thread (from tearDownClass).
+        """
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        self._writer = None
@@ -0,0 +1,251 @@
+import os
+import sys
+# Make the project root importable when run as "python utilities/screenshot_store.py"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import io
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+import collections
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow frames are kept as the browser's PNG and only exact duplicates are merged
+    Image = None
+
+screenshots_root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "screenshots")
+
+FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg"), "png": ("PNG", "png")}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    source_size INTEGER NOT NULL,
+    dhash TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    workflow TEXT NOT NULL,
+    test TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    digest TEXT NOT NULL REFERENCES blobs (digest),
+    taken_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_frames_run_test_step ON frames (run_id, workflow, test, step);
+CREATE INDEX IF NOT EXISTS idx_frames_name ON frames (name);
+"""
+
+
+def _dhash(image):
+    """
+    64-bit difference hash of an image: one bit per neighbouring pixel pair of a 9x8 thumbnail.
+    """
+    pixels = list(image.convert("L").resize((9, 8)).getdata())
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = (value << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value
+
+
+class ScreenshotStore:
+    """
+    Content-addressed store for the workflows' screenshots under screenshots/. Each frame
+    is hashed and only unique images are kept, as blobs/<xx>/<sha256>.<ext> encoded in
+    HMIS_SCREENSHOT_FORMAT (webp by default; jpeg or png) at HMIS_SCREENSHOT_QUALITY (60).
+    With HMIS_SCREENSHOT_SIMILARITY > 0 a frame whose perceptual hash is within that many
+    bits (out of 64) of a recently stored one reuses that blob instead. screenshots/index.sqlite3
+    maps every frame (run, workflow, test, step, name) to its blob; `export` (or --export)
+    writes a run back out as named image files.
+    Encoding and similarity need Pillow; without it the PNGs are stored as taken.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, root=screenshots_root, image_format=None, quality=None, similarity=None, run_id=None):
+        self.root = root
+        self.db_file = os.path.join(root, "index.sqlite3")
+        image_format = (image_format or os.environ.get("HMIS_SCREENSHOT_FORMAT", "webp")).lower()
+        if image_format == "jpg":
+            image_format = "jpeg"
+        if image_format not in FORMATS:
+            raise ValueError(f"Unknown screenshot format '{image_format}', expected one of: {', '.join(FORMATS)}")
+        if Image is None and image_format != "png":
+            logging.warning(f"Pillow is not installed; screenshots are stored as PNG instead of {image_format}")
+            image_format = "png"
+        self.image_format = image_format
+        self.quality = quality or int(os.environ.get("HMIS_SCREENSHOT_QUALITY", 60))
+        self.similarity = similarity if similarity is not None else int(os.environ.get("HMIS_SCREENSHOT_SIMILARITY", 0))
+        self.run_id = run_id or os.environ.get("HMIS_RUN_ID") or f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        # Perceptual hashes of the blobs stored most recently by this process
+        self.recent = collections.deque(maxlen=256)
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL lets parallel suite workers add frames while another one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    @classmethod
+    def shared(cls):
+        """
+        Return the process-wide store under screenshots/.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _similar(self, dhash):
+        """
+        Digest of a recently stored blob within the similarity threshold of `dhash`, or None.
+        """
+        best = None
+        for digest, other in self.recent:
+            distance = bin(dhash ^ other).count("1")
+            if distance <= self.similarity and (best is None or distance < best[0]):
+                best = (distance, digest)
+        return best[1] if best else None
+
+    def _encode(self, image):
+        pil_format, _ = FORMATS[self.image_format]
+        buffer = io.BytesIO()
+        if pil_format == "JPEG":
+            image = image.convert("RGB")
+        image.save(buffer, pil_format, quality=self.quality, **({"method": 4} if pil_format == "WEBP" else {}))
+        return buffer.getvalue()
+
+    def put(self, png, workflow, test, step, name):
+        """
+        Store one PNG frame taken at `step` of `test` in `workflow` and return the path of
+        the blob it is kept in (an existing one when the frame is a duplicate).
+        """
+        digest = hashlib.sha256(png).hexdigest()
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        path = row["path"] if row else None
+        dhash = None
+        if path is None and Image is not None:
+            image = Image.open(io.BytesIO(png))
+            dhash = _dhash(image) if self.similarity > 0 else None
+            similar = self._similar(dhash) if dhash is not None else None
+            if similar is not None:
+                digest = similar
+                with self._lock:
+                    path = self._conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()["path"]
+            else:
+                data = self._encode(image)
+        elif path is None:
+            data = png
+        if path is None:
+            extension = FORMATS[self.image_format][1]
+            path = os.path.join("blobs", digest[:2], f"{digest}.{extension}")
+            full_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # Write under a temporary name so a parallel worker storing the same frame never sees half a file
+            temporary = f"{full_path}.{os.getpid()}_{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, full_path)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO blobs (digest, path, format, size, source_size, dhash, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (digest, path, self.image_format, len(data), len(png), None if dhash is None else f"{dhash:016x}", time.time())
+                )
+            if dhash is not None:
+                self.recent.append((digest, dhash))
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO frames (run_id, workflow, test, step, name, digest, taken_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, workflow, test, step, name, digest, time.time())
+            )
+            self._conn.commit()
+        return os.path.join(self.root, path)
+
+    def frames(self, run_id=None, workflow=None, test=None):
+        """
+        Frames in the order they were taken, with their blob path, optionally for one run/workflow/test.
+        """
+        clauses, params = [], []
+        for column, value in (("run_id", run_id), ("workflow", workflow), ("test", test)):
+            if value is not None:
+                clauses.append(f"f.{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT f.*, b.path FROM frames f JOIN blobs b ON b.digest = f.digest {where} ORDER BY f.id", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            frames = self._conn.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+            blobs, size, source_size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(source_size), 0) FROM blobs").fetchone()
+        return {"frames": frames, "blobs": blobs, "bytes": size, "source_bytes": source_size}
+
+    def runs(self):
+        """
+        (run_id, frame count, first frame time) for every run in the index, oldest first.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT run_id, COUNT(*), MIN(taken_at) FROM frames GROUP BY run_id ORDER BY MIN(taken_at)").fetchall()
+        return [tuple(row) for row in rows]
+
+    def export(self, directory, run_id=None, workflow=None):
+        """
+        Copy the frames of a run out as <directory>/<workflow>/<test>_<step>_<name>.<ext>.
+        Returns the number of files written.
+        """
+        frames = self.frames(run_id, workflow)
+        for frame in frames:
+            extension = os.path.splitext(frame["path"])[1]
+            target = os.path.join(directory, frame["workflow"], f"{frame['test']}_{frame['step']:03d}_{frame['name']}{extension}")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(os.path.join(self.root, frame["path"]), target)
+        logging.info(f"Exported {len(frames)} screenshots to {directory}")
+        return len(frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or export the HMIS screenshot store.")
+    parser.add_argument("--stats", action="store_true", help="Print frame, blob and size totals")
+    parser.add_argument("--runs", action="store_true", help="List the runs in the index")
+    parser.add_argument("--export", metavar="DIR", help="Write frames out as named image files")
+    parser.add_argument("--run", help="Only export this run id")
+    parser.add_argument("--workflow", help="Only export this workflow (screenshots/<workflow> folder name)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = ScreenshotStore()
+    if args.stats:
+        stats = store.stats()
+        saved = 1 - stats["bytes"] / stats["source_bytes"] if stats["source_bytes"] else 0.0
+        print(f"{stats['frames']} frames in {stats['blobs']} blobs, {stats['bytes'] / 1024 / 1024:.1f} MB ({saved:.0%} smaller than the unique PNGs)")
+    if args.runs:
+        for run_id, count, taken_at in store.runs():
+            print(f"{run_id}\t{count} frames\t{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken_at))}")
+    if args.export:
+        store.export(os.path.abspath(args.export), args.run, args.workflow)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
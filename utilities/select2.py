@@ -0,0 +1,192 @@
+import os
+import logging
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import WebDriverException
+from utilities.wait_conditions import ReadyWait, _to_js_locator
+
+# Finds the element select2 was attached to, starting from the container, its
+# "chosen" span or the original <select>/<input> itself (select2 v3 and v4).
+_RESOLVE_JS = """
+function hmisSelect2Element(node) {
+    if (!node) { return null; }
+    var $ = window.jQuery;
+    if ((node.tagName === 'SELECT' || node.tagName === 'INPUT') && $(node).data('select2')) { return node; }
+    var match = (node.id || '').match(/^select2-(.+)-container$/);
+    if (match && document.getElementById(match[1])) { return document.getElementById(match[1]); }
+    var container = node.closest ? node.closest('.select2-container') : null;
+    if (container && container.id && container.id.indexOf('s2id_') === 0) {
+        return document.getElementById(container.id.substring(5));
+    }
+    if (container) {
+        var siblings = [container.previousElementSibling, container.nextElementSibling];
+        for (var i = 0; i < siblings.length; i++) {
+            if (siblings[i] && $(siblings[i]).data('select2')) { return siblings[i]; }
+        }
+    }
+    return null;
+}
+"""
+
+# Runs the widget's own data source for `term` and selects the best match, firing
+# the same events select2 fires when a user clicks a result.
+_PICK_JS = _RESOLVE_JS + """
+var locator = arguments[0], text = arguments[1], timeoutMs = arguments[2], done = arguments[arguments.length - 1];
+var $ = window.jQuery;
+if (!$) { done({error: 'jQuery is not loaded'}); return; }
+var node = null;
+try {
+    if (locator[0] === 'xpath') {
+        node = document.evaluate(locator[1], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    } else {
+        node = document.querySelector(locator[1]);
+    }
+} catch (e) {
+    done({error: 'Bad locator: ' + e}); return;
+}
+var element = hmisSelect2Element(node);
+if (!element) { done({error: 'No select2 widget found'}); return; }
+var $el = $(element), widget = $el.data('select2');
+var finished = false;
+function finish(result) { if (!finished) { finished = true; done(result); } }
+setTimeout(function() { finish({error: 'Data source did not answer within ' + timeoutMs + 'ms'}); }, timeoutMs);
+
+function flatten(items, out) {
+    for (var i = 0; i < (items || []).length; i++) {
+        if (items[i].children) { flatten(items[i].children, out); } else { out.push(items[i]); }
+    }
+    return out;
+}
+function best(items) {
+    var wanted = text.trim().toLowerCase(), contains = null;
+    for (var i = 0; i < items.length; i++) {
+        var label = String(items[i].text || '').trim().toLowerCase();
+        if (items[i].disabled) { continue; }
+        if (label === wanted) { return items[i]; }
+        if (contains === null && label.indexOf(wanted) !== -1) { contains = items[i]; }
+    }
+    return contains;
+}
+
+try {
+    if (widget.dataAdapter) {
+        // select2 v4
+        widget.dataAdapter.query({term: text, _type: 'query'}, function(data) {
+            var item = best(flatten(data.results, []));
+            if (!item) { finish({error: 'No option matching "' + text + '"'}); return; }
+            var selecting = $.Event('select2:selecting', {params: {data: item}});
+            $el.trigger(selecting);
+            if (selecting.isDefaultPrevented()) { finish({error: 'Selection was cancelled by the page'}); return; }
+            var option = $el.find('option').filter(function() { return this.value == item.id; });
+            if (!option.length) {
+                option = $(new Option(item.text, item.id, false, false));
+                $el.append(option);
+            }
+            if (element.multiple) { option.prop('selected', true); } else { $el.val(String(item.id)); }
+            $el.trigger('input').trigger('change');
+            $el.trigger({type: 'select2:select', params: {data: item}});
+            finish({id: String(item.id), text: item.text, version: 4});
+        });
+    } else if (widget.opts && widget.opts.query) {
+        // select2 v3
+        widget.opts.query({
+            element: $el, term: text, page: 1, context: null, matcher: widget.opts.matcher,
+            callback: function(data) {
+                var item = best(flatten(data.results, []));
+                if (!item) { finish({error: 'No option matching "' + text + '"'}); return; }
+                var selecting = $.Event('select2-selecting', {val: widget.id(item), object: item, choice: item});
+                $el.trigger(selecting);
+                if (selecting.isDefaultPrevented()) { finish({error: 'Selection was cancelled by the page'}); return; }
+                var old = $el.select2('data');
+                $el.select2('data', item);
+                $el.trigger($.Event('select2-selected', {val: widget.id(item), choice: item}));
+                $el.trigger($.Event('change', {val: $el.val(), added: item, removed: old}));
+                finish({id: String(widget.id(item)), text: item.text, version: 3});
+            }
+        });
+    } else {
+        finish({error: 'Unsupported select2 version'});
+    }
+} catch (e) {
+    finish({error: 'Data source failed: ' + e});
+}
+"""
+
+
+class Select2Picker:
+    """
+    Picks select2 options (test, address and doctor pickers) through the widget's own
+    data source and JS API in one async script, instead of clicking, typing and waiting
+    for the dropdown. The typed UI path is kept as a fallback.
+    HMIS_SELECT2_MODE: "auto" (API, then UI), "api" (API only) or "ui" (UI only).
+    """
+    def __init__(self, driver, ready=None, mode=None, timeout=10):
+        self.driver = driver
+        self.ready = ready or ReadyWait(driver, timeout=20)
+        self.mode = (mode or os.environ.get("HMIS_SELECT2_MODE", "auto")).lower()
+        self.timeout = timeout
+
+    def pick(self, locator, text, ui_fallback=True, timeout=None, required=False):
+        """
+        Select the option matching `text` (exact label first, then substring) in the
+        select2 widget found by `locator`, which may point at the container, the chosen
+        span or the original element. Returns the picked label; if nothing was picked
+        it raises LookupError when `required`, otherwise returns None.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        picked = None
+        if self.mode != "ui":
+            picked = self.pick_via_api(locator, text, timeout)
+        if picked is None and (self.mode == "ui" or (self.mode == "auto" and ui_fallback)):
+            picked = self.pick_via_ui(locator, text, timeout)
+        if picked is None and required:
+            raise LookupError(f"Could not select '{text}' in select2 widget {locator[1]}")
+        return picked
+
+    def pick_via_api(self, locator, text, timeout=None):
+        """
+        Query the widget's data source for `text` and set the best match with the select2 API.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self.ready.first_of(locator, timeout=timeout, visible=False, required=False):
+            return None
+        try:
+            self.driver.set_script_timeout(timeout + 2)
+            result = self.driver.execute_async_script(_PICK_JS, _to_js_locator(locator), text, int(timeout * 1000))
+        except WebDriverException as e:
+            logging.warning(f"select2 API pick of '{text}' failed: {str(e)}")
+            return None
+        if not result or result.get("error"):
+            logging.info(f"select2 API pick of '{text}' not possible: {(result or {}).get('error')}")
+            return None
+        logging.info(f"Selected '{result['text']}' via select2 v{result['version']} API")
+        return result["text"]
+
+    def pick_via_ui(self, locator, text, timeout=None):
+        """
+        Typed fallback: open the dropdown, type `text`, wait for results and click the match.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            self.ready.first_of(locator, timeout=timeout)[0].click()
+            search_field, _ = self.ready.first_of(
+                (By.CSS_SELECTOR, ".select2-container--open .select2-search__field"),
+                (By.CSS_SELECTOR, ".select2-drop-active input.select2-input"),
+                timeout=timeout
+            )
+            search_field.clear()
+            search_field.send_keys(text)
+            self.ready.select2_results(timeout=timeout, required=False)
+            option, _ = self.ready.first_of(
+                (By.XPATH, f"//li[contains(@class, 'select2-results__option') and normalize-space(.)=\"{text}\"]"),
+                (By.XPATH, f"//div[contains(@class, 'select2-result-label') and normalize-space(.)=\"{text}\"]"),
+                (By.XPATH, f"//li[contains(@class, 'select2-results__option') and contains(., \"{text}\")]"),
+                (By.XPATH, f"//div[contains(@class, 'select2-result-label') and contains(., \"{text}\")]"),
+                timeout=timeout
+            )
+            label = option.text.strip()
+            option.click()
+            logging.info(f"Selected '{label}' via select2 dropdown")
+            return label
+        except Exception as e:
+            logging.warning(f"select2 UI pick of '{text}' failed: {str(e)}")
+            return None
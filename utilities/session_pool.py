@@ -0,0 +1,260 @@
+import os
+import time
+import queue
+import logging
+import threading
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import WebDriverException
+from utilities.config_loader import ConfigLoader
+from utilities.login_cache import LoginCache
+from utilities.network_capture import NetworkCapture
+
+
+class SessionPool:
+    """
+    A pool of logged-in Chrome sessions that workflow classes borrow instead of
+    starting their own browser and typing the credentials on every test.
+    """
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, environment="staging", size=1, login_timeout=20, kiosk_printing=False):
+        self.environment = environment
+        self.size = max(1, size)
+        self.kiosk_printing = kiosk_printing
+        self.login_timeout = login_timeout
+        self.config = ConfigLoader.load_credentials(environment)
+        self.base_url = self.config["base_url"]
+        self.username = self.config["username"]
+        self.password = self.config["password"]
+        self.login_cache = LoginCache(environment, self.username, base_url=self.base_url)
+        self._idle = queue.LifoQueue()
+        self._sessions = []
+        self._borrowed = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, environment="staging", kiosk_printing=False):
+        """
+        Return the process-wide pool for an environment, creating it on first use.
+        Workflows that rely on --kiosk-printing get their own pool.
+        The pool size comes from HMIS_POOL_SIZE (default 1).
+        """
+        key = (environment, kiosk_printing)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                size = int(os.environ.get("HMIS_POOL_SIZE", "1"))
+                cls._shared[key] = cls(environment, size=size, kiosk_printing=kiosk_printing)
+            return cls._shared[key]
+
+    def create_driver(self):
+        """
+        Start a Chrome session with the options used across the workflow modules.
+        """
+        chrome_options = webdriver.ChromeOptions()
+        chrome_options.add_argument("--disable-popup-blocking")
+        chrome_options.add_argument("--enable-javascript")
+        chrome_options.add_experimental_option("detach", True)
+        chrome_options.add_experimental_option("excludeSwitches", ["disable-popup-blocking"])
+        chrome_options.add_argument("--disable-web-security")
+        chrome_options.add_argument("--disable-site-isolation-trials")
+        chrome_options.add_argument("--disable-logging")
+        if self.kiosk_printing:
+            # Skip the print preview dialog
+            chrome_options.add_argument("--kiosk-printing")
+        # Network logging for NetworkCapture (HMIS_NETWORK_CAPTURE=1)
+        NetworkCapture.configure(chrome_options)
+        driver = webdriver.Chrome(options=chrome_options)
+        driver.maximize_window()
+        return driver
+
+    def warm(self, count=None):
+        """
+        Pre-start and log in up to `count` sessions (defaults to the pool size).
+        """
+        count = min(count or self.size, self.size)
+        with self._lock:
+            missing = count - len(self._sessions)
+        threads = [threading.Thread(target=self._add_idle_session) for _ in range(max(0, missing))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logging.info(f"Session pool warmed: {self._idle.qsize()} idle session(s)")
+
+    def _add_idle_session(self):
+        driver = self._new_session()
+        if driver is not None:
+            self._idle.put(driver)
+
+    def _new_session(self):
+        with self._lock:
+            if len(self._sessions) >= self.size:
+                return None
+            # Reserve the slot before the slow browser start
+            self._sessions.append(None)
+        try:
+            started = time.time()
+            driver = self.create_driver()
+            self.login(driver)
+            logging.info(f"Started new browser session in {time.time() - started:.1f}s")
+        except Exception:
+            with self._lock:
+                self._sessions.remove(None)
+            raise
+        with self._lock:
+            self._sessions[self._sessions.index(None)] = driver
+        return driver
+
+    def acquire(self, timeout=300):
+        """
+        Borrow a logged-in session. Dead sessions are replaced, and a new browser is
+        started only when the pool has not reached its size yet.
+        """
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._new_session()
+                if driver is None:
+                    driver = self._idle.get(timeout=timeout)
+                else:
+                    with self._lock:
+                        self._borrowed.add(driver)
+                    return driver
+
+            if self.is_alive(driver):
+                with self._lock:
+                    self._borrowed.add(driver)
+                return driver
+            logging.warning("Discarding dead browser session from pool")
+            self._discard(driver)
+
+    def release(self, driver):
+        """
+        Return a borrowed session to the pool, left on its main window. Releasing twice
+        is a no-op.
+        """
+        with self._lock:
+            if driver is None or driver not in self._borrowed:
+                return
+            self._borrowed.discard(driver)
+        if self._close_extra_windows(driver) and self.is_alive(driver):
+            self._idle.put(driver)
+        else:
+            self._discard(driver)
+
+    def _discard(self, driver):
+        with self._lock:
+            if driver in self._sessions:
+                self._sessions.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def is_alive(driver):
+        """
+        Health check: the browser answers and still has a window.
+        """
+        try:
+            return bool(driver.window_handles)
+        except WebDriverException:
+            return False
+
+    @staticmethod
+    def _close_extra_windows(driver):
+        """
+        Close the popups a workflow left open and switch back to the main window, so the
+        next borrower starts on a single window. False if the browser did not answer.
+        """
+        try:
+            handles = driver.window_handles
+            if not handles:
+                return False
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            return True
+        except WebDriverException:
+            return False
+
+    def is_logged_in(self, driver):
+        """
+        Open the base URL and check whether HMIS still shows the login form.
+        """
+        driver.get(self.base_url)
+        return not driver.find_elements(By.NAME, "Username")
+
+    def ensure_logged_in(self, driver):
+        """
+        Navigate to the base URL and log in again only if the session has expired.
+        """
+        if self.is_logged_in(driver):
+            logging.info("Reusing logged-in browser session")
+            return
+        logging.info("Browser session expired, logging in again")
+        self.login(driver)
+
+    def login(self, driver):
+        """
+        Log in from the cached session cookies if they are still valid, otherwise
+        through the HMIS login form (and refresh the cookie cache).
+        """
+        if self.login_cache.restore(driver, self.base_url):
+            return
+        self.ui_login(driver)
+        self.login_cache.save(driver)
+
+    def ui_login(self, driver):
+        """
+        Log in through the HMIS login form and wait for the dashboard.
+        """
+        wait = WebDriverWait(driver, self.login_timeout)
+        driver.get(self.base_url)
+        username_field = wait.until(EC.presence_of_element_located((By.NAME, "Username")))
+        password_field = driver.find_element(By.NAME, "Password")
+        login_btn = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
+        username_field.clear()
+        password_field.clear()
+        username_field.send_keys(self.username)
+        password_field.send_keys(self.password)
+        login_btn.click()
+        wait.until(EC.url_contains("/dashboard"))
+        logging.info("Login successful")
+
+    def close(self):
+        """
+        Quit every browser owned by the pool.
+        """
+        with self._lock:
+            sessions = [driver for driver in self._sessions if driver is not None]
+            self._sessions = []
+            self._borrowed = set()
+        while not self._idle.empty():
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for driver in sessions:
+            try:
+                driver.quit()
+            except Exception as e:
+                logging.warning(f"Error closing pooled browser: {str(e)}")
+        logging.info(f"Closed {len(sessions)} pooled browser session(s)")
+
+    @classmethod
+    def close_shared(cls):
+        """
+        Close every process-wide pool (used when a suite worker shuts down).
+        """
+        with cls._shared_lock:
+            pools = list(cls._shared.values())
+            cls._shared = {}
+        for pool in pools:
+            pool.close()
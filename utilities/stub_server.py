@@ -0,0 +1,744 @@
+import os
+import sys
+# Make the project root importable when run as "python utilities/stub_server.py"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import re
+import json
+import time
+import html
+import random
+import logging
+import argparse
+import secrets
+import threading
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+STUB_PREFIX = "/himsnew/"
+SESSION_COOKIE = "hmis_stub_session"
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# (name, price, needs performedBy) - the first two are the ones the billing workflows pick
+STUB_TESTS = [
+    ("Complete Blood Cell Count", 500, False),
+    ("ABO & Rh Factor", 300, True),
+    ("Lipid Profile", 900, False),
+    ("Liver Function Test", 1100, False),
+    ("X-Ray Chest PA View", 700, True),
+]
+STUB_ADDRESSES = ["Kathmandu", "Kathmandu Metropolitan City", "Lalitpur", "Bhaktapur", "Pokhara"]
+STUB_DOCTORS = ["Dr. Usha Karki", "Dr. Ram Shrestha", "Dr. Sita Thapa"]
+STUB_WARDS = {"General Ward": 6, "Labor Ward": 4, "Special Ward": 3, "Cabin": 2}
+BILL_LIST_PAGE_SIZE = 10
+
+# Shared page behaviour: the side menu, pnotify, jQuery-UI style dialogs and look-alike
+# select2 widgets. The widgets copy select2's DOM (v3 for tests, v4 for address/doctor) so
+# the workflows' XPaths and the typed Select2Picker fallback work unchanged. There is no
+# jQuery here, so the select2 API path, the DataTables pager and the jQuery.active check
+# are not exercised against the stub; posts go through XMLHttpRequest so the XHR side of
+# the ajax-idle wait still sees them.
+_STUB_JS = r"""
+var HMIS_BASE = document.documentElement.getAttribute('data-base');
+
+function hmisPost(path, payload) {
+    return new Promise(function(resolve) {
+        var xhr = new XMLHttpRequest();
+        xhr.open('POST', HMIS_BASE + path);
+        xhr.setRequestHeader('Content-Type', 'application/json');
+        xhr.onloadend = function() {
+            try { resolve(JSON.parse(xhr.responseText)); } catch (e) { resolve({error: 'HTTP ' + xhr.status}); }
+        };
+        xhr.send(JSON.stringify(payload));
+    });
+}
+
+function hmisToggleMenu(link) {
+    link.parentNode.querySelector('.nav-second-level').classList.toggle('in');
+    return false;
+}
+
+function hmisNotify(title, text, type) {
+    var stack = document.getElementById('pnotify-stack');
+    var outer = document.createElement('div');
+    outer.className = 'ui-pnotify';
+    outer.innerHTML = '<div class="ui-pnotify-container brighttheme brighttheme-' + type + '">' +
+        '<div class="ui-pnotify-closer" role="button">&times;</div>' +
+        '<h4 class="ui-pnotify-title">' + title + '</h4><div class="ui-pnotify-text">' + text + '</div></div>';
+    outer.querySelector('.ui-pnotify-closer').onclick = function() { outer.remove(); };
+    stack.appendChild(outer);
+    setTimeout(function() { outer.remove(); }, 8000);
+    return outer;
+}
+
+function hmisAlert(message) {
+    var dialog = document.getElementById('alert-dialog');
+    dialog.querySelector('#lblMessage').textContent = message;
+    dialog.style.display = 'block';
+    document.getElementById('overlay').style.display = 'block';
+    dialog.querySelector('.confirm').onclick = function() {
+        dialog.style.display = 'none';
+        document.getElementById('overlay').style.display = 'none';
+    };
+}
+
+function hmisSelect2(id, options, version, onSelect) {
+    var select = document.getElementById(id);
+    var chosen = document.getElementById(version === 3 ? 'select2-chosen-' + select.getAttribute('data-s2') : 'select2-' + id + '-container');
+    chosen.onclick = function() {
+        closeSelect2();
+        chosen.setAttribute('aria-expanded', 'true');
+        var drop = document.createElement(version === 3 ? 'div' : 'span');
+        drop.id = 'select2-open';
+        var input = document.createElement('input');
+        var list = document.createElement('ul');
+        if (version === 3) {
+            drop.className = 'select2-drop select2-drop-active';
+            input.className = 'select2-input';
+            input.id = 's2id_autogen' + select.getAttribute('data-s2') + '_search';
+            list.className = 'select2-results';
+        } else {
+            drop.className = 'select2-container select2-container--open';
+            drop.innerHTML = '<span class="select2-dropdown"><span class="select2-search"></span></span>';
+            input.className = 'select2-search__field';
+            list.className = 'select2-results__options';
+        }
+        var render = function() {
+            var term = input.value.trim().toLowerCase();
+            list.innerHTML = '';
+            options.filter(function(o) { return o.toLowerCase().indexOf(term) !== -1; }).forEach(function(o) {
+                var li = document.createElement('li');
+                if (version === 3) {
+                    li.className = 'select2-result-selectable';
+                    li.innerHTML = '<div class="select2-result-label"></div>';
+                    li.firstChild.textContent = o;
+                } else {
+                    li.className = 'select2-results__option';
+                    li.textContent = o;
+                }
+                li.onclick = function() {
+                    select.value = o;
+                    chosen.textContent = o;
+                    closeSelect2();
+                    select.dispatchEvent(new Event('change'));
+                    if (onSelect) { onSelect(o); }
+                };
+                list.appendChild(li);
+            });
+            if (!list.children.length) {
+                list.innerHTML = version === 3 ? '<li class="select2-no-results">No matches found</li>' : '<li class="select2-results__option select2-results__message">No results found</li>';
+            }
+        };
+        input.oninput = function() { setTimeout(render, 150); };
+        (version === 3 ? drop : drop.querySelector('.select2-search')).appendChild(input);
+        (version === 3 ? drop : drop.querySelector('.select2-dropdown')).appendChild(list);
+        document.body.appendChild(drop);
+        render();
+        input.focus();
+    };
+}
+
+function closeSelect2() {
+    var open = document.getElementById('select2-open');
+    if (open) { open.remove(); }
+    document.querySelectorAll('[aria-expanded]').forEach(function(e) { e.setAttribute('aria-expanded', 'false'); });
+}
+"""
+
+_PAGE = """<!DOCTYPE html>
+<html data-base="{base}"><head><meta charset="utf-8"><title>{title} | HMIS</title>
+<style>
+body {{ font-family: sans-serif; margin: 0; }} .content {{ padding: 16px; }}
+.ui-pnotify {{ position: fixed; top: 16px; right: 16px; width: 300px; z-index: 50; }}
+.ui-pnotify-container {{ padding: 8px; margin-bottom: 4px; border: 1px solid #888; background: #fff; }}
+.brighttheme-success {{ background: #dff0d8; }} .brighttheme-error {{ background: #f2dede; }}
+.ui-widget-overlay {{ position: fixed; inset: 0; background: rgba(0,0,0,.3); z-index: 20; display: none; }}
+.ui-dialog, .modal {{ position: fixed; top: 80px; left: 30%; width: 40%; background: #fff; border: 1px solid #444; padding: 12px; z-index: 30; display: none; }}
+.select2-drop, .select2-container--open {{ position: absolute; top: 120px; left: 30%; background: #fff; border: 1px solid #444; z-index: 40; padding: 4px; display: block; }}
+.select2-chosen, .select2-selection__rendered {{ display: inline-block; min-width: 200px; border: 1px solid #aaa; padding: 4px; cursor: pointer; }}
+.hidden-select {{ display: none; }} .bed {{ display: inline-block; margin: 4px; border: 1px solid #aaa; }}
+table {{ border-collapse: collapse; }} td, th {{ border: 1px solid #ccc; padding: 2px 6px; }}
+#side-menu {{ float: left; width: 200px; list-style: none; padding: 8px; margin: 0; }} #side-menu ul {{ list-style: none; padding-left: 12px; }}
+.nav-second-level.collapse {{ display: none; }} .nav-second-level.collapse.in {{ display: block; }}
+</style>
+<script src="{base}assets/stub.js"></script></head>
+<body><div id="pnotify-stack"></div><div id="overlay" class="ui-widget-overlay"></div>
+<div id="alert-dialog" class="ui-dialog"><span class="ui-dialog-title">Alert</span><p id="lblMessage"></p><button class="confirm">Okay</button></div>
+{menu}<div class="content">{body}</div></body></html>"""
+
+_LOGIN_BODY = """
+<h3>HMIS Login</h3>{error}
+<form method="post" action="{base}login">
+<input type="text" name="Username" placeholder="Username"><input type="password" name="Password" placeholder="Password">
+<button type="submit" class="btn btn-primary">Login</button>
+</form>"""
+
+# The HMIS side menu as on every logged-in page: the workflows open li#patient_menu first
+_MENU = """
+<ul class="nav metismenu" id="side-menu">
+<li id="patient_menu"><a href="#" onclick="return hmisToggleMenu(this)"><span class="nav-label">Patient</span></a>
+<ul class="nav nav-second-level collapse">
+<li><a href="{base}ipd/register/OPD">OPD Registration</a></li>
+<li><a href="{base}ipd/register/Emergency">Emergency Registration</a></li>
+<li><a href="{base}ipd/register/IPD">IPD Registration</a></li>
+<li><a href="{base}patient/register">Service Registration</a></li>
+<li><a href="{base}bill/createBill?bt=OPD">OPD Billing</a></li>
+<li><a href="{base}bill/createBill?bt=Emergency">Emergency Billing</a></li>
+<li><a href="{base}bill/createBill?bt=IPD">IPD Billing</a></li>
+<li><a href="{base}patient/view_emergency">Emergency Patients</a></li>
+<li><a href="{base}patient/view_ipd">IPD Patients</a></li>
+</ul></li>
+<li id="bill_menu"><a href="#" onclick="return hmisToggleMenu(this)"><span class="nav-label">Bill</span></a>
+<ul class="nav nav-second-level collapse">
+<li><a href="{base}bill/bill_list?list=OPD">OPD Bill List</a></li>
+<li><a href="{base}bill/bill_list?list=Emergency">Emergency Bill List</a></li>
+<li><a href="{base}bill/bill_list?list=IPD">IPD Bill List</a></li>
+</ul></li>
+</ul>"""
+
+_DASHBOARD_BODY = """
+<h3>Dashboard</h3>"""
+
+_REGISTER_BODY = """
+<h3>{kind} Registration</h3>
+<form id="registerForm" onsubmit="return false;">
+<input type="text" name="searchOPDId" placeholder="Search by Patient Id">
+<input type="text" id="mobile-number" name="mobile">
+<select id="designation"><option value="">--</option><option value="Mr.">Mr.</option><option value="Mrs.">Mrs.</option><option value="Ms.">Ms.</option></select>
+<input type="text" id="first-name"><input type="text" id="last-name"><input type="text" id="age">
+<select id="ethnicity"><option value="Others">Others</option></select>
+<select id="current-address" class="hidden-select"><option value=""></option></select>
+<span class="select2 select2-container"><span id="select2-current-address-container" class="select2-selection__rendered" aria-expanded="false">Select Address</span></span>
+<textarea id="diagnosis"></textarea>
+{ipd_fields}
+<button type="button" id="submitNewButton" class="btn btn-success">Save</button>
+</form>
+<div id="afterSave" style="display:none"><button type="button" class="btn btn-info printStikerBtn">Print Sticker</button> <button type="button" class="btn btn-primary">Print Bill</button></div>
+<div id="doctorModal" class="modal"><h4 id="doctorModalLabel">Select Patient Doctor</h4>
+<select id="docLists" class="hidden-select"><option value=""></option></select>
+<span class="select2 select2-container"><span id="select2-docLists-container" class="select2-selection__rendered" aria-expanded="false">Select Doctor</span></span>
+<button type="submit" class="btn btn-primary" id="doctorSubmit">Submit</button></div>
+<script>
+var KIND = {kind_json}, DOCTORS = {doctors_json};
+hmisSelect2('current-address', {addresses_json}, 4);
+hmisSelect2('docLists', DOCTORS, 4);
+var selectDep = document.getElementById('select_dep');
+if (selectDep) {{
+    selectDep.onclick = function() {{ document.getElementById('roomContainer').style.display = 'block'; }};
+    document.querySelectorAll('#roomContainer li[data-room]').forEach(function(li) {{
+        li.onclick = function() {{
+            var beds = document.getElementById('bedContainers');
+            beds.innerHTML = '';
+            for (var i = 1; i <= Number(li.getAttribute('data-beds')); i++) {{
+                var bed = document.createElement('div');
+                bed.className = 'bed panel panel-default';
+                bed.innerHTML = '<div class="panel-heading' + (i % 3 === 1 ? ' occupied' : '') + '" data-id="' + li.getAttribute('data-room') + '-' + i + '">Bed ' + i + '</div>';
+                bed.firstChild.onclick = function() {{ document.getElementById('selectedBed').value = this.getAttribute('data-id'); }};
+                beds.appendChild(bed);
+            }}
+            beds.style.display = 'block';
+        }};
+    }});
+}}
+function printWindow(result) {{
+    var url = KIND === 'IPD' ? HMIS_BASE + 'ipd/deposit_slip/' + result.ipd_id : HMIS_BASE + 'create_stiker/' + result.patient_id;
+    window.open(url, '_blank');
+}}
+function register() {{
+    hmisPost('api/register', {{kind: KIND, first: document.getElementById('first-name').value,
+        last: document.getElementById('last-name').value, searchId: document.querySelector('[name=searchOPDId]').value,
+        bed: (document.getElementById('selectedBed') || {{}}).value, deposit: (document.querySelector('[name=deposit]') || {{}}).value}}).then(function(result) {{
+        hmisNotify('Success', 'Patient registered. Patient Id: ' + result.patient_id, 'success');
+        var after = document.getElementById('afterSave');
+        after.style.display = 'block';
+        after.querySelectorAll('button').forEach(function(b) {{ b.onclick = function() {{ printWindow(result); }}; }});
+        if (KIND === 'IPD') {{ printWindow(result); }}
+        if (KIND === 'Service') {{ window.location = HMIS_BASE + 'bill/createBill?bt=OPD&patientId=' + result.patient_id; }}
+    }});
+}}
+document.getElementById('submitNewButton').onclick = function() {{
+    if (KIND === 'Service') {{ document.getElementById('doctorModal').style.display = 'block'; return; }}
+    register();
+}};
+document.getElementById('doctorSubmit').onclick = function() {{
+    document.getElementById('doctorModal').style.display = 'none';
+    register();
+}};
+</script>"""
+
+_IPD_FIELDS = """
+<button type="button" id="select_dep" class="btn">Select Ward</button>
+<div id="roomContainer" style="display:none"><ul>{wards}</ul></div>
+<div id="bedContainers" style="display:none"></div><input type="hidden" id="selectedBed">
+<input type="text" name="deposit"><input type="text" name="depositBy">"""
+
+_BILLING_BODY = """
+<h3>{kind} Billing</h3>
+<input type="text" id="patientId" value="{patient_id}"><button type="button" id="bill-searchPatient" class="btn">Search</button>
+<div id="patientInfo" style="display:none"><span class="patientName"></span> <span class="ipd-patId"></span></div>
+<input type="hidden" id="testList" data-s2="26">
+<div class="select2-container" id="s2id_testList"><a class="select2-choice"><span class="select2-chosen" id="select2-chosen-26">Select Test</span></a></div>
+<table class="table" id="billItems"><thead><tr><th>Test</th><th>Price</th></tr></thead><tbody></tbody></table>
+<div class="grandTotal">Grand Total: <span class="rounded_grand_total">Rs. 0</span></div>
+<select name="paymentType"><option value="Cash">Cash</option><option value="Credit">Credit</option><option value="Online">Online</option></select>
+<div id="paymentModeContainer"><select name="paymentMode"><option value="Cash">Cash</option><option value="Online">Online</option></select></div>
+<div id="onlineTransactionContainer"><input type="text" name="onlineTransaction"><input type="text" name="paymentCode"></div>
+<input type="text" id="paidamts" name="paidAmount">
+<textarea id="billRemarks" name="billRemarks" placeholder="Bill Remarks"></textarea>
+<button type="button" id="sbmtbtn" class="btn btn-success">Submit</button>
+<div id="afterSave"></div>
+<div id="performedByModal" class="modal"><form id="performedByForm" onsubmit="return false;">
+<span class="select2-chosen">SELF</span>
+<button type="submit" class="btn btn-primary antoclose">Select</button></form></div>
+<script>
+var KIND = {kind_json}, TESTS = {tests_json}, items = [];
+function total() {{ return items.reduce(function(s, t) {{ return s + TESTS[t][0]; }}, 0); }}
+hmisSelect2('testList', Object.keys(TESTS), 3, function(name) {{
+    items.push(name);
+    var row = document.createElement('tr');
+    row.innerHTML = '<td></td><td>' + TESTS[name][0] + '</td>';
+    row.firstChild.textContent = name;
+    document.querySelector('#billItems tbody').appendChild(row);
+    document.querySelector('.rounded_grand_total').textContent = 'Rs. ' + total();
+    if (TESTS[name][1]) {{ document.getElementById('performedByModal').style.display = 'block'; }}
+}});
+document.querySelector('#performedByForm button').onclick = function() {{
+    document.getElementById('performedByModal').style.display = 'none';
+}};
+document.getElementById('bill-searchPatient').onclick = function() {{
+    hmisPost('api/patient', {{patient_id: document.getElementById('patientId').value}}).then(function(result) {{
+        if (result.error) {{ hmisNotify('Error', result.error, 'error'); return; }}
+        document.querySelector('.patientName').textContent = result.name;
+        document.querySelector('.ipd-patId').textContent = result.patient_id;
+        document.getElementById('patientInfo').style.display = 'block';
+        if (KIND === 'Emergency') {{
+            hmisNotify('Recommended Test For Emergency', 'Complete Blood Cell Count', 'info');
+        }}
+        if (result.outstanding) {{ hmisAlert('Patient has outstanding balance of Rs. ' + result.outstanding); }}
+    }});
+}};
+document.getElementById('sbmtbtn').onclick = function() {{
+    hmisPost('api/bill', {{kind: KIND, patient_id: document.getElementById('patientId').value, tests: items,
+        payment_type: document.querySelector('[name=paymentType]').value,
+        paid: document.getElementById('paidamts').value}}).then(function(result) {{
+        if (result.error) {{ hmisNotify('Error', result.error, 'error'); return; }}
+        hmisNotify('Success', 'Bill created successfully', 'success');
+        var after = document.getElementById('afterSave');
+        after.innerHTML = '<a class="btn printBtn" href="#" data-original-title="Bill No : ' + result.bill_no +
+            '<br>Bill Id : <b>' + result.bill_id + '</b>">Print Bill</a>';
+        after.firstChild.onclick = function() {{ window.open(HMIS_BASE + 'bill/invoice/' + result.bill_id, '_blank'); return false; }};
+        window.open(HMIS_BASE + 'bill/invoice/' + result.bill_id, '_blank');
+    }});
+}};
+</script>"""
+
+_BILL_LIST_BODY = """
+<h3>{kind} Bill List</h3>
+<form method="get" action="{base}bill/bill_list">
+<input type="hidden" name="list" value="{kind}">
+<label><input type="checkbox" id="show_nepaliCheck" checked onclick="document.getElementById('englishDates').style.display = this.checked ? 'none' : 'block'"> Nepali date</label>
+<div id="englishDates" style="display:none">
+<input type="text" id="englishFrom" name="fromDate" value="{from_date}"><input type="text" id="englishTo" name="toDate" value="{to_date}">
+</div>
+<button type="submit" id="btnGetMiscPayment" class="btn">Get Bills</button>
+</form>
+<table id="tbl-bill-list" class="table table-striped">
+<thead><tr><th>Bill No</th><th>Patient Id</th><th>Name</th><th>Date</th><th>Total</th><th>Paid</th><th>Credit</th><th>Status</th><th>Bill Id</th><th></th></tr></thead>
+<tbody>{rows}</tbody></table>
+<ul class="pagination"><li id="tbl-bill-list_previous" class="paginate_button previous{prev_disabled}"><a href="{prev_url}">Previous</a></li>
+<li id="tbl-bill-list_next" class="paginate_button next{next_disabled}"><a href="{next_url}">Next</a></li></ul>"""
+
+_BILL_VIEW_BODY = """
+<h3>Bill {bill_no}</h3>
+<p>Patient Id: {patient_id}</p>
+<div class="grandTotal">Grand Total: <span class="rounded_grand_total">Rs. {total}</span></div>
+<p>Already paid: Rs. {paid}</p>
+<input type="text" name="paidAmount" value="{paid}">
+<textarea id="billRemarks" name="billRemarks" placeholder="Bill Remarks"></textarea>
+<button type="button" id="sbmtbtn" class="btn btn-success">Submit</button>
+<script>
+document.getElementById('sbmtbtn').onclick = function() {{
+    hmisPost('api/collect', {{bill_id: {bill_id}, amount: document.querySelector('[name=paidAmount]').value}}).then(function(result) {{
+        hmisNotify(result.error ? 'Error' : 'Success', result.error || 'Bill collected successfully', result.error ? 'error' : 'success');
+    }});
+}};
+</script>"""
+
+
+class StubState:
+    """
+    In-memory patients and bills behind the stub pages. Seeded from `seed` so every
+    run starts from the same bill lists.
+    """
+    def __init__(self, seed=1, bills_per_list=35, today=None):
+        self._lock = threading.Lock()
+        self.today = today or date.today()
+        self.next_patient_id = 2100
+        self.next_ipd_id = 700
+        self.next_bill_id = 5000
+        self.patients = {}
+        self.bills = []
+        rng = random.Random(seed)
+        for kind in ("OPD", "Emergency", "IPD"):
+            for _ in range(bills_per_list):
+                patient_id = self.add_patient(kind, "Seed", f"Patient{rng.randint(1, 999)}")
+                total = rng.choice([300, 500, 800, 1200, 1500])
+                status = rng.choice(["Paid", "Paid", "Credit", "Due"])
+                paid = total if status == "Paid" else (0 if status == "Credit" else total // 2)
+                bill_date = self.today - timedelta(days=rng.randint(0, 10))
+                self.add_bill(kind, patient_id, total, paid, bill_date)
+
+    def add_patient(self, kind, first, last):
+        with self._lock:
+            self.next_patient_id += 1
+            patient_id = self.next_patient_id
+            self.patients[patient_id] = {"patient_id": patient_id, "kind": kind, "name": f"{first} {last}".strip()}
+            return patient_id
+
+    def add_ipd_admission(self, patient_id):
+        with self._lock:
+            self.next_ipd_id += 1
+            self.patients.setdefault(patient_id, {"patient_id": patient_id, "kind": "IPD", "name": "Unknown"})["ipd_id"] = self.next_ipd_id
+            return self.next_ipd_id
+
+    def add_bill(self, kind, patient_id, total, paid, bill_date=None):
+        with self._lock:
+            self.next_bill_id += 1
+            bill = {
+                "bill_id": self.next_bill_id,
+                "bill_no": f"I{self.next_bill_id:08d}",
+                "kind": kind,
+                "patient_id": patient_id,
+                "total": total,
+                "paid": paid,
+                "date": (bill_date or self.today).isoformat()
+            }
+            self.bills.append(bill)
+            return dict(bill)
+
+    def bill(self, bill_id):
+        with self._lock:
+            for bill in self.bills:
+                if bill["bill_id"] == bill_id:
+                    return dict(bill)
+        return None
+
+    def collect(self, bill_id, amount):
+        with self._lock:
+            for bill in self.bills:
+                if bill["bill_id"] == bill_id:
+                    bill["paid"] = min(bill["total"], bill["paid"] + amount)
+                    return True
+        return False
+
+    def outstanding(self, patient_id):
+        with self._lock:
+            return sum(bill["total"] - bill["paid"] for bill in self.bills if bill["patient_id"] == patient_id)
+
+    def bill_list(self, kind, from_date=None, to_date=None):
+        with self._lock:
+            bills = [dict(bill) for bill in self.bills if bill["kind"] == kind]
+        if from_date:
+            bills = [bill for bill in bills if bill["date"] >= from_date]
+        if to_date:
+            bills = [bill for bill in bills if bill["date"] <= to_date]
+        return sorted(bills, key=lambda bill: bill["bill_id"], reverse=True)
+
+    @staticmethod
+    def status(bill):
+        if bill["paid"] >= bill["total"]:
+            return "Paid"
+        return "Credit" if bill["paid"] == 0 else "Due"
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the HMIS pages the workflows touch under /himsnew/, after the server's latency.
+    """
+    server_version = "HMISStub/1.0"
+
+    def log_message(self, format, *args):
+        logging.debug(f"stub {self.address_string()} {format % args}")
+
+    @property
+    def base(self):
+        return f"http://{self.headers.get('Host') or '%s:%d' % self.server.server_address}{STUB_PREFIX}"
+
+    def _session(self):
+        for part in (self.headers.get("Cookie") or "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == SESSION_COOKIE and value in self.server.sessions:
+                return value
+        return None
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        self.server.delay()
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _page(self, title, body, menu=True):
+        self._send(200, _PAGE.format(base=self.base, title=html.escape(title), body=body,
+                                     menu=_MENU.format(base=self.base) if menu else ""))
+
+    def _bad_request(self, message):
+        self._send(400, f"<h1>400 Bad Request</h1><p>{html.escape(message)}</p>")
+
+    def _redirect(self, location, headers=None):
+        self._send(302, "", headers=dict(headers or {}, Location=location))
+
+    def _json(self, payload):
+        self._send(200, json.dumps(payload), "application/json")
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length).decode("utf-8") if length else ""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith(STUB_PREFIX.rstrip("/")):
+            return self._redirect(self.base)
+        route = url.path[len(STUB_PREFIX):].strip("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if route == "assets/stub.js":
+            return self._send(200, _STUB_JS, "application/javascript")
+        if route in ("", "login"):
+            if self._session():
+                return self._redirect(f"{self.base}dashboard")
+            return self._page("Login", _LOGIN_BODY.format(base=self.base, error=""), menu=False)
+        if not self._session():
+            return self._redirect(self.base)
+        if route == "logout":
+            self.server.sessions.discard(self._session())
+            return self._redirect(self.base)
+        if route == "dashboard":
+            return self._page("Dashboard", _DASHBOARD_BODY.format(base=self.base))
+        match = re.fullmatch(r"ipd/register/(OPD|Emergency|IPD)", route)
+        if match or route == "patient/register":
+            return self._register_page(match.group(1) if match else "Service")
+        if route == "bill/createBill":
+            return self._billing_page(query.get("bt", "OPD"), query.get("patientId", ""))
+        if route == "bill/bill_list":
+            return self._bill_list_page(query)
+        if route == "bill/view":
+            bill_id = query.get("billId", "")
+            if not bill_id.isdigit():
+                return self._bad_request(f"Invalid billId '{bill_id}'")
+            return self._bill_view_page(int(bill_id))
+        match = re.fullmatch(r"bill/invoice/(\d+)", route)
+        if match:
+            return self._invoice_page(int(match.group(1)))
+        match = re.fullmatch(r"create_stiker/(\d+)", route)
+        if match:
+            return self._sticker_page(int(match.group(1)))
+        match = re.fullmatch(r"ipd/deposit_slip/(\d+)", route)
+        if match:
+            return self._page("Deposit Slip", f"<h3>Deposit Slip</h3><p>IPD Id: {match.group(1)}</p>")
+        match = re.fullmatch(r"patient/view_(emergency|ipd)", route)
+        if match:
+            return self._patient_list_page("Emergency" if match.group(1) == "emergency" else "IPD")
+        self._send(404, "<h1>404 Page Not Found</h1>")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        route = url.path[len(STUB_PREFIX):].strip("/") if url.path.startswith(STUB_PREFIX) else ""
+        body = self._read_body()
+        if route == "login":
+            form = {key: values[0] for key, values in parse_qs(body).items()}
+            if not form.get("Username") or not form.get("Password"):
+                error = "<p class='alert alert-danger'>Invalid username or password</p>"
+                return self._page("Login", _LOGIN_BODY.format(base=self.base, error=error), menu=False)
+            token = secrets.token_hex(16)
+            self.server.sessions.add(token)
+            return self._redirect(f"{self.base}dashboard", {"Set-Cookie": f"{SESSION_COOKIE}={token}; Path=/"})
+        if not self._session():
+            return self._send(401, json.dumps({"error": "Session expired"}), "application/json")
+        try:
+            payload = json.loads(body or "{}")
+            if not isinstance(payload, dict):
+                raise ValueError(f"expected a JSON object, got {type(payload).__name__}")
+            return self._api(route, payload)
+        except (ValueError, TypeError) as e:
+            return self._send(400, json.dumps({"error": f"Bad request: {str(e)}"}), "application/json")
+
+    def _api(self, route, payload):
+        state = self.server.state
+        if route == "api/register":
+            search_id = str(payload.get("searchId") or "").strip()
+            if payload.get("kind") == "IPD" and search_id.isdigit():
+                patient_id = int(search_id)
+            else:
+                patient_id = state.add_patient(payload.get("kind"), payload.get("first", ""), payload.get("last", ""))
+            result = {"patient_id": patient_id}
+            if payload.get("kind") == "IPD":
+                result["ipd_id"] = state.add_ipd_admission(patient_id)
+            return self._json(result)
+        if route == "api/patient":
+            patient_id = int(payload.get("patient_id") or 0)
+            patient = state.patients.get(patient_id)
+            if not patient:
+                return self._json({"error": f"Patient {patient_id} not found"})
+            return self._json(dict(patient, outstanding=state.outstanding(patient_id)))
+        if route == "api/bill":
+            tests = {name: price for name, price, _ in STUB_TESTS}
+            chosen = [name for name in payload.get("tests", []) if name in tests]
+            if not chosen:
+                return self._json({"error": "Select at least one test"})
+            total = sum(tests[name] for name in chosen)
+            paid = 0 if payload.get("payment_type") == "Credit" else min(total, float(payload.get("paid") or 0))
+            bill = state.add_bill(payload.get("kind"), int(payload.get("patient_id") or 0), total, paid)
+            return self._json(bill)
+        if route == "api/collect":
+            collected = state.collect(int(payload.get("bill_id") or 0), float(payload.get("amount") or 0))
+            return self._json({"ok": True} if collected else {"error": "Bill not found"})
+        self._send(404, json.dumps({"error": "Not found"}), "application/json")
+
+    def _register_page(self, kind):
+        ipd_fields = ""
+        if kind == "IPD":
+            wards = "".join(f'<li data-room="{name}" data-beds="{beds}">{name}</li>' for name, beds in STUB_WARDS.items())
+            ipd_fields = _IPD_FIELDS.format(wards=wards)
+        self._page(f"{kind} Registration", _REGISTER_BODY.format(
+            kind=kind, kind_json=json.dumps(kind), ipd_fields=ipd_fields,
+            addresses_json=json.dumps(STUB_ADDRESSES), doctors_json=json.dumps(STUB_DOCTORS)))
+
+    def _billing_page(self, kind, patient_id):
+        tests = {name: [price, performed_by] for name, price, performed_by in STUB_TESTS}
+        self._page(f"{kind} Billing", _BILLING_BODY.format(
+            kind=kind, kind_json=json.dumps(kind), tests_json=json.dumps(tests), patient_id=html.escape(patient_id)))
+
+    def _bill_list_page(self, query):
+        kind = query.get("list", "OPD")
+        from_date = query.get("fromDate", "")
+        to_date = query.get("toDate", "")
+        page = query.get("page", "") or "1"
+        if not page.isdigit():
+            return self._bad_request(f"Invalid page '{page}'")
+        page = max(1, int(page))
+        bills = self.server.state.bill_list(kind, from_date, to_date)
+        page_count = max(1, -(-len(bills) // BILL_LIST_PAGE_SIZE))
+        rows = []
+        for index, bill in enumerate(bills[(page - 1) * BILL_LIST_PAGE_SIZE:page * BILL_LIST_PAGE_SIZE]):
+            patient = self.server.state.patients.get(bill["patient_id"], {})
+            rows.append(
+                f'<tr class="{"odd" if index % 2 == 0 else "even"}" data-bill-id="{bill["bill_id"]}">'
+                f'<td>{bill["bill_no"]}</td><td>{bill["patient_id"]}</td><td>{html.escape(patient.get("name", ""))}</td>'
+                f'<td>{bill["date"]}</td><td>{bill["total"]}</td><td>{bill["paid"]:g}</td><td>{bill["total"] - bill["paid"]:g}</td>'
+                f'<td>{StubState.status(bill)}</td><td>{bill["bill_id"]}</td>'
+                f'<td><a class="btn btn-xs btn-info" href="{self.base}bill/view?billId={bill["bill_id"]}">View</a></td></tr>')
+        page_url = f"{self.base}bill/bill_list?list={kind}&fromDate={from_date}&toDate={to_date}&page="
+        self._page(f"{kind} Bill List", _BILL_LIST_BODY.format(
+            base=self.base, kind=kind, from_date=from_date, to_date=to_date,
+            rows="".join(rows) or '<tr><td colspan="10" class="dataTables_empty">No data available in table</td></tr>',
+            prev_url=page_url + str(max(1, page - 1)), prev_disabled=" disabled" if page <= 1 else "",
+            next_url=page_url + str(min(page_count, page + 1)), next_disabled=" disabled" if page >= page_count else ""))
+
+    def _bill_view_page(self, bill_id):
+        bill = self.server.state.bill(bill_id)
+        if not bill:
+            return self._send(404, "<h1>Bill not found</h1>")
+        self._page(f"Bill {bill['bill_no']}", _BILL_VIEW_BODY.format(
+            bill_id=bill_id, bill_no=bill["bill_no"], patient_id=bill["patient_id"], total=bill["total"], paid=f"{bill['paid']:g}"))
+
+    def _invoice_page(self, bill_id):
+        bill = self.server.state.bill(bill_id)
+        if not bill:
+            return self._send(404, "<h1>Bill not found</h1>")
+        self._page("Invoice", f'<h3>INVOICE</h3><div><strong>Bill No: {bill["bill_no"]}</strong></div>'
+                              f'<div><strong>Patient Id: {bill["patient_id"]}</strong></div><p>Total: Rs. {bill["total"]}</p>')
+
+    def _sticker_page(self, patient_id):
+        bills = [bill for bill in self.server.state.bills if bill["patient_id"] == patient_id]
+        bill_no = bills[-1]["bill_no"] if bills else "I00000000"
+        self._page("Sticker", f'<div><strong>Patient Id: {patient_id}</strong></div><div><strong>Bill No: {bill_no}</strong></div>')
+
+    def _patient_list_page(self, kind):
+        rows = "".join(
+            f'<tr><td>{patient_id}</td><td>{html.escape(patient["name"])}</td><td>{patient.get("ipd_id", "")}</td></tr>'
+            for patient_id, patient in sorted(self.server.state.patients.items(), reverse=True) if patient["kind"] == kind)
+        self._page(f"{kind} Patients", f'<table class="table"><thead><tr><th>Patient Id</th><th>Name</th><th>IPD Id</th></tr></thead><tbody>{rows}</tbody></table>')
+
+
+class StubHMISServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the HMIS web app for offline, repeatable runs and benchmarks.
+    Every response is delayed by `latency` seconds plus up to `jitter` seconds drawn
+    from a seeded RNG, so the suite's own overhead can be measured against a known server.
+    Point the workflows at it with HMIS_BASE_URL=<server.base_url>.
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=8765, latency=0.0, jitter=0.0, seed=1):
+        super().__init__((host, port), StubRequestHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.state = StubState(seed=seed)
+        self.sessions = set()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{STUB_PREFIX}"
+
+    def delay(self):
+        with self._rng_lock:
+            extra = self._rng.uniform(0, self.jitter) if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    def start(self):
+        """
+        Serve in a background thread and return the base URL.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="hmis-stub", daemon=True)
+        self._thread.start()
+        logging.info(f"HMIS stub server listening on {self.base_url}")
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the HMIS web app.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("-p", "--port", type=int, default=int(os.environ.get("HMIS_STUB_PORT", "8765")), help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=float(os.environ.get("HMIS_STUB_LATENCY", "0")), help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random seconds (0..jitter) added to every response")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the generated bills and the jitter")
+    args = parser.parse_args(argv)
+
+    server = StubHMISServer(args.host, args.port, args.latency, args.jitter, args.seed)
+    logging.info(f"HMIS stub server listening on {server.base_url} (latency {args.latency}s, jitter {args.jitter}s)")
+    logging.info(f"Run the workflows against it with HMIS_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+import os
+import sys
+# Make the project root importable when run as "python utilities/suite_runner.py"
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import re
+import ast
+import json
+import time
+import queue
+import logging
+import argparse
+import unittest
+import importlib.util
+import multiprocessing
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+WORKFLOW_DIRS = ["OPD Management", "EMR Management", "IPD Management"]
+suite_report_dir = os.path.join("reports", "suite_runs")
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class WorkflowTask:
+    """
+    A single unittest.TestCase class discovered in one of the workflow modules.
+    """
+    def __init__(self, module_path, class_name):
+        self.module_path = module_path
+        self.class_name = class_name
+
+    @property
+    def workflow_dir(self):
+        return os.path.basename(os.path.dirname(self.module_path))
+
+    @property
+    def name(self):
+        return f"{self.workflow_dir}/{os.path.basename(self.module_path)}::{self.class_name}"
+
+    def __repr__(self):
+        return f"WorkflowTask({self.name})"
+
+
+class SuiteRunner:
+    """
+    Discover the TestCase classes under the OPD/EMR/IPD workflow folders and run
+    them concurrently, one browser per worker process.
+    """
+    def __init__(self, workers=None, include=None, exclude=None, root=PROJECT_ROOT):
+        self.workers = workers or int(os.environ.get("HMIS_SUITE_WORKERS", min(4, os.cpu_count() or 1)))
+        self.include = re.compile(include) if include else None
+        self.exclude = re.compile(exclude) if exclude else None
+        self.root = root
+
+    @staticmethod
+    def _is_test_case(class_node):
+        """
+        Check whether a class definition derives from unittest.TestCase.
+        """
+        for base in class_node.bases:
+            if isinstance(base, ast.Attribute) and base.attr == "TestCase":
+                return True
+            if isinstance(base, ast.Name) and base.id == "TestCase":
+                return True
+        return False
+
+    def discover(self):
+        """
+        Find TestCase classes by parsing the workflow modules, without importing them.
+        Importing would pull in Selenium and create report folders in the parent process.
+        """
+        tasks = []
+        for workflow_dir in WORKFLOW_DIRS:
+            dir_path = os.path.join(self.root, workflow_dir)
+            if not os.path.isdir(dir_path):
+                logging.warning(f"Workflow directory does not exist: {dir_path}")
+                continue
+            for filename in sorted(os.listdir(dir_path)):
+                if not filename.endswith(".py") or filename.startswith("__"):
+                    continue
+                module_path = os.path.join(dir_path, filename)
+                try:
+                    with open(module_path, "r", encoding="utf-8") as f:
+                        tree = ast.parse(f.read(), filename=module_path)
+                except (SyntaxError, UnicodeDecodeError) as e:
+                    logging.error(f"Could not parse {module_path}: {str(e)}")
+                    continue
+                for node in tree.body:
+                    if isinstance(node, ast.ClassDef) and self._is_test_case(node):
+                        task = WorkflowTask(module_path, node.name)
+                        if self.include and not self.include.search(task.name):
+                            continue
+                        if self.exclude and self.exclude.search(task.name):
+                            continue
+                        tasks.append(task)
+        logging.info(f"Discovered {len(tasks)} workflow test classes")
+        return tasks
+
+    def run(self, tasks=None):
+        """
+        Run the given tasks (or everything discovered) on a pool of worker processes.
+        Returns the list of per-class result dictionaries.
+        """
+        tasks = self.discover() if tasks is None else tasks
+        if not tasks:
+            logging.warning("No workflow test classes to run")
+            return []
+
+        worker_count = max(1, min(self.workers, len(tasks)))
+        # Spawn keeps each worker independent of the parent's state (and matches Windows behaviour)
+        context = multiprocessing.get_context("spawn")
+        task_queue = context.Queue()
+        result_queue = context.Queue()
+        for task in tasks:
+            task_queue.put((task.module_path, task.class_name))
+        for _ in range(worker_count):
+            task_queue.put(None)
+
+        logging.info(f"Running {len(tasks)} workflow classes on {worker_count} workers")
+        started = time.time()
+        workers = [
+            context.Process(target=_worker_main, args=(worker_id, task_queue, result_queue, self.root), daemon=False)
+            for worker_id in range(1, worker_count + 1)
+        ]
+        for worker in workers:
+            worker.start()
+
+        results = []
+        while len(results) < len(tasks):
+            try:
+                results.append(result_queue.get(timeout=5))
+                last = results[-1]
+                logging.info(f"[{len(results)}/{len(tasks)}] {last['task']} -> {last['status']} in {last['duration']:.1f}s (worker {last['worker']})")
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    logging.error("All workers exited before every workflow reported a result")
+                    break
+
+        for worker in workers:
+            worker.join()
+
+        finished = {result["task"] for result in results}
+        for task in tasks:
+            if task.name not in finished:
+                results.append(self._result(task.name, 0, "crashed", 0.0, error="Worker exited without reporting"))
+
+        self._write_summary(results, time.time() - started)
+        return results
+
+    @staticmethod
+    def _result(task_name, worker_id, status, duration, tests_run=0, failures=0, errors=0, skipped=0, error=None):
+        return {
+            "task": task_name,
+            "worker": worker_id,
+            "status": status,
+            "duration": duration,
+            "tests_run": tests_run,
+            "failures": failures,
+            "errors": errors,
+            "skipped": skipped,
+            "error": error
+        }
+
+    @staticmethod
+    def _write_summary(results, wall_time):
+        """
+        Log a summary table and save the results to a JSON file under reports/suite_runs.
+        """
+        os.makedirs(suite_report_dir, exist_ok=True)
+        busy_time = sum(result["duration"] for result in results)
+        logging.info("=" * 80)
+        for result in sorted(results, key=lambda r: r["task"]):
+            logging.info(f"{result['status']:<8} {result['duration']:>7.1f}s  {result['task']}")
+        logging.info("=" * 80)
+        logging.info(f"Wall-clock time: {wall_time:.1f}s, summed workflow time: {busy_time:.1f}s")
+
+        summary_file = os.path.join(suite_report_dir, f"suite_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            with open(summary_file, "w", encoding="utf-8") as f:
+                json.dump({"wall_time": wall_time, "busy_time": busy_time, "results": results}, f, indent=4)
+            logging.info(f"Suite summary saved to {summary_file}")
+        except Exception as e:
+            logging.error(f"Error saving suite summary to {summary_file}: {str(e)}")
+
+
+def _load_module(module_path):
+    """
+    Import a workflow module from its file path (the folder names contain spaces).
+    """
+    module_name = "hmis_workflow_" + re.sub(r'\W', '_', os.path.relpath(module_path, PROJECT_ROOT))[:-3]
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_task(worker_id, module_path, class_name):
+    """
+    Run one TestCase class inside a worker process and report its outcome. Other runners
+    (bill shards, the patient pipeline) call this from their own worker loops.
+    """
+    task_name = WorkflowTask(module_path, class_name).name
+    started = time.time()
+    test_class = None
+    try:
+        import xmlrunner
+        module = _load_module(module_path)
+        test_class = getattr(module, class_name)
+        output_dir = getattr(module, "report_dir", suite_report_dir)
+        runner = xmlrunner.XMLTestRunner(output=output_dir, verbosity=1, outsuffix=f"_{time.strftime('%Y%m%d_%H%M%S')}_w{worker_id}")
+        suite = unittest.TestLoader().loadTestsFromTestCase(test_class)
+        result = runner.run(suite)
+        status = "passed" if result.wasSuccessful() else "failed"
+        return SuiteRunner._result(
+            task_name, worker_id, status, time.time() - started,
+            tests_run=result.testsRun, failures=len(result.failures),
+            errors=len(result.errors), skipped=len(result.skipped)
+        )
+    except Exception as e:
+        logging.error(f"Workflow {task_name} could not be run: {str(e)}")
+        return SuiteRunner._result(task_name, worker_id, "error", time.time() - started, error=str(e))
+    finally:
+        # Hand the browser back even if setUpClass failed before tearDownClass could release it
+        driver = getattr(test_class, "driver", None) if test_class is not None else None
+        session_pool = getattr(test_class, "session_pool", None) if test_class is not None else None
+        if driver is not None and session_pool is not None:
+            session_pool.release(driver)
+
+
+def worker_setup(root):
+    """
+    Prepare a spawned worker process to import and run the workflow modules.
+    """
+    os.chdir(root)
+    if root not in sys.path:
+        sys.path.append(root)
+
+
+def worker_teardown():
+    """
+    Release what the workflows run in this worker kept open; call once when the worker stops.
+    """
+    # The worker's browser stays logged in between workflow classes and is closed once here
+    if "utilities.session_pool" in sys.modules:
+        sys.modules["utilities.session_pool"].SessionPool.close_shared()
+    # atexit does not run in multiprocessing workers, so persist locator stats explicitly
+    if "utilities.locator_registry" in sys.modules:
+        sys.modules["utilities.locator_registry"].LocatorRegistry.shared().save()
+    if "utilities.artifact_journal" in sys.modules:
+        sys.modules["utilities.artifact_journal"].ArtifactJournal.shared().close()
+
+
+def _worker_main(worker_id, task_queue, result_queue, root):
+    """
+    Worker process loop: take workflow classes from the queue until the sentinel arrives.
+    """
+    worker_setup(root)
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            module_path, class_name = task
+            result_queue.put(run_task(worker_id, module_path, class_name))
+    finally:
+        worker_teardown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the OPD/EMR/IPD workflow suites concurrently.")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes (one browser each)")
+    parser.add_argument("-k", "--include", default=None, help="Only run workflows whose 'Folder/File.py::Class' name matches this regex")
+    parser.add_argument("-x", "--exclude", default=None, help="Skip workflows whose name matches this regex")
+    parser.add_argument("--list", action="store_true", help="List discovered workflows and exit")
+    parser.add_argument("--full-rescan", action="store_true", help="Ignore the bill list watermarks and rescan every bill")
+    args = parser.parse_args(argv)
+    if args.full_rescan:
+        # Spawned workers inherit the environment, not the parent's argv
+        os.environ["HMIS_FULL_RESCAN"] = "1"
+
+    runner = SuiteRunner(workers=args.workers, include=args.include, exclude=args.exclude)
+    if args.list:
+        for task in runner.discover():
+            print(task.name)
+        return 0
+
+    os.chdir(PROJECT_ROOT)
+    results = runner.run()
+    return 0 if results and all(result["status"] == "passed" for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
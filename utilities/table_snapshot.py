@@ -0,0 +1,173 @@
+import re
+import logging
+from collections import namedtuple
+from selenium.webdriver.common.by import By
+from utilities.wait_conditions import _to_js_locator
+
+# Reads a whole table in one round-trip: the table is either passed as an element or
+# looked up by locator. Every <tbody> row comes back with its cell texts, class and
+# data-* attributes, and the links/buttons in it (for the View/Collect actions).
+_SNAPSHOT_JS = """
+var table = arguments[0], locator = arguments[1];
+if (!table && locator) {
+    try {
+        if (locator[0] === 'xpath') {
+            table = document.evaluate(locator[1], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        } else {
+            table = document.querySelector(locator[1]);
+        }
+    } catch (e) {
+        table = null;
+    }
+}
+if (!table) { return null; }
+function text(node) { return (node.innerText || node.textContent || '').replace(/\\s+/g, ' ').trim(); }
+var rows = [], bodies = table.tBodies;
+for (var b = 0; b < bodies.length; b++) {
+    for (var r = 0; r < bodies[b].rows.length; r++) {
+        var row = bodies[b].rows[r];
+        var cells = [], attrs = {}, controls = [];
+        for (var c = 0; c < row.cells.length; c++) { cells.push(text(row.cells[c])); }
+        for (var a = 0; a < row.attributes.length; a++) {
+            if (row.attributes[a].name.indexOf('data-') === 0) { attrs[row.attributes[a].name] = row.attributes[a].value; }
+        }
+        var nodes = row.querySelectorAll('a, button');
+        for (var n = 0; n < nodes.length; n++) {
+            controls.push({
+                tag: nodes[n].tagName.toLowerCase(),
+                text: text(nodes[n]),
+                href: nodes[n].href || nodes[n].getAttribute('href') || '',
+                cls: nodes[n].className || ''
+            });
+        }
+        rows.push({body: b, position: r, cls: row.className || '', attrs: attrs, cells: cells, controls: controls});
+    }
+}
+return rows;
+"""
+
+# Clicks one control of one row by position, as found by the snapshot
+_CLICK_JS = """
+var table = arguments[0], body = arguments[1], position = arguments[2], control = arguments[3];
+var tr = table.tBodies[body] && table.tBodies[body].rows[position];
+var node = tr ? tr.querySelectorAll('a, button')[control] : null;
+if (!node) { return false; }
+node.click();
+return true;
+"""
+
+
+class RowControl(namedtuple("RowControl", "index tag text href cls")):
+    """
+    A link or button inside a table row.
+    """
+    __slots__ = ()
+
+    def matches(self, text=None, href=None, cls=None):
+        """
+        Case-insensitive substring match on any of the given text, href or class fragments.
+        """
+        return (
+            (text is not None and text.lower() in self.text.lower())
+            or (href is not None and href.lower() in self.href.lower())
+            or (cls is not None and cls.lower() in self.cls.lower())
+        )
+
+
+class TableRow(namedtuple("TableRow", "index body position cls attrs cells controls")):
+    """
+    One <tbody> row of a table snapshot. `index` counts rows across all bodies;
+    `body`/`position` locate it again for clicks.
+    """
+    __slots__ = ()
+
+    def cell(self, index, default=""):
+        return self.cells[index] if index < len(self.cells) else default
+
+    def attr(self, name, default=None):
+        return self.attrs.get(name, default)
+
+    def control(self, text=None, href=None, cls=None, tag=None):
+        """
+        First link/button matching any of the fragments (see RowControl.matches), or None.
+        """
+        for control in self.controls:
+            if tag is not None and control.tag != tag:
+                continue
+            if control.matches(text=text, href=href, cls=cls):
+                return control
+        return None
+
+
+class BillRow(namedtuple("BillRow", "index bill_no patient_id bill_date amount status bill_id view_href row")):
+    """
+    A bill list row (bill no, patient id, name, date, ..., credit/due amount, status, bill id, View).
+    """
+    __slots__ = ()
+
+    # Column positions in the HMIS bill list table
+    BILL_NO, PATIENT_ID, DATE, AMOUNT, STATUS, BILL_ID = 0, 1, 3, 6, 7, 8
+
+    @classmethod
+    def from_row(cls, row):
+        view = row.control(text="View", tag="a")
+        view_href = view.href if view is not None else ""
+        # Bill ID from the 9th column, then the row's data attribute, then the View link
+        bill_id = row.cell(cls.BILL_ID) or row.attr("data-bill-id") or ""
+        if not bill_id and view_href:
+            match = re.search(r'billId=(\d+)', view_href)
+            bill_id = match.group(1) if match else ""
+        return cls(
+            row.index, row.cell(cls.BILL_NO), row.cell(cls.PATIENT_ID), row.cell(cls.DATE), row.cell(cls.AMOUNT),
+            row.cell(cls.STATUS), bill_id or "unknown", view_href, row
+        )
+
+    @property
+    def view(self):
+        return self.row.control(text="View", tag="a")
+
+    def to_dict(self):
+        """
+        The bill fields without the underlying row, e.g. for a batch checkpoint.
+        """
+        return {field: getattr(self, field) for field in self._fields if field != "row"}
+
+
+class TableSnapshot:
+    """
+    Reads a table (e.g. the bill list) with a single execute_script instead of one
+    find_elements/.text/get_attribute round-trip per cell, and returns typed row records.
+    """
+    def __init__(self, driver, locator=(By.XPATH, "//table[contains(@class, 'table')]")):
+        self.driver = driver
+        self.locator = locator
+
+    def rows(self, table=None):
+        """
+        All body rows of `table` (a WebElement, or the table found by the locator) as TableRow records.
+        Returns an empty list when there is no table.
+        """
+        raw_rows = self.driver.execute_script(_SNAPSHOT_JS, table, None if table is not None else _to_js_locator(self.locator))
+        if raw_rows is None:
+            logging.warning(f"No table found for snapshot at {self.locator[1]}")
+            return []
+        return [
+            TableRow(
+                index, raw["body"], raw["position"], raw["cls"], raw["attrs"], tuple(raw["cells"]),
+                tuple(RowControl(position, c["tag"], c["text"], c["href"], c["cls"]) for position, c in enumerate(raw["controls"]))
+            )
+            for index, raw in enumerate(raw_rows)
+        ]
+
+    def bill_rows(self, table=None, min_cells=8):
+        """
+        Bill list rows with at least `min_cells` cells as BillRow records.
+        """
+        return [BillRow.from_row(row) for row in self.rows(table) if len(row.cells) >= min_cells]
+
+    def click(self, table, row, control):
+        """
+        Click `control` of `row` (from a snapshot of `table`) with a JS click. Returns False if it is gone.
+        """
+        row = row.row if isinstance(row, BillRow) else row
+        return bool(self.driver.execute_script(_CLICK_JS, table, row.body, row.position, control.index))
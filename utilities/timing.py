@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Records nested timing spans for one test (workflow phases, waits, screenshots) and
+    writes them as Chrome trace-event JSON, viewable in chrome://tracing or Perfetto,
+    plus a per-span summary table.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, category="step", **args):
+        """
+        Time the enclosed block as a span nested under whichever span is open on this thread.
+        """
+        stack = self._stack()
+        frame = {"children": 0.0}
+        stack.append(frame)
+        started = time.time()
+        try:
+            yield
+        except Exception as e:
+            args["error"] = f"{type(e).__name__}: {str(e)[:200]}"
+            raise
+        finally:
+            duration = time.time() - started
+            stack.pop()
+            if stack:
+                stack[-1]["children"] += duration
+            self._add(name, category, started, duration, max(0.0, duration - frame["children"]), len(stack), args)
+
+    def record(self, name, started, duration, category="wait", **args):
+        """
+        Add a span that was timed elsewhere (e.g. by ReadyWait) under the currently open span.
+        """
+        stack = self._stack()
+        if stack:
+            stack[-1]["children"] += duration
+        self._add(name, category, started, duration, duration, len(stack), args)
+
+    def _add(self, name, category, started, duration, self_time, depth, args):
+        with self._lock:
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int(started * 1e6),
+                "dur": int(duration * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": dict(args, self_time_ms=round(self_time * 1000, 1), depth=depth)
+            })
+
+    def summary(self):
+        """
+        Aggregate spans by name: calls, total and self time, and the slowest call.
+        Rows are ordered by self time, i.e. where the time actually went.
+        """
+        rows = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            row = rows.setdefault(event["name"], {"name": event["name"], "category": event["cat"], "calls": 0, "total": 0.0, "self": 0.0, "max": 0.0})
+            duration = event["dur"] / 1e6
+            row["calls"] += 1
+            row["total"] += duration
+            row["self"] += event["args"]["self_time_ms"] / 1000
+            row["max"] = max(row["max"], duration)
+        return sorted(rows.values(), key=lambda row: row["self"], reverse=True)
+
+    def log_summary(self, limit=25):
+        """
+        Log the summary table for this test.
+        """
+        wall_time = time.time() - self.started
+        logging.info("=" * 96)
+        logging.info(f"Timing summary for {self.name} ({wall_time:.2f}s wall clock)")
+        logging.info(f"{'span':<48} {'category':<10} {'calls':>5} {'total s':>8} {'self s':>8} {'max s':>7} {'self %':>6}")
+        for row in self.summary()[:limit]:
+            share = 100 * row["self"] / wall_time if wall_time else 0.0
+            logging.info(f"{row['name'][:48]:<48} {row['category']:<10} {row['calls']:>5} {row['total']:>8.2f} {row['self']:>8.2f} {row['max']:>7.2f} {share:>5.1f}%")
+        logging.info("=" * 96)
+
+    def to_chrome_trace(self):
+        with self._lock:
+            events = list(self.events)
+        metadata = {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": threading.get_ident(), "args": {"name": self.name}}
+        return {
+            "traceEvents": [metadata] + sorted(events, key=lambda event: event["ts"]),
+            "displayTimeUnit": "ms",
+            "otherData": {"test": self.name, "summary": self.summary()}
+        }
+
+    def save(self, trace_dir):
+        """
+        Write the Chrome trace JSON to `trace_dir` and return its path.
+        """
+        os.makedirs(trace_dir, exist_ok=True)
+        safe_name = "".join(char if char.isalnum() or char in "._-" else "_" for char in self.name.split(".")[-1])
+        trace_file = os.path.join(trace_dir, f"{safe_name}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started))}.json")
+        try:
+            with open(trace_file, "w", encoding="utf-8") as f:
+                json.dump(self.to_chrome_trace(), f)
+            logging.info(f"Timing trace saved to {trace_file}")
+        except Exception as e:
+            logging.error(f"Error saving timing trace to {trace_file}: {str(e)}")
+        return trace_file
+
+
+def traced(name=None, category="step"):
+    """
+    Method decorator: run the method inside a span of `self.tracer` (if the test has one).
+    The span name defaults to the method name without leading underscores.
+    """
+    def decorator(func):
+        span_name = name or func.__name__.lstrip("_")
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            tracer = getattr(self, "tracer", None)
+            if tracer is None:
+                return func(self, *args, **kwargs)
+            with tracer.span(span_name, category):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,265 @@
+import time
+import logging
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+# Counts XMLHttpRequests that are still in flight; installed once per page on first use
+_XHR_TRACKER_JS = """
+if (!window.__hmisXhrTracked) {
+    window.__hmisXhrTracked = true;
+    window.__hmisPendingXhr = 0;
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function() {
+        window.__hmisPendingXhr++;
+        this.addEventListener('loadend', function() { window.__hmisPendingXhr = Math.max(0, window.__hmisPendingXhr - 1); });
+        return send.apply(this, arguments);
+    };
+}
+var jq = window.jQuery ? window.jQuery.active : 0;
+return document.readyState === 'complete' && jq === 0 && window.__hmisPendingXhr === 0;
+"""
+
+_SELECT2_RESULTS_JS = """
+var drop = document.querySelector('.select2-drop-active, .select2-container--open .select2-dropdown');
+if (!drop) { return false; }
+if (drop.querySelector('.select2-searching, .select2-active, .loading-results')) { return false; }
+var results = drop.querySelectorAll('.select2-result-selectable, .select2-no-results, .select2-results__option');
+return results.length > 0;
+"""
+
+_PNOTIFY_JS = """
+var theme = arguments[0];
+var notices = document.querySelectorAll('.ui-pnotify-container');
+for (var i = 0; i < notices.length; i++) {
+    var notice = notices[i];
+    if (theme && notice.className.indexOf(theme) === -1) { continue; }
+    if (notice.offsetParent !== null || notice.getClientRects().length > 0) { return notice; }
+}
+return null;
+"""
+
+# Checks every candidate locator in one round-trip; returns [index, element] for the first match
+_FIRST_OF_JS = """
+var candidates = arguments[0];
+var visibleOnly = arguments[1];
+for (var i = 0; i < candidates.length; i++) {
+    var kind = candidates[i][0], value = candidates[i][1];
+    var nodes = [];
+    try {
+        if (kind === 'xpath') {
+            var found = document.evaluate(value, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (var n = 0; n < found.snapshotLength; n++) { nodes.push(found.snapshotItem(n)); }
+        } else {
+            nodes = document.querySelectorAll(value);
+        }
+    } catch (e) {
+        continue;
+    }
+    for (var j = 0; j < nodes.length; j++) {
+        var node = nodes[j];
+        if (!visibleOnly || node.offsetParent !== null || node.getClientRects().length > 0) {
+            return [i, node];
+        }
+    }
+}
+return null;
+"""
+
+
+def _to_js_locator(locator):
+    """
+    Translate a Selenium (By, value) locator into an ('xpath' | 'css', value) pair for _FIRST_OF_JS.
+    """
+    by, value = locator
+    if by == By.XPATH:
+        return ["xpath", value]
+    if by == By.CSS_SELECTOR:
+        return ["css", value]
+    if by == By.ID:
+        return ["css", f'[id="{value}"]']
+    if by == By.NAME:
+        return ["css", f'[name="{value}"]']
+    if by == By.CLASS_NAME:
+        return ["css", f".{value}"]
+    if by == By.TAG_NAME:
+        return ["css", value]
+    if by == By.LINK_TEXT:
+        return ["xpath", f'//a[normalize-space(.)="{value}"]']
+    if by == By.PARTIAL_LINK_TEXT:
+        return ["xpath", f'//a[contains(., "{value}")]']
+    raise ValueError(f"Unsupported locator strategy: {by}")
+
+
+def dom_ready():
+    """
+    Condition: the document has finished loading.
+    """
+    def _predicate(driver):
+        return driver.execute_script("return document.readyState") == "complete"
+    return _predicate
+
+
+def no_pending_ajax():
+    """
+    Condition: the document is loaded and no jQuery or XHR request is in flight.
+    """
+    def _predicate(driver):
+        return bool(driver.execute_script(_XHR_TRACKER_JS))
+    return _predicate
+
+
+def select2_results_rendered():
+    """
+    Condition: the open select2 dropdown has finished searching and shows results
+    (or its "no results" row).
+    """
+    def _predicate(driver):
+        return bool(driver.execute_script(_SELECT2_RESULTS_JS))
+    return _predicate
+
+
+def pnotify_shown(theme=None):
+    """
+    Condition: a pnotify notification is visible, optionally of a given theme class
+    such as 'brighttheme-success'. Returns the notification container element.
+    """
+    def _predicate(driver):
+        return driver.execute_script(_PNOTIFY_JS, theme) or False
+    return _predicate
+
+
+def new_window_opened(known_handles):
+    """
+    Condition: a window that is not in `known_handles` has opened. Returns its handle.
+    """
+    known_handles = set(known_handles)
+
+    def _predicate(driver):
+        new_handles = [handle for handle in driver.window_handles if handle not in known_handles]
+        return new_handles[0] if new_handles else False
+    return _predicate
+
+
+def first_of(*locators, visible=True):
+    """
+    Condition: any of the candidate locators matches. All candidates are checked in a
+    single execute_script per poll, in the given order, so the first listed locator
+    wins when several match. Returns (element, locator).
+    """
+    js_locators = [_to_js_locator(locator) for locator in locators]
+
+    def _predicate(driver):
+        match = driver.execute_script(_FIRST_OF_JS, js_locators, visible)
+        if not match:
+            return False
+        index, element = match
+        return element, locators[int(index)]
+    return _predicate
+
+
+def _condition_name(condition):
+    """
+    Readable span name for a wait condition, e.g. "visibility_of_element_located(id=patientId)".
+    """
+    name = getattr(condition, "__qualname__", type(condition).__name__).split(".<locals>")[0]
+    for cell in getattr(condition, "__closure__", None) or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            continue
+        if isinstance(value, tuple) and len(value) == 2 and all(isinstance(part, str) for part in value):
+            return f"{name}({value[0]}={value[1][:60]})"
+    return name
+
+
+class TracedWait(WebDriverWait):
+    """
+    WebDriverWait that records every until/until_not call as a "wait" span on `tracer`
+    (a utilities.timing.Tracer), when one is set.
+    """
+    def __init__(self, driver, timeout, poll_frequency=0.5, ignored_exceptions=None, tracer=None):
+        super().__init__(driver, timeout, poll_frequency=poll_frequency, ignored_exceptions=ignored_exceptions)
+        self.tracer = tracer
+
+    def until(self, method, message=""):
+        if self.tracer is None:
+            return super().until(method, message)
+        with self.tracer.span(_condition_name(method), "wait"):
+            return super().until(method, message)
+
+    def until_not(self, method, message=""):
+        if self.tracer is None:
+            return super().until_not(method, message)
+        with self.tracer.span(f"not {_condition_name(method)}", "wait"):
+            return super().until_not(method, message)
+
+
+class ReadyWait:
+    """
+    Waits on named readiness conditions instead of fixed time.sleep calls. Each wait
+    returns as soon as its condition holds and records how long it actually took
+    (also as a span on `tracer`, when one is set).
+    """
+    def __init__(self, driver, timeout=20, poll_frequency=0.1, tracer=None):
+        self.driver = driver
+        self.timeout = timeout
+        self.poll_frequency = poll_frequency
+        self.tracer = tracer
+        self.timings = []
+
+    def until(self, condition, name, timeout=None, required=True):
+        """
+        Wait for `condition`. If `required` is False a timeout returns None instead of raising.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.time()
+        try:
+            value = WebDriverWait(self.driver, timeout, poll_frequency=self.poll_frequency,
+                                  ignored_exceptions=[WebDriverException]).until(condition)
+            self._record(name, started, time.time() - started, True)
+            return value
+        except TimeoutException:
+            self._record(name, started, time.time() - started, False)
+            if required:
+                raise
+            return None
+
+    def _record(self, name, started, elapsed, satisfied):
+        self.timings.append({"condition": name, "waited": elapsed, "satisfied": satisfied})
+        if self.tracer is not None:
+            self.tracer.record(name, started, elapsed, "wait", satisfied=satisfied)
+        if satisfied:
+            logging.info(f"Waited {elapsed:.2f}s for {name}")
+        else:
+            logging.info(f"Gave up on {name} after {elapsed:.2f}s")
+
+    def dom_ready(self, timeout=None, required=True):
+        return self.until(dom_ready(), "dom_ready", timeout, required)
+
+    def ajax_idle(self, timeout=None, required=True):
+        return self.until(no_pending_ajax(), "ajax_idle", timeout, required)
+
+    def select2_results(self, timeout=None, required=True):
+        return self.until(select2_results_rendered(), "select2_results", timeout, required)
+
+    def pnotify(self, theme=None, timeout=None, required=True):
+        return self.until(pnotify_shown(theme), f"pnotify[{theme or 'any'}]", timeout, required)
+
+    def new_window(self, known_handles, timeout=None, required=True):
+        return self.until(new_window_opened(known_handles), "new_window", timeout, required)
+
+    def first_of(self, *locators, timeout=None, visible=True, required=True):
+        """
+        Wait until one of `locators` matches and return (element, winning locator).
+        """
+        match = self.until(first_of(*locators, visible=visible), f"first_of[{len(locators)}]", timeout, required)
+        if match:
+            logging.info(f"Locator matched: {match[1][1]} (candidate {locators.index(match[1]) + 1} of {len(locators)})")
+        return match
+
+    def total_waited(self):
+        """
+        Total time spent in recorded waits.
+        """
+        return sum(timing["waited"] for timing in self.timings)